@@ -0,0 +1,103 @@
+"""
+Herramientas de administración por línea de comandos.
+
+    python admin.py export [--user ID] [--format jsonl|csv] [-o archivo]
+    python admin.py import archivo [--user ID] [--format jsonl|csv]
+    python admin.py snapshot destino.db
+
+Usan el mismo backend que el bot (STORAGE_BACKEND, DB_PATH). Sin --user,
+export incluye a todos los usuarios e import asigna cada registro a su
+user_id. snapshot copia la DB completa en caliente (API de backup de SQLite).
+"""
+import argparse
+import os
+import sys
+import time
+
+import database
+import storage
+import transfer
+
+
+def _report(action: str, count: int, start: float):
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"{action}: {count} registros en {elapsed:.2f} s ({rate:,.0f}/s)", file=sys.stderr)
+
+
+def cmd_export(args) -> int:
+    st = storage.configure(storage.from_env())
+    start = time.perf_counter()
+    if args.output:
+        with open(args.output, "wb") as out:
+            count = transfer.export(st, out, args.format, args.user)
+    else:
+        count = transfer.export(st, sys.stdout.buffer, args.format, args.user)
+        sys.stdout.buffer.flush()
+    _report("export", count, start)
+    return 0
+
+
+def cmd_import(args) -> int:
+    st = storage.configure(storage.from_env())
+    fmt = args.format or transfer.detect_format(args.file)
+    start = time.perf_counter()
+    with open(args.file, "rb") as inp:
+        try:
+            # primero se valida todo el archivo: un error no deja una importación a medias
+            transfer.check(inp, fmt)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+        inp.seek(0)
+        counts = transfer.load(st, inp, fmt, args.user)
+    _report("import", counts["tasks"] + counts["reminders"], start)
+    print(f"{counts['tasks']} tareas, {counts['reminders']} recordatorios", file=sys.stderr)
+    return 0
+
+
+def cmd_snapshot(args) -> int:
+    if not os.path.exists(database.DB_PATH):
+        print(f"ERROR: no existe {database.DB_PATH}", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    database.snapshot(args.dest, pages=args.pages)
+    size = os.path.getsize(args.dest)
+    print(f"snapshot: {args.dest} ({size / 1e6:.1f} MB) en {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="admin.py", description="Administración de RecordedTaskBot")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="exportar tareas y recordatorios (JSONL o CSV)")
+    p.add_argument("--user", help="solo este user_id (por defecto, todos)")
+    p.add_argument("--format", choices=transfer.FORMATS, default="jsonl")
+    p.add_argument("-o", "--output", help="archivo de salida (por defecto, stdout)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="importar un archivo de export")
+    p.add_argument("file")
+    p.add_argument("--user", help="asignar todo a este user_id (por defecto, el de cada registro)")
+    p.add_argument("--format", choices=transfer.FORMATS, help="por defecto, según la extensión")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("snapshot", help="copia en caliente de toda la DB SQLite")
+    p.add_argument("dest")
+    p.add_argument("--pages", type=int, default=-1,
+                   help="páginas por paso (-1 = un solo paso, no se reinicia con escrituras concurrentes)")
+    p.set_defaults(func=cmd_snapshot)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
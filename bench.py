@@ -0,0 +1,1102 @@
+"""
+Benchmarks y prueba de carga del bot, sin red.
+
+Los handlers reales de bot.py corren dentro de una Application de PTB cuyo
+Bot habla con FakeRequest (responde a la Bot API en memoria) y cuyos jobs
+guarda FakeJobQueue (el benchmark los dispara a mano, p. ej. _reminder_callback).
+Cada escenario usa una DB nueva en un directorio temporal y devuelve métricas;
+el resultado se guarda en JSON y se puede comparar con un baseline:
+
+    python bench.py --list
+    python bench.py                            # todos los escenarios
+    python bench.py mixed reminders --quick    # algunos, con tamaños reducidos
+    python bench.py --quick --out bench.json --baseline baseline.json
+
+Nombres de métricas: *_per_s más es mejor; *_ms, *_s, *_mb y *_bytes menos es
+mejor; el resto son informativas y no se comparan con el baseline.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import telegram
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest
+
+import bot
+import database
+import digest
+import metrics
+import ratelimit
+import reminders
+import sender
+import storage
+import task_manager
+import throttle
+import timezones
+import transfer
+import webhook
+
+BOT_TOKEN = "123456:bench"
+BOT_ID = 123456
+# ids de usuario de la carga (lejos de ids reales)
+USER_BASE = 10_000_000
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TOLERANCE = 0.25
+
+# mezcla de comandos de la carga `mixed` (pesos relativos)
+COMMAND_MIX = {"addtask": 25, "listtasks": 20, "page": 10, "complete": 10, "search": 10,
+               "addreminder": 10, "listreminders": 10, "edittask": 5}
+WORDS = ("comprar", "pan", "leche", "llamar", "médico", "informe", "reunión", "pagar", "factura",
+         "correo", "revisar", "proyecto", "gimnasio", "regalo", "viaje", "banco", "coche", "cita")
+RARE_WORD = "urgentísimo"
+
+
+# ---------- harness ----------
+class FakeRequest(BaseRequest):
+    """
+    Transporte de la Bot API en memoria: responde OK a todo y cuenta las llamadas por método.
+    getUpdates entrega los updates de `updates` a partir del `offset` pedido (modo polling).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.updates: Deque[Dict[str, Any]] = deque()
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data is not None else {}
+        if endpoint == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "bench", "username": "benchbot"}
+        elif endpoint == "getUpdates":
+            # los updates con id < offset ya están confirmados
+            offset = int(params.get("offset") or 0)
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+            result = list(itertools.islice(self.updates, int(params.get("limit") or 100)))
+            if not result:
+                # long polling sin updates: una espera corta en vez del timeout real
+                await asyncio.sleep(0.01)
+        elif endpoint.startswith(("send", "edit")):
+            self._message_id += 1
+            try:
+                chat_id = int(params.get("chat_id", 0))
+            except (TypeError, ValueError):
+                chat_id = 0
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": str(params.get("text", ""))}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class LimitedFakeRequest(FakeRequest):
+    """
+    FakeRequest que aplica a sendMessage los límites de Telegram (global y por chat):
+    al pasarse responde 429 con `retry_after`. Los chats de `blocked` responden 403 y
+    una fracción `network_errors` de los envíos falla con un error de red. Los límites
+    van en la escala de tiempo del benchmark, así que retry_after puede ser fraccionario.
+    """
+
+    def __init__(self, global_rate: float, per_chat_rate: float, blocked=(), network_errors: float = 0.0,
+                 seed: int = 1, latency: float = 0.0):
+        super().__init__(latency)
+        self._global = ratelimit.TokenBucket(global_rate)
+        self._per_chat = ratelimit.BucketMap(per_chat_rate, capacity=1)
+        self.blocked = set(blocked)
+        self.network_errors = network_errors
+        self._rnd = random.Random(seed)
+        self.rejected: Dict[str, int] = defaultdict(int)
+
+    def _error(self, code: int, description: str, retry_after: Optional[float] = None):
+        self.rejected[str(code)] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if retry_after is not None:
+            body["parameters"] = {"retry_after": retry_after}
+        return code, json.dumps(body).encode()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if url.endswith("/sendMessage"):
+            chat_id = int(request_data.parameters["chat_id"])
+            if chat_id in self.blocked:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+            if self.network_errors and self._rnd.random() < self.network_errors:
+                self.rejected["network"] += 1
+                raise telegram.error.NetworkError("conexión perdida (simulada)")
+            wait = self._per_chat.take(chat_id) or self._global.take()
+            if wait:
+                return self._error(429, f"Too Many Requests: retry after {wait:.3f}", round(wait, 3))
+        return await super().do_request(url, method, request_data, read_timeout, write_timeout,
+                                        connect_timeout, pool_timeout)
+
+
+class FakeJob:
+    def __init__(self, callback, when: float, data, name: Optional[str], interval: Optional[float] = None):
+        self.callback = callback
+        self.when = when
+        self.data = data
+        self.name = name
+        self.interval = interval
+        self.removed = False
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+class FakeJobQueue:
+    """JobQueue sin APScheduler: guarda los jobs y el benchmark los ejecuta con run_due()."""
+
+    def __init__(self):
+        self.application = None
+        self._jobs: List[FakeJob] = []
+
+    def set_application(self, application):
+        self.application = application
+
+    async def start(self):
+        pass
+
+    async def stop(self, wait: bool = True):
+        pass
+
+    def run_once(self, callback, when, data=None, name=None, **kwargs):
+        job = FakeJob(callback, time.time() + float(when), data, name)
+        self._jobs.append(job)
+        return job
+
+    def run_repeating(self, callback, interval, first=None, data=None, name=None, **kwargs):
+        job = FakeJob(callback, time.time() + float(interval if first is None else first), data, name,
+                      float(interval))
+        self._jobs.append(job)
+        return job
+
+    def jobs(self):
+        return tuple(j for j in self._jobs if not j.removed)
+
+    async def run_due(self, names=None, now: Optional[float] = None) -> int:
+        """Ejecuta los jobs vencidos (opcionalmente solo los de `names`); devuelve cuántos corrieron."""
+        now = time.time() if now is None else now
+        due = [j for j in self._jobs if not j.removed and j.when <= now and (names is None or j.name in names)]
+        for job in due:
+            if job.interval is None:
+                job.removed = True
+            else:
+                job.when = now + job.interval
+            context = types.SimpleNamespace(job=job, application=self.application, bot=self.application.bot,
+                                            bot_data=self.application.bot_data)
+            await job.callback(context)
+        self._jobs = [j for j in self._jobs if not j.removed]
+        return len(due)
+
+
+class Harness:
+    """Application de PTB con los handlers de bot.py, sin red ni scheduler."""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, latency: float = 0.0,
+                 throttle_: Optional[throttle.Throttle] = None, request: Optional[FakeRequest] = None,
+                 polling: bool = False):
+        self.request = request or FakeRequest(latency)
+        self.jobs = FakeJobQueue()
+        builder = ApplicationBuilder().token(BOT_TOKEN).request(self.request).job_queue(self.jobs)
+        # con polling, el Updater de PTB pide los updates a la misma FakeRequest (getUpdates)
+        builder = builder.get_updates_request(self.request) if polling else builder.updater(None)
+        if concurrency > 1:
+            builder = builder.concurrent_updates(concurrency)
+        self.app = builder.build()
+        if throttle_ is not None:
+            throttle.install(self.app, throttle_)
+        bot.register_handlers(self.app)
+        self._update_id = 0
+        self._message_id = 0
+
+    async def __aenter__(self):
+        await self.app.initialize()
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.app.updater is not None and self.app.updater.running:
+            await self.app.updater.stop()
+        await reminders.flush_pending_writes(self.app)
+        if self.app.running:
+            await self.app.stop()
+        await self.app.shutdown()
+
+    def _next_ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def update_json(self, user_id: int, text: Optional[str] = None, data: Optional[str] = None) -> Dict[str, Any]:
+        update_id, message_id = self._next_ids()
+        user = {"id": user_id, "is_bot": False, "first_name": "bench"}
+        chat = {"id": user_id, "type": "private"}
+        if data is not None:
+            return {"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": "bench", "data": data,
+                "message": {"message_id": message_id, "date": int(time.time()), "chat": chat, "text": "📋"}}}
+        message = {"message_id": message_id, "date": int(time.time()), "chat": chat, "from": user, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def update(self, user_id: int, text: Optional[str] = None, data: Optional[str] = None) -> Update:
+        return Update.de_json(self.update_json(user_id, text, data), self.app.bot)
+
+    async def process(self, update: Update) -> float:
+        start = time.perf_counter()
+        await self.app.process_update(update)
+        return time.perf_counter() - start
+
+    @property
+    def sent(self) -> int:
+        return self.request.calls["sendMessage"]
+
+
+def fast_sender(app, rate: float = 0) -> sender.OutboundSender:
+    # rate 0 = sin límite: mide el pipeline, no el límite de Telegram
+    rate = rate or 1e9
+    return sender.OutboundSender(app.bot, global_rate=rate, per_chat_rate=rate)
+
+
+# ---------- medidas ----------
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _latency(prefix: str, seconds: List[float]) -> Dict[str, float]:
+    return {f"{prefix}p50_ms": _percentile(seconds, 50) * 1e3,
+            f"{prefix}p95_ms": _percentile(seconds, 95) * 1e3,
+            f"{prefix}p99_ms": _percentile(seconds, 99) * 1e3}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _io() -> Dict[str, int]:
+    # Linux: syscalls y bytes de E/S del proceso (casi todo es SQLite)
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+
+class Probe:
+    """Diferencias de RSS, E/S, consultas a la DB y latencia de handlers durante un bloque."""
+
+    def __enter__(self):
+        self.rss = _rss_mb()
+        self.io = _io()
+        self.db = metrics.REGISTRY.totals("db_query_seconds")
+        self.handlers = metrics.REGISTRY.totals("handler_latency_seconds")
+        return self
+
+    def __exit__(self, *exc):
+        io = _io()
+        db = metrics.REGISTRY.totals("db_query_seconds")
+        handlers = metrics.REGISTRY.totals("handler_latency_seconds")
+        self.result = {
+            "rss_mb": _rss_mb(),
+            "rss_growth_mb": _rss_mb() - self.rss,
+            "db_calls": db[0] - self.db[0],
+            "db_seconds": db[1] - self.db[1],
+        }
+        handler_seconds = handlers[1] - self.handlers[1]
+        if handler_seconds > 0:
+            # fracción del tiempo de los handlers pasada en llamadas a la DB
+            self.result["db_share"] = self.result["db_seconds"] / handler_seconds
+        for key in ("syscr", "syscw", "read_bytes", "write_bytes"):
+            if key in io and key in self.io:
+                self.result[f"io_{key}"] = io[key] - self.io[key]
+
+
+def _timed(fn: Callable, repeat: int) -> float:
+    """Segundos por llamada (mejor de 3 rondas)."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+# ---------- datos ----------
+class Context:
+    def __init__(self, args, tmpdir: str):
+        self.args = args
+        self.tmpdir = tmpdir
+        self.seed = args.seed
+        self.backend = args.backend
+        self.concurrency = args.concurrency
+        self._dbs: Dict[str, str] = {}
+
+    def size(self, full: int, quick: int) -> int:
+        return quick if self.args.quick else full
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmpdir, name)
+
+    def fresh_storage(self, name: str, backend: Optional[str] = None) -> storage.Storage:
+        task_manager.clear_task_cache()
+        if (backend or self.backend) == "memory":
+            return storage.configure(storage.MemoryStorage())
+        path = self.path(f"{name}.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return storage.configure(storage.SQLiteStorage(path))
+
+    def seeded_db(self, key: str, seeder: Callable[[storage.Storage], None]) -> storage.Storage:
+        """DB SQLite sembrada una sola vez por ejecución y compartida por varios escenarios."""
+        task_manager.clear_task_cache()
+        if key not in self._dbs:
+            st = self.fresh_storage(key, "sqlite")
+            seeder(st)
+            self._dbs[key] = st.path
+            return st
+        return storage.configure(storage.SQLiteStorage(self._dbs[key]))
+
+
+def _task_text(rnd: random.Random, i: int) -> str:
+    words = rnd.sample(WORDS, 3)
+    if i % 1000 == 0:
+        words.append(RARE_WORD)
+    return " ".join(words) + f" {i}"
+
+
+def _seed_tasks(st: storage.Storage, rows, chunk: int = transfer.IMPORT_CHUNK) -> List[int]:
+    ids, batch = [], []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk:
+            ids += st.import_tasks(batch)
+            batch = []
+    if batch:
+        ids += st.import_tasks(batch)
+    return ids
+
+
+def _seed_reminders(st: storage.Storage, rows, chunk: int = transfer.IMPORT_CHUNK) -> int:
+    count, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk:
+            count += st.import_reminders(batch)
+            batch = []
+    if batch:
+        count += st.import_reminders(batch)
+    return count
+
+
+def _reminder_rows(rnd: random.Random, users: int, n: int, start: float, spread: float, task_ids=None):
+    """Filas para import_reminders: vencen entre `start` y `start + spread`; 20 % diarios."""
+    for i in range(n):
+        epoch = int(start + rnd.random() * spread)
+        wall = timezones.wall_time(timezones.localize(
+            time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch)), timezones.DEFAULT_TZ))
+        task_id = rnd.choice(task_ids) if task_ids and i % 2 else None
+        yield (str(USER_BASE + rnd.randrange(users)), task_id, wall, epoch, "daily" if i % 5 == 0 else None,
+               timezones.DEFAULT_TZ, False)
+
+
+def make_workload(rnd: random.Random, n: int, users: int, zipf: float, task_ids: Dict[int, List[int]],
+                  mix: Dict[str, int] = COMMAND_MIX) -> List[Dict[str, Any]]:
+    """Secuencia de updates: usuarios según una Zipf de exponente `zipf`, comandos según `mix`."""
+    weights = [1 / (k + 1) ** zipf for k in range(users)]
+    cumulative, total = [], 0.0
+    for w in weights:
+        total += w
+        cumulative.append(total)
+    ops = rnd.choices(list(mix), weights=list(mix.values()), k=n)
+    picks = rnd.choices(range(users), cum_weights=cumulative, k=n)
+    items = []
+    for op, k in zip(ops, picks):
+        user = USER_BASE + k
+        ids = task_ids.get(user) or [1]
+        if op == "addtask":
+            text = f"/addtask {_task_text(rnd, rnd.randrange(10**6))}"
+        elif op == "listtasks":
+            text = rnd.choice(("/listtasks", "/listtasks pending"))
+        elif op == "page":
+            items.append({"user": user, "op": op, "data": f"tasks:all:a:{rnd.choice(ids)}"})
+            continue
+        elif op == "complete":
+            text = f"/complete {rnd.choice(ids)}"
+        elif op == "search":
+            text = f"/search {rnd.choice(WORDS)}"
+        elif op == "addreminder":
+            when = time.gmtime(time.time() + rnd.randrange(3600, 30 * 86400))
+            text = f"/addreminder {time.strftime('%Y-%m-%d %H:%M', when)}"
+            if rnd.random() < 0.3:
+                text += f" {rnd.choice(ids)}"
+            if rnd.random() < 0.2:
+                text += " daily"
+        elif op == "listreminders":
+            text = "/listreminders"
+        else:
+            text = f"/edittask {rnd.choice(ids)} {_task_text(rnd, rnd.randrange(10**6))}"
+        items.append({"user": user, "op": op, "text": text})
+    return items
+
+
+# ---------- escenarios ----------
+async def bench_mixed(ctx: Context) -> Dict[str, float]:
+    """Carga mixta de comandos por los handlers reales (usuarios con distribución Zipf)."""
+    args = ctx.args
+    users = args.users or ctx.size(2000, 300)
+    n = args.updates or ctx.size(20_000, 3000)
+    per_user = 20
+    rnd = random.Random(ctx.seed)
+    st = ctx.fresh_storage("mixed")
+    created = time.strftime("%Y-%m-%dT%H:%M")
+    ids = _seed_tasks(st, ((str(USER_BASE + k), _task_text(rnd, k * per_user + j), False, created)
+                           for k in range(users) for j in range(per_user)))
+    task_ids = {USER_BASE + k: ids[k * per_user:(k + 1) * per_user] for k in range(users)}
+    if args.replay:
+        with open(args.replay) as f:
+            workload = [json.loads(line) for line in f if line.strip()]
+    else:
+        workload = make_workload(rnd, n, users, args.zipf, task_ids)
+    if args.save_workload:
+        with open(args.save_workload, "w") as f:
+            for item in workload:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    latencies = defaultdict(list)
+    async with Harness(latency=args.latency / 1e3) as h:
+        updates = [(item["op"], h.update(item["user"], item.get("text"), item.get("data"))) for item in workload]
+        queue = iter(updates)
+
+        async def client():
+            for op, update in queue:
+                latencies[op].append(await h.process(update))
+
+        with Probe() as probe:
+            start = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(ctx.concurrency)))
+            elapsed = time.perf_counter() - start
+    result = {"updates": len(updates), "users": users, "updates_per_s": len(updates) / elapsed}
+    result.update(_latency("", [x for values in latencies.values() for x in values]))
+    for op in sorted(latencies):
+        result[f"{op}_p50_ms"] = _percentile(latencies[op], 50) * 1e3
+        result[f"{op}_p99_ms"] = _percentile(latencies[op], 99) * 1e3
+    result.update(probe.result)
+    result["db_calls_per_update"] = result["db_calls"] / len(updates)
+    return result
+
+
+async def bench_reminders(ctx: Context) -> Dict[str, float]:
+    """Ráfaga de recordatorios vencidos despachados por _reminder_callback."""
+    n = ctx.size(20_000, 3000)
+    users = ctx.size(5000, 1000)
+    rnd = random.Random(ctx.seed)
+    st = ctx.fresh_storage("reminders")
+    created = time.strftime("%Y-%m-%dT%H:%M")
+    task_ids = _seed_tasks(st, ((str(USER_BASE + rnd.randrange(users)), _task_text(rnd, i), False, created)
+                                for i in range(n // 2)))
+    _seed_reminders(st, _reminder_rows(rnd, users, n, time.time() - 60, 59, task_ids))
+    async with Harness() as h:
+        dispatcher = reminders.schedule_pending_reminders(h.app)
+        dispatcher.sender = fast_sender(h.app, ctx.args.send_rate)
+        with Probe() as probe:
+            start = time.perf_counter()
+            await h.jobs.run_due(names={"reminder-warm-up"})
+            warm_up = time.perf_counter() - start
+            while await h.jobs.run_due(names={"reminder-dispatcher"}):
+                pass
+            await dispatcher.batcher.flush()
+            elapsed = time.perf_counter() - start
+    result = {"reminders": n, "sent": h.sent, "reminders_per_s": h.sent / elapsed, "burst_s": elapsed,
+              "warm_up_ms": warm_up * 1e3}
+    result.update(probe.result)
+    return result
+
+
+# límites de la Bot API falsa del escenario sender: los de Telegram (30/s y 1/s por chat)
+# con el tiempo comprimido x100, para que una ráfaga grande dure segundos
+SENDER_API_RATE = 3000
+SENDER_API_CHAT_RATE = 100
+
+
+async def _sender_run(ctx: Context, n: int, chats: int, overdrive: float) -> Dict[str, float]:
+    rnd = random.Random(ctx.seed)
+    # 2 % de chats bloqueados (403, se descartan) y 1 % de envíos con error de red
+    blocked = {USER_BASE + c for c in rnd.sample(range(chats), chats // 50)}
+    request = LimitedFakeRequest(SENDER_API_RATE, SENDER_API_CHAT_RATE, blocked, network_errors=0.01,
+                                 seed=ctx.seed)
+    latencies: List[float] = []
+    async with Harness(request=request) as h:
+        # overdrive > 1: el sender cree que puede ir más rápido que la API y recibe 429
+        outbound = sender.OutboundSender(h.app.bot, global_rate=SENDER_API_RATE * overdrive,
+                                         per_chat_rate=SENDER_API_CHAT_RATE * overdrive, base_backoff=0.01)
+
+        async def send(i):
+            start = time.perf_counter()
+            await outbound.send(USER_BASE + rnd.randrange(chats), f"mensaje {i}")
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(n)))
+        elapsed = time.perf_counter() - start
+    stats = outbound.stats
+    result = {"sent": stats[sender.SENT], "dropped": stats[sender.DROPPED], "retry": stats[sender.RETRY],
+              "retries": stats["retries"], "api_429": request.rejected["429"],
+              "api_network_errors": request.rejected["network"], "sent_per_s": stats[sender.SENT] / elapsed,
+              "drop_rate": stats[sender.DROPPED] / n, "retry_rate": stats["retries"] / n}
+    result.update(_latency("send_", latencies))
+    return result
+
+
+async def bench_sender(ctx: Context) -> Dict[str, float]:
+    """OutboundSender contra una Bot API falsa con límites: envíos/s, descartes, reintentos y 429."""
+    n = ctx.size(20_000, 3000)
+    chats = ctx.size(2000, 300)
+    result = {}
+    for mode, overdrive in (("paced", 1.0), ("overdriven", 2.0)):
+        for key, value in (await _sender_run(ctx, n, chats, overdrive)).items():
+            result[f"{mode}_{key}"] = value
+    return result
+
+
+async def _first_update(ctx: Context, path: str) -> Dict[str, float]:
+    # arranque completo sobre una DB existente: init (camino rápido), handlers y
+    # dispatcher; la carga de la ventana corre en segundo plano mientras llega el primer update
+    task_manager.clear_task_cache()
+    storage.close()
+    start = time.perf_counter()
+    storage.configure(storage.SQLiteStorage(path))
+    init = time.perf_counter() - start
+    h = Harness()
+    async with h:
+        reminders.schedule_pending_reminders(h.app)
+        digest.schedule_digests(h.app)
+        warm = asyncio.create_task(h.jobs.run_due(names={"reminder-warm-up"}))
+        await h.process(h.update(USER_BASE, "/listtasks"))
+        first = time.perf_counter() - start
+        await warm
+        ready = time.perf_counter() - start
+    return {"init_ms": init * 1e3, "first_update_ms": first * 1e3, "window_loaded_ms": ready * 1e3}
+
+
+async def bench_startup(ctx: Context) -> Dict[str, float]:
+    """Tiempo hasta el primer update sin backlog y con un backlog grande; memoria del dispatcher."""
+    backlog = ctx.size(100_000, 10_000)
+    rnd = random.Random(ctx.seed)
+    st = ctx.fresh_storage("startup-empty", "sqlite")
+    empty_path = st.path
+    st = ctx.fresh_storage("startup-backlog", "sqlite")
+    backlog_path = st.path
+    _seed_tasks(st, ((str(USER_BASE + i % 1000), _task_text(rnd, i), False, "2025-01-01T10:00")
+                     for i in range(backlog)))
+    _seed_reminders(st, _reminder_rows(rnd, 1000, backlog, time.time() + 60, 30 * 86400))
+    result = {"backlog": backlog}
+    for key, value in (await _first_update(ctx, empty_path)).items():
+        result[f"empty_{key}"] = value
+    for key, value in (await _first_update(ctx, backlog_path)).items():
+        result[f"backlog_{key}"] = value
+
+    # memoria de las filas pendientes y del dispatcher con todo el backlog en la ventana
+    start = time.perf_counter()
+    rows = task_manager.get_pending_reminders(backlog, None, time.time())
+    result["pending_read_ms"] = (time.perf_counter() - start) * 1e3
+    loaded = len(rows)
+    del rows
+    async with Harness() as h:
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+        before = tracemalloc.take_snapshot()
+        rows = task_manager.get_pending_reminders(backlog, None, time.time())
+        after = tracemalloc.take_snapshot()
+        rows_bytes = tracemalloc.get_traced_memory()[0] - base
+        rows_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+        dispatcher = reminders.ReminderDispatcher(h.app, window=len(rows) + 1)
+        dispatcher.load(rows)
+        del rows, before, after
+        held, peak = (value - base for value in tracemalloc.get_traced_memory())
+        tracemalloc.stop()
+    scale = 100_000 / loaded if loaded else 0.0
+    result["pending_rows_100k_mb"] = rows_bytes * scale / 1e6
+    result["pending_rows_100k_blocks"] = int(rows_blocks * scale)
+    # lo que queda vivo en el dispatcher (heap, índice y lo que retenga de las filas)
+    result["dispatcher_100k_mb"] = held * scale / 1e6
+    result["dispatcher_load_peak_100k_mb"] = peak * scale / 1e6
+    return result
+
+
+async def bench_pool(ctx: Context) -> Dict[str, float]:
+    """Consultas con el pool de conexiones de database.py frente a abrir una conexión por llamada."""
+    n = ctx.size(20_000, 3000)
+    st = ctx.fresh_storage("pool", "sqlite")
+    ids = st.import_tasks([(str(USER_BASE), f"tarea {i}", False, "2025-01-01T10:00") for i in range(1000)])
+    user = str(USER_BASE)
+
+    def pooled():
+        database.get_task(user, ids[len(ids) // 2])
+
+    def per_call():
+        conn = sqlite3.connect(st.path)
+        try:
+            conn.execute("SELECT id, text, done, created_at FROM tasks WHERE user_id = ? AND id = ?",
+                         (user, ids[len(ids) // 2])).fetchone()
+        finally:
+            conn.close()
+
+    pooled_s = _timed(pooled, n)
+    per_call_s = _timed(per_call, n // 10)
+    return {"pooled_per_s": 1 / pooled_s, "per_call_per_s": 1 / per_call_s, "speedup": per_call_s / pooled_s}
+
+
+async def bench_cache(ctx: Context) -> Dict[str, float]:
+    """Listado repetido de tareas con la caché por usuario (caliente) y sin ella (fría)."""
+    n = ctx.size(5000, 1000)
+    st = ctx.fresh_storage("cache")
+    user = str(USER_BASE)
+    st.import_tasks([(user, f"tarea {i}", i % 3 == 0, "2025-01-01T10:00") for i in range(200)])
+
+    def cold():
+        task_manager.clear_task_cache()
+        task_manager.list_tasks_page(user)
+
+    cold_s = _timed(cold, n)
+    task_manager.list_tasks_page(user)
+    warm_s = _timed(lambda: task_manager.list_tasks_page(user), n)
+    return {"cold_per_s": 1 / cold_s, "warm_per_s": 1 / warm_s, "hit_speedup": cold_s / warm_s}
+
+
+def _big_task_db(ctx: Context) -> storage.Storage:
+    # mitad de las tareas para un único usuario (búsqueda) y el resto repartido entre 1000
+    n = ctx.size(1_000_000, 100_000)
+
+    def seed(st):
+        rnd = random.Random(ctx.seed)
+        _seed_tasks(st, ((str(USER_BASE if i % 2 else USER_BASE + 1 + i % 1000), _task_text(rnd, i), i % 3 == 0,
+                          "2025-01-01T10:00") for i in range(n)))
+
+    return ctx.seeded_db(f"tasks-{n}", seed)
+
+
+PAGINATION_SIZES = (10, 100, 1000, 10_000, 100_000)
+
+
+async def bench_pagination(ctx: Context) -> Dict[str, float]:
+    """Página de /listtasks por keyset frente a leer la lista completa, para usuarios de varios tamaños."""
+    def seed(st):
+        # un usuario por tamaño, con sus tareas intercaladas con las de los demás
+        rnd = random.Random(ctx.seed)
+        owners = [USER_BASE + k for k, size in enumerate(PAGINATION_SIZES) for _ in range(size)]
+        rnd.shuffle(owners)
+        _seed_tasks(st, ((str(owner), _task_text(rnd, i), i % 3 == 0, "2025-01-01T10:00")
+                         for i, owner in enumerate(owners)))
+
+    st = ctx.seeded_db("pagination", seed)
+    repeat = ctx.size(200, 50)
+    page = task_manager.PAGE_SIZE + 1
+    result = {}
+    for k, size in enumerate(PAGINATION_SIZES):
+        user = str(USER_BASE + k)
+        last_id = st.list_task(user, before_id=2 ** 62, limit=1)[0].id
+        first = _timed(lambda: st.list_task(user, limit=page), repeat)
+        deep = _timed(lambda: st.list_task(user, before_id=last_id, limit=page), repeat)
+        pending = _timed(lambda: st.list_task(user, limit=page, done=False), repeat)
+        full = _timed(lambda: st.list_task(user)[:task_manager.PAGE_SIZE], 1)
+        result.update({f"tasks_{size}_first_page_ms": first * 1e3, f"tasks_{size}_last_page_ms": deep * 1e3,
+                       f"tasks_{size}_pending_page_ms": pending * 1e3, f"tasks_{size}_full_list_ms": full * 1e3})
+    return result
+
+
+async def bench_list(ctx: Context) -> Dict[str, float]:
+    """Latencia de list_task(user) con 1M de tareas repartidas entre 100k usuarios, frente a un scan."""
+    users = ctx.size(100_000, 10_000)
+    n = users * 10
+
+    def seed(st):
+        rnd = random.Random(ctx.seed)
+        _seed_tasks(st, ((str(USER_BASE + rnd.randrange(users)), _task_text(rnd, i), i % 3 == 0, "2025-01-01T10:00")
+                         for i in range(n)))
+
+    st = ctx.seeded_db(f"list-{n}", seed)
+    rnd = random.Random(ctx.seed + 1)
+    picks = [str(USER_BASE + rnd.randrange(users)) for _ in range(ctx.size(5000, 1000))]
+    samples = []
+    for user in picks:
+        start = time.perf_counter()
+        st.list_task(user)
+        samples.append(time.perf_counter() - start)
+
+    def scan():
+        with database._read() as conn:
+            conn.execute("SELECT id, text, done FROM tasks NOT INDEXED WHERE user_id = ? ORDER BY id",
+                         (picks[0],)).fetchall()
+
+    return {"tasks": n, "users": users, **_latency("list_", samples), "scan_list_ms": _timed(scan, 3) * 1e3}
+
+
+async def bench_search(ctx: Context) -> Dict[str, float]:
+    """/search con FTS5 frente a LIKE '%texto%' sobre las tareas del usuario."""
+    st = _big_task_db(ctx)
+    repeat = ctx.size(50, 20)
+
+    def like(user, term):
+        with database._read() as conn:
+            conn.execute("SELECT id, text, done FROM tasks WHERE user_id = ? AND text LIKE ? ORDER BY id LIMIT 20",
+                         (user, f"%{term}%")).fetchall()
+
+    result = {}
+    for label, user in (("big", str(USER_BASE)), ("small", str(USER_BASE + 2))):
+        for kind, term in (("common", WORDS[0]), ("rare", RARE_WORD)):
+            result[f"{label}_{kind}_fts_ms"] = _timed(lambda: st.search_tasks(user, term, 20), repeat) * 1e3
+            result[f"{label}_{kind}_like_ms"] = _timed(lambda: like(user, term), repeat) * 1e3
+    return result
+
+
+async def bench_metrics(ctx: Context) -> Dict[str, float]:
+    """Coste por llamada de instrument_handler y de timed_query."""
+    n = ctx.size(200_000, 50_000)
+
+    async def handler(update, context):
+        return None
+
+    wrapped = metrics.instrument_handler("bench", handler)
+
+    async def loop(fn):
+        start = time.perf_counter()
+        for _ in range(n):
+            await fn(None, None)
+        return (time.perf_counter() - start) / n
+
+    raw_handler = min([await loop(handler) for _ in range(3)])
+    instrumented = min([await loop(wrapped) for _ in range(3)])
+
+    def query():
+        return None
+
+    raw_query = _timed(query, n)
+    timed = _timed(metrics.timed_query(query), n)
+    return {"handler_overhead_us": (instrumented - raw_handler) * 1e6, "query_overhead_us": (timed - raw_query) * 1e6}
+
+
+async def _post_all(port: int, path: str, bodies: List[bytes], clients: int) -> float:
+    async def client(chunk):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for body in chunk:
+                writer.write(f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+                if length:
+                    await reader.readexactly(length)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(bodies[i::clients]) for i in range(clients)))
+    return time.perf_counter() - start
+
+
+async def bench_webhook(ctx: Context) -> Dict[str, float]:
+    """Updates por segundo por webhook (HTTP) y por polling (getUpdates) hasta procesarlos."""
+    n = ctx.size(10_000, 2000)
+    clients = 8
+    st = ctx.fresh_storage("webhook")
+    st.import_tasks([(str(USER_BASE + i % 100), f"tarea {i}", False, "2025-01-01T10:00") for i in range(1000)])
+    async with Harness(concurrency=ctx.concurrency) as h:
+        bodies = [json.dumps(h.update_json(USER_BASE + i % 100, "/listtasks")).encode() for i in range(n)]
+        server = webhook.WebhookServer(h.app, "/telegram")
+        await server.start("127.0.0.1", 0)
+        await h.app.start()
+        start = time.perf_counter()
+        accepted = await _post_all(server.port, "/telegram", bodies, clients)
+        while h.sent < n and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.01)
+        processed = time.perf_counter() - start
+        await server.close()
+    result = {"updates": n, "webhook_received": server.received, "webhook_replies": h.sent,
+              "webhook_accepted_per_s": n / accepted, "webhook_processed_per_s": h.sent / processed}
+
+    # mismos updates por polling: el Updater los pide en lotes de 100 con getUpdates
+    async with Harness(concurrency=ctx.concurrency, polling=True) as h:
+        h.request.updates.extend(h.update_json(USER_BASE + i % 100, "/listtasks") for i in range(n))
+        start = time.perf_counter()
+        await h.app.updater.start_polling(poll_interval=0)
+        await h.app.start()
+        while h.sent < n and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.01)
+        processed = time.perf_counter() - start
+    result.update({"polling_replies": h.sent, "polling_get_updates": h.request.calls["getUpdates"],
+                   "polling_processed_per_s": h.sent / processed})
+    return result
+
+
+async def _throttle_run(ctx: Context, hostile: bool, normal_users: int, duration: float) -> Dict[str, float]:
+    ctx.fresh_storage("throttle")
+    # escala de tiempo comprimida: 20 updates/s por usuario en vez de 1
+    guard = throttle.Throttle(rate=20, burst=5, notice_interval=1.0)
+    latencies: List[float] = []
+    attacker = USER_BASE + 999_999
+    attempts = 0
+    async with Harness(throttle_=guard) as h:
+        deadline = time.perf_counter() + duration
+
+        async def normal(user):
+            k = 0
+            while time.perf_counter() < deadline:
+                text = "/addtask hola" if k % 2 else "/listtasks"
+                latencies.append(await h.process(h.update(user, text)))
+                k += 1
+                await asyncio.sleep(0.1)
+
+        async def flood():
+            nonlocal attempts
+            while time.perf_counter() < deadline:
+                attempts += 1
+                await h.process(h.update(attacker, "/addtask " + "spam\n" * 50))
+                await asyncio.sleep(0)
+
+        tasks = [normal(USER_BASE + u) for u in range(normal_users)]
+        if hostile:
+            tasks.append(flood())
+        await asyncio.gather(*tasks)
+        accepted = storage.get().count_tasks(str(attacker)) // 50
+    result = _latency("", latencies)
+    if hostile:
+        result.update({"attacker_attempts": attempts, "attacker_accepted": accepted})
+    return result
+
+
+async def bench_throttle(ctx: Context) -> Dict[str, float]:
+    """Latencia de usuarios normales con y sin un chat hostil que inunda al bot."""
+    users = ctx.size(50, 20)
+    duration = ctx.size(3, 1)
+    result = {}
+    for key, value in (await _throttle_run(ctx, False, users, duration)).items():
+        result[f"quiet_{key}"] = value
+    for key, value in (await _throttle_run(ctx, True, users, duration)).items():
+        result[f"hostile_{key}"] = value
+    return result
+
+
+async def bench_digest(ctx: Context) -> Dict[str, float]:
+    """Una pasada de resúmenes diarios con N usuarios vencidos."""
+    users = ctx.size(100_000, 10_000)
+    rnd = random.Random(ctx.seed)
+    st = ctx.fresh_storage("digest")
+    now = time.time()
+    for k in range(users):
+        st.set_digest(str(USER_BASE + k), "08:00", int(now) - 1)
+    task_ids = _seed_tasks(st, ((str(USER_BASE + k), _task_text(rnd, k * 3 + j), False, "2025-01-01T10:00")
+                                for k in range(users) for j in range(3)))
+    _seed_reminders(st, _reminder_rows(rnd, users, users * 2, now + 60, 3600, task_ids))
+    async with Harness() as h:
+        h.app.bot_data["digest_sender"] = fast_sender(h.app, ctx.args.send_rate)
+        with Probe() as probe:
+            start = time.perf_counter()
+            processed = await digest.send_due_digests(h.app, now, digest.DIGEST_BATCH)
+            elapsed = time.perf_counter() - start
+    result = {"users": users, "processed": processed, "sent": h.sent, "pass_s": elapsed,
+              "users_per_s": processed / elapsed}
+    result.update(probe.result)
+    return result
+
+
+async def bench_transfer(ctx: Context) -> Dict[str, float]:
+    """Exportación/importación en streaming y snapshot en caliente."""
+    n = ctx.size(400_000, 40_000)
+    users = 1000
+    rnd = random.Random(ctx.seed)
+    st = ctx.fresh_storage("transfer", "sqlite")
+    task_ids = _seed_tasks(st, ((str(USER_BASE + i % users), _task_text(rnd, i), i % 3 == 0, "2025-01-01T10:00")
+                                for i in range(n * 3 // 4)))
+    _seed_reminders(st, _reminder_rows(rnd, users, n // 4, time.time() + 60, 86400, task_ids))
+    result = {"records": n}
+    for fmt in transfer.FORMATS:
+        path = ctx.path(f"export.{fmt}")
+        start = time.perf_counter()
+        with open(path, "wb") as out:
+            count = transfer.export(st, out, fmt)
+        result[f"export_{fmt}_per_s"] = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    database.snapshot(ctx.path("snapshot.db"))
+    result["snapshot_s"] = time.perf_counter() - start
+    target = ctx.fresh_storage("transfer-import", "sqlite")
+    start = time.perf_counter()
+    with open(ctx.path("export.jsonl"), "rb") as inp:
+        transfer.check(inp, "jsonl")
+        inp.seek(0)
+        counts = transfer.load(target, inp, "jsonl")
+    result["import_per_s"] = (counts["tasks"] + counts["reminders"]) / (time.perf_counter() - start)
+    return result
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "mixed": bench_mixed,
+    "reminders": bench_reminders,
+    "sender": bench_sender,
+    "startup": bench_startup,
+    "pool": bench_pool,
+    "cache": bench_cache,
+    "pagination": bench_pagination,
+    "list": bench_list,
+    "search": bench_search,
+    "metrics": bench_metrics,
+    "webhook": bench_webhook,
+    "throttle": bench_throttle,
+    "digest": bench_digest,
+    "transfer": bench_transfer,
+}
+
+
+# ---------- resultados ----------
+def _direction(metric: str) -> int:
+    """+1 si más es mejor, -1 si menos es mejor, 0 si no se compara."""
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith(("_ms", "_s", "_mb", "_bytes", "_us")) and not metric.startswith(("rss_", "db_")):
+        return -1
+    return 0
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Métricas peores que el baseline en más de `tolerance` (fracción)."""
+    regressions = []
+    for name, base_metrics in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(name)
+        if current is None:
+            continue
+        for metric, base in base_metrics.items():
+            direction = _direction(metric)
+            value = current.get(metric)
+            if not direction or value is None or not base:
+                continue
+            change = (value - base) / base
+            if change * direction < -tolerance:
+                regressions.append(f"{name}.{metric}: {base:.4g} -> {value:.4g} ({change:+.0%})")
+    return regressions
+
+
+def _meta(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "commit": commit,
+            "python": platform.python_version(), "ptb": telegram.__version__, "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "quick": args.quick, "backend": args.backend,
+            "seed": args.seed, "concurrency": args.concurrency}
+
+
+def _print(name: str, result: Dict[str, Any]):
+    print(f"\n[{name}]")
+    for metric, value in result.items():
+        print(f"  {metric:<32} {value:,.3f}" if isinstance(value, float) else f"  {metric:<32} {value}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="bench.py", description="Benchmarks de RecordedTaskBot (sin red)")
+    parser.add_argument("scenarios", nargs="*", help="escenarios a correr (por defecto, todos)")
+    parser.add_argument("--list", action="store_true", help="lista los escenarios y sale")
+    parser.add_argument("--quick", action="store_true", help="tamaños reducidos (CI)")
+    parser.add_argument("--backend", choices=sorted(storage.BACKENDS), default="sqlite",
+                        help="backend de los escenarios que no son específicos de SQLite")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="updates simultáneos")
+    parser.add_argument("--users", type=int, help="usuarios de la carga mixed")
+    parser.add_argument("--updates", type=int, help="updates de la carga mixed")
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponente de la distribución de usuarios")
+    parser.add_argument("--latency", type=float, default=0.0, help="latencia simulada de la Bot API (ms)")
+    parser.add_argument("--send-rate", type=float, default=0, help="mensajes/s del sender (0 = sin límite)")
+    parser.add_argument("--save-workload", help="guarda la carga mixed generada (JSONL)")
+    parser.add_argument("--replay", help="reproduce una carga mixed guardada")
+    parser.add_argument("--out", help="guarda los resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="empeoramiento tolerado frente al baseline (fracción)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, fn in SCENARIOS.items():
+            print(f"{name:<12} {fn.__doc__}")
+        return 0
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.WARNING)
+    tmpdir = tempfile.mkdtemp(prefix="taskbot-bench-")
+    ctx = Context(args, tmpdir)
+    results = {"meta": _meta(args), "scenarios": {}}
+    try:
+        for name in args.scenarios or list(SCENARIOS):
+            start = time.perf_counter()
+            result = asyncio.run(SCENARIOS[name](ctx))
+            result["scenario_seconds"] = time.perf_counter() - start
+            results["scenarios"][name] = result
+            _print(name, result)
+    finally:
+        storage.close()
+        task_manager.shutdown_executor()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    results["meta"]["maxrss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"\nSin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
+import asyncio
+import logging
 import os
+import tempfile
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import InvalidToken
+from telegram.error import BadRequest, InvalidToken
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -9,13 +12,18 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
-import database
+from telegram.helpers import escape_markdown
+import metrics
+import models
 import task_manager
+import digest
+import recurrence
 import reminders
-from datetime import datetime
-
-# Inicializa DB
-database.init_db()
+import storage
+import throttle
+import timezones
+import transfer
+import webhook
 
 # ---------- Handlers ----------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -23,29 +31,138 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
-        "/addtask <texto> - agregar tarea\n"
-        "/listtasks - listar tareas\n"
+        "/addtask <texto> - agregar tarea (una por línea para varias)\n"
+        "/listtasks [pending|done] - listar tareas\n"
+        "/search <texto> - buscar tareas\n"
         "/edittask <num> <texto> - editar\n"
-        "/deletetask <num> - eliminar\n"
-        "/complete <num> - marcar completada\n"
-        "/pending <num> - marcar pendiente\n"
-        "/addreminder <YYYY-MM-DD HH:MM> [<task_id>] - crear recordatorio\n"
+        "/deletetask <num|3-20,25> - eliminar\n"
+        "/complete <num|3-20,25> - marcar completada\n"
+        "/pending <num|3-20,25> - marcar pendiente\n"
+        "/clearcompleted - eliminar las completadas\n"
+        "/addreminder <YYYY-MM-DD HH:MM> [<task_id>] [daily|weekly|weekdays|<N>h] - crear recordatorio\n"
         "/listreminders - ver recordatorios\n"
         "/deletereminder <id> - eliminar recordatorio\n"
+        "/timezone [Europe/Madrid] - ver o cambiar tu zona horaria\n"
+        "/digest [HH:MM|off] - resumen diario en lugar de un mensaje por recordatorio\n"
+        "/export [jsonl|csv] - descargar tus tareas y recordatorios\n"
+        "/import - enviar un archivo de /export con /import como comentario para restaurarlo\n"
         "/menu - abrir menú\n"
     )
 
-# ADD TASK
+# máximo de ids por comando masivo (/complete 3-20,25)
+MAX_BULK_IDS = 1000
+
+def _parse_ids(args):
+    """Convierte '3-20,25' (o '3 4 5') en lista de ids; None si el formato es inválido."""
+    ids = []
+    for part in ",".join(args).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                lo, hi = (int(x) for x in part.split("-", 1))
+                if lo > hi or hi - lo >= MAX_BULK_IDS:
+                    return None
+                ids.extend(range(lo, hi + 1))
+            else:
+                ids.append(int(part))
+        except ValueError:
+            return None
+        if len(ids) > MAX_BULK_IDS:
+            return None
+    return ids or None
+
+# ADD TASK (una tarea por línea para agregar varias a la vez)
 async def addtask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
-    text = " ".join(context.args)
-    if not text:
+    # context.args pierde los saltos de línea; se usa el texto completo del mensaje
+    parts = (update.message.text or "").split(None, 1)
+    lines = [line.strip() for line in parts[1].splitlines()] if len(parts) > 1 else []
+    lines = [line for line in lines if line]
+    if not lines:
         await update.message.reply_text("Uso: /addtask Comprar pan")
         return
-    tid = task_manager.add_task_for_user(user_id, text)
-    await update.message.reply_text(f"Tarea agregada (id={tid}): {text}")
+    if len(lines) > MAX_BULK_IDS:
+        await update.message.reply_text(f"Máximo {MAX_BULK_IDS} tareas por mensaje.")
+        return
+    try:
+        if len(lines) == 1:
+            text = lines[0]
+            tid = await task_manager.async_add_task_for_user(user_id, text)
+            await update.message.reply_text(f"Tarea agregada (id={tid}): {text}")
+            return
+        ids = await task_manager.async_add_tasks_for_user(user_id, lines)
+    except task_manager.LimitExceeded as e:
+        await update.message.reply_text(f"Has alcanzado el máximo de {e.limit} tareas. "
+                                        "Elimina algunas (/clearcompleted) antes de agregar más.")
+        return
+    await update.message.reply_text(f"{len(ids)} tareas agregadas (ids {ids[0]}-{ids[-1]}).")
+
+# máximo de caracteres de un mensaje de Telegram
+MAX_MESSAGE_TEXT = 4096
+
+def _split_message(lines, limit=MAX_MESSAGE_TEXT):
+    """
+    Une `lines` (lista o generador) en mensajes de hasta `limit` caracteres,
+    cortando entre líneas; solo una línea más larga que el límite se parte.
+    """
+    chunk, size = [], 0
+    for line in lines:
+        for start in range(0, max(len(line), 1), limit):
+            piece = line[start:start + limit]
+            if chunk and size + 1 + len(piece) > limit:
+                yield "\n".join(chunk)
+                chunk, size = [], 0
+            size += len(piece) + (1 if chunk else 0)
+            chunk.append(piece)
+    if chunk:
+        yield "\n".join(chunk)
+
+# LIST TASKS (paginado por keyset, compatible con buttons)
+TASK_FILTERS = {"all": None, "pending": False, "done": True}
+# recorte del texto de cada tarea en el listado para no pasar el límite de 4096 caracteres
+MAX_LISTED_TEXT = 200
+
+def _listed_text(text: str) -> str:
+    # texto de la tarea escapado para Markdown; el recorte se mide ya escapado
+    # (cada carácter especial ocupa dos) y nunca deja un escape a medias
+    size = 0
+    for i, c in enumerate(text):
+        size += 2 if c in "_*`[" else 1
+        if size > MAX_LISTED_TEXT:
+            return escape_markdown(text[:i]) + "…"
+    return escape_markdown(text)
+
+def _tasks_keyboard(flt, rows, has_prev, has_next):
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("⬅️ Anterior", callback_data=f"tasks:{flt}:b:{rows[0].id}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("Siguiente ➡️", callback_data=f"tasks:{flt}:a:{rows[-1].id}"))
+    filter_row = [
+        InlineKeyboardButton("Todas", callback_data="tasks:all:a:0"),
+        InlineKeyboardButton("⏳ Pendientes", callback_data="tasks:pending:a:0"),
+        InlineKeyboardButton("✅ Completadas", callback_data="tasks:done:a:0"),
+    ]
+    return InlineKeyboardMarkup([nav, filter_row] if nav else [filter_row])
+
+async def _render_tasks_page(user_id, flt="all", direction="a", cursor=0):
+    after_id = cursor if direction == "a" and cursor else None
+    before_id = cursor if direction == "b" else None
+    rows, has_prev, has_next = await task_manager.async_list_tasks_page(
+        user_id, after_id=after_id, before_id=before_id, done=TASK_FILTERS[flt]
+    )
+    if not rows:
+        text = "No tienes tareas." if flt == "all" else "No hay tareas con ese filtro."
+        return text, (_tasks_keyboard(flt, rows, False, False) if flt != "all" else None)
+
+    lines = ["📋 *Tus tareas:*\n"]
+    for r in rows:
+        estado = "✅" if r.done else "⏳"
+        lines.append(f"{r.id}. {estado} {_listed_text(r.text)}")
+    return "\n".join(lines) + "\n", _tasks_keyboard(flt, rows, has_prev, has_next)
 
-# LIST TASKS (compatible con buttons)
 async def listtasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # detect source
     if update.callback_query:
@@ -55,16 +172,52 @@ async def listtasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = str(update.message.from_user.id)
         msg = update.message
 
-    rows = task_manager.list_tasks_for_user(user_id)
-    if not rows:
-        await msg.reply_text("No tienes tareas.")
+    flt = "all"
+    if context.args and context.args[0].lower() in TASK_FILTERS:
+        flt = context.args[0].lower()
+    text, markup = await _render_tasks_page(user_id, flt)
+    await msg.reply_text(text, parse_mode="Markdown", reply_markup=markup)
+
+async def tasks_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # callback_data: tasks:<filtro>:<a|b>:<id cursor>
+    query = update.callback_query
+    try:
+        _, flt, direction, cursor = query.data.split(":")
+        cursor = int(cursor)
+    except ValueError:
+        return
+    if flt not in TASK_FILTERS or direction not in ("a", "b"):
         return
+    text, markup = await _render_tasks_page(str(query.from_user.id), flt, direction, cursor)
+    try:
+        await query.edit_message_text(text, parse_mode="Markdown", reply_markup=markup)
+    except BadRequest as e:
+        # pulsar otra vez el mismo botón (o la misma página sin cambios) no es un error
+        if "not modified" not in e.message.lower():
+            raise
 
-    text = "📋 *Tus tareas:*\n\n"
+# SEARCH
+SEARCH_LIMIT = 20
+
+def _snippet_markdown(snippet: str) -> str:
+    # se escapa el texto de la tarea antes de poner en negrita las coincidencias
+    return escape_markdown(snippet).replace(models.SNIPPET_START, "*").replace(models.SNIPPET_END, "*")
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text("Uso: /search <texto>")
+        return
+    rows = await task_manager.async_search_tasks_for_user(user_id, query, SEARCH_LIMIT)
+    if not rows:
+        await update.message.reply_text("No se encontraron tareas.")
+        return
+    lines = ["🔎 *Resultados:*\n"]
     for r in rows:
         estado = "✅" if r["done"] else "⏳"
-        text += f"{r['id']}. {estado} {r['text']}\n"
-    await msg.reply_text(text, parse_mode="Markdown")
+        lines.append(f"{r['id']}. {estado} {_snippet_markdown(r['snippet'])}")
+    await update.message.reply_text("\n".join(lines) + "\n", parse_mode="Markdown")
 
 # EDIT TASK
 async def edittask(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -78,7 +231,7 @@ async def edittask(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Número inválido")
         return
     new_text = " ".join(context.args[1:])
-    ok = task_manager.edit_task_for_user(user_id, num, new_text)
+    ok = await task_manager.async_edit_task_for_user(user_id, num, new_text)
     if ok:
         await update.message.reply_text(f"Tarea #{num} actualizada.")
     else:
@@ -88,14 +241,18 @@ async def edittask(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def deletetask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     if len(context.args) < 1:
-        await update.message.reply_text("Uso: /deletetask <num>")
+        await update.message.reply_text("Uso: /deletetask <num> (o lista/rango: 3-20,25)")
         return
-    try:
-        num = int(context.args[0])
-    except ValueError:
+    ids = _parse_ids(context.args)
+    if ids is None:
         await update.message.reply_text("Número inválido")
         return
-    ok = task_manager.delete_task_for_user(user_id, num)
+    if len(ids) > 1:
+        changed = await task_manager.async_delete_tasks_for_user(user_id, ids)
+        await update.message.reply_text(f"{changed} de {len(ids)} tareas eliminadas.")
+        return
+    num = ids[0]
+    ok = await task_manager.async_delete_task_for_user(user_id, num)
     if ok:
         await update.message.reply_text(f"Tarea #{num} eliminada.")
     else:
@@ -105,14 +262,18 @@ async def deletetask(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     if len(context.args) < 1:
-        await update.message.reply_text("Uso: /complete <num>")
+        await update.message.reply_text("Uso: /complete <num> (o lista/rango: 3-20,25)")
         return
-    try:
-        num = int(context.args[0])
-    except ValueError:
+    ids = _parse_ids(context.args)
+    if ids is None:
         await update.message.reply_text("Número inválido")
         return
-    ok = task_manager.complete_task_for_user(user_id, num)
+    if len(ids) > 1:
+        changed = await task_manager.async_complete_tasks_for_user(user_id, ids)
+        await update.message.reply_text(f"{changed} de {len(ids)} tareas marcadas como completadas.")
+        return
+    num = ids[0]
+    ok = await task_manager.async_complete_task_for_user(user_id, num)
     if ok:
         await update.message.reply_text(f"Tarea #{num} marcada como completada.")
     else:
@@ -121,19 +282,28 @@ async def complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
     if len(context.args) < 1:
-        await update.message.reply_text("Uso: /pending <num>")
+        await update.message.reply_text("Uso: /pending <num> (o lista/rango: 3-20,25)")
         return
-    try:
-        num = int(context.args[0])
-    except ValueError:
+    ids = _parse_ids(context.args)
+    if ids is None:
         await update.message.reply_text("Número inválido")
         return
-    ok = task_manager.pending_task_for_user(user_id, num)
+    if len(ids) > 1:
+        changed = await task_manager.async_pending_tasks_for_user(user_id, ids)
+        await update.message.reply_text(f"{changed} de {len(ids)} tareas marcadas como pendientes.")
+        return
+    num = ids[0]
+    ok = await task_manager.async_pending_task_for_user(user_id, num)
     if ok:
         await update.message.reply_text(f"Tarea #{num} marcada como pendiente.")
     else:
         await update.message.reply_text("No se encontró la tarea.")
 
+async def clearcompleted(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    removed = await task_manager.async_clear_completed_for_user(user_id)
+    await update.message.reply_text(f"{removed} tareas completadas eliminadas.")
+
 # REMINDERS: addreminder <YYYY-MM-DD HH:MM> [task_id]
 async def addreminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
@@ -147,14 +317,15 @@ async def addreminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
         rest = context.args[2:]
     else:
         rest = context.args[1:]
-    # analizar opcionales en `rest`: puede incluir task_id y/o repetición (daily|weekly)
+    # analizar opcionales en `rest`: puede incluir task_id y/o repetición (ver recurrence.parse_rule)
     task_id = None
     repeat = None
     if rest:
         # detectar token de repetición si existe
         for i, tok in enumerate(list(rest)):
-            if tok.lower() in ("daily", "weekly"):
-                repeat = tok.lower()
+            rule = recurrence.parse_rule(tok)
+            if rule:
+                repeat = rule
                 # eliminar ese token de la lista
                 rest.pop(i)
                 break
@@ -167,34 +338,44 @@ async def addreminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # normalizar formato (replace space with T)
     dt_iso = dt_raw.strip().replace(" ", "T")
-    # validate
+    # la fecha se interpreta en la zona horaria del usuario (/timezone)
+    settings = await task_manager.async_get_user_settings(user_id)
+    tz = settings["tz"]
     try:
         # if missing seconds it's fine
-        _ = datetime.fromisoformat(dt_iso)
+        remind_at_epoch = timezones.to_epoch(dt_iso, tz)
     except Exception:
         await update.message.reply_text("Formato de fecha inválido. Usa: YYYY-MM-DD HH:MM")
         return
 
-    rid = task_manager.add_reminder_for_user(user_id, dt_iso, task_id, repeat)
-    await update.message.reply_text(f"Recordatorio creado (id={rid}) para {dt_iso}")
+    try:
+        rid = await task_manager.async_add_reminder_for_user(user_id, dt_iso, task_id, repeat, tz)
+    except task_manager.LimitExceeded as e:
+        await update.message.reply_text(f"Has alcanzado el máximo de {e.limit} recordatorios pendientes. "
+                                        "Elimina alguno con /deletereminder.")
+        return
+    await update.message.reply_text(f"Recordatorio creado (id={rid}) para {dt_iso} ({tz})")
 
-    # schedule immediately in job_queue
-    # job data used by reminders._reminder_callback expects dict with id,user_id,task_id,remind_at
-    app = context.application
-    rem_row = {"id": rid, "user_id": user_id, "task_id": task_id, "remind_at": dt_iso, "repeat": repeat}
-    # compute delay and schedule via reminders module (reuse its logic)
-    reminders.schedule_pending_reminders(app)  # quick and safe: re-schedule all pending (lightweight for small scale)
+    if settings["digest_at"]:
+        # en modo resumen el recordatorio sale en el resumen diario, no por separado
+        return
+    # programar solo este recordatorio en el dispatcher (sin re-escanear la DB)
+    reminders.schedule_reminder(context.application, rid, remind_at_epoch)
 
 async def listreminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.message.from_user.id)
-    rows = task_manager.list_reminders_for_user(user_id)
+    rows = await task_manager.async_list_reminders_for_user(user_id)
     if not rows:
         await update.message.reply_text("No tienes recordatorios.")
         return
-    text = "🔔 *Tus recordatorios:*\n\n"
-    for r in rows:
-        text += f"{r['id']}. {r['remind_at']} (task_id={r['task_id']}) sent={r['sent']}\n"
-    await update.message.reply_text(text, parse_mode="Markdown")
+    # las horas se muestran en la zona actual del usuario
+    tz = await task_manager.async_get_user_timezone(user_id)
+    # hasta MAX_REMINDERS_PER_USER pendientes más los enviados: puede hacer falta más de un mensaje
+    lines = [f"🔔 *Tus recordatorios:* (`{tz}`)\n"]
+    lines += (f"{r.id}. {timezones.format_epoch(r.remind_at_epoch, tz)} (task_id={r.task_id}) sent={r.sent}"
+              for r in rows)
+    for text in _split_message(lines):
+        await update.message.reply_text(text, parse_mode="Markdown")
 
 async def deletereminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) < 1:
@@ -205,12 +386,113 @@ async def deletereminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         await update.message.reply_text("Id inválido.")
         return
-    ok = task_manager.delete_reminder_by_id(rid)
+    ok = await task_manager.async_delete_reminder_by_id(rid)
     if ok:
+        reminders.unschedule_reminder(context.application, rid)
         await update.message.reply_text(f"Recordatorio {rid} eliminado.")
     else:
         await update.message.reply_text("No encontrado.")
 
+async def timezone_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    if not context.args:
+        tz = await task_manager.async_get_user_timezone(user_id)
+        await update.message.reply_text(f"Tu zona horaria es {tz}. Cámbiala con /timezone <zona>, p. ej. /timezone Europe/Madrid")
+        return
+    tz = timezones.normalize_zone(context.args[0])
+    if tz is None:
+        await update.message.reply_text("Zona horaria desconocida. Usa un nombre IANA, p. ej. Europe/Madrid o America/Bogota")
+        return
+    await task_manager.async_set_user_timezone(user_id, tz)
+    # los recordatorios ya creados conservan su instante y su zona
+    await update.message.reply_text(f"Zona horaria actualizada: {tz}. Los nuevos recordatorios usarán esta zona.")
+
+async def digest_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    if not context.args:
+        settings = await task_manager.async_get_user_settings(user_id)
+        if settings["digest_at"]:
+            await update.message.reply_text(f"Modo resumen activo: un mensaje diario a las {settings['digest_at']} "
+                                            f"({settings['tz']}). Desactívalo con /digest off")
+        else:
+            await update.message.reply_text("Modo resumen desactivado. Actívalo con /digest HH:MM para recibir "
+                                            "un único mensaje diario con tus recordatorios y tareas pendientes.")
+        return
+    dispatcher = context.application.bot_data.get(reminders.DISPATCHER_KEY)
+    if context.args[0].lower() in ("off", "no", "0"):
+        await task_manager.async_set_digest_for_user(user_id, None)
+        if dispatcher is not None:
+            # sus recordatorios vuelven al dispatcher
+            await dispatcher.refresh()
+        await update.message.reply_text("Modo resumen desactivado: recibirás cada recordatorio a su hora.")
+        return
+    clock = timezones.parse_clock(context.args[0])
+    if clock is None:
+        await update.message.reply_text("Uso: /digest HH:MM (por ejemplo /digest 08:00) o /digest off")
+        return
+    await task_manager.async_set_digest_for_user(user_id, clock)
+    if dispatcher is not None:
+        # el dispatcher solo guarda ids: se quitan los de este usuario
+        for r in await task_manager.async_list_reminders_for_user(user_id):
+            dispatcher.discard(r.id)
+    tz = await task_manager.async_get_user_timezone(user_id)
+    await update.message.reply_text(f"Modo resumen activado: cada día a las {clock} ({tz}) recibirás tus "
+                                    "recordatorios del día y tus tareas pendientes en un solo mensaje.")
+
+# EXPORT / IMPORT (archivos JSONL o CSV, ver transfer.py)
+# la Bot API no permite descargar archivos de más de 20 MB
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    fmt = context.args[0].lower() if context.args else "jsonl"
+    if fmt not in transfer.FORMATS:
+        await update.message.reply_text("Uso: /export [jsonl|csv]")
+        return
+    # se escribe en un archivo temporal en disco: la memoria no crece con el tamaño de la cuenta
+    with tempfile.TemporaryFile() as tmp:
+        count = await task_manager.async_export_for_user(user_id, tmp, fmt)
+        if not count:
+            await update.message.reply_text("No tienes tareas ni recordatorios para exportar.")
+            return
+        tmp.seek(0)
+        await update.message.reply_document(tmp, filename=f"tareas-{user_id}.{fmt}",
+                                            caption=f"{count} registros exportados. Para restaurarlos, "
+                                                    "envía este archivo con /import como comentario.")
+
+async def import_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    # el archivo llega con /import como comentario, o se responde a él con /import
+    doc = update.message.document
+    if doc is None and update.message.reply_to_message is not None:
+        doc = update.message.reply_to_message.document
+    if doc is None:
+        await update.message.reply_text("Envía el archivo de /export con /import como comentario "
+                                        "(o responde al archivo con /import).")
+        return
+    if doc.file_size and doc.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text("El archivo es demasiado grande (máximo 20 MB).")
+        return
+    with tempfile.TemporaryFile() as tmp:
+        tg_file = await doc.get_file()
+        await tg_file.download_to_memory(out=tmp)
+        tmp.seek(0)
+        try:
+            counts = await task_manager.async_import_for_user(user_id, tmp, transfer.detect_format(doc.file_name))
+        except ValueError as e:
+            await update.message.reply_text(f"Archivo inválido ({e}). No se importó nada.")
+            return
+        except task_manager.LimitExceeded as e:
+            what = "tareas" if e.kind == "tasks" else "recordatorios pendientes"
+            await update.message.reply_text(f"La importación superaría el máximo de {e.limit} {what}. "
+                                            "No se importó nada.")
+            return
+    await update.message.reply_text(f"Importadas {counts['tasks']} tareas y {counts['reminders']} recordatorios.")
+    if counts["reminders"]:
+        dispatcher = context.application.bot_data.get(reminders.DISPATCHER_KEY)
+        if dispatcher is not None:
+            await dispatcher.refresh()
+
 # MENU (botones básicos)
 async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
@@ -230,6 +512,8 @@ async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("Escribe tu tarea con /addtask <texto>")
     elif data == "listtasks_menu":
         await listtasks(update, context)
+    elif data.startswith("tasks:"):
+        await tasks_page(update, context)
     elif data == "edit_menu":
         await query.message.reply_text("Usa /edittask <num> <texto>")
     elif data == "delete_menu":
@@ -241,7 +525,51 @@ async def echo_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return
 
 # ---------- MAIN ----------
+async def on_shutdown(app):
+    # confirmar escrituras pendientes, esperar consultas en curso y cerrar la DB
+    await reminders.flush_pending_writes(app)
+    task_manager.shutdown_executor()
+    storage.close()
+
+def _command(name, callback):
+    # cada comando queda instrumentado (latencia por comando en /metrics)
+    return CommandHandler(name, metrics.instrument_handler(name, callback))
+
+def register_handlers(app):
+    """Comandos, callbacks y mensajes del bot (lo usan main() y bench.py)."""
+    app.add_handler(_command("start", start))
+    app.add_handler(_command("help", help_cmd))
+    app.add_handler(_command("addtask", addtask))
+    app.add_handler(_command("listtasks", listtasks))
+    app.add_handler(_command("search", search))
+    app.add_handler(_command("edittask", edittask))
+    app.add_handler(_command("deletetask", deletetask))
+    app.add_handler(_command("complete", complete))
+    app.add_handler(_command("pending", pending))
+    app.add_handler(_command("clearcompleted", clearcompleted))
+
+    app.add_handler(_command("addreminder", addreminder))
+    app.add_handler(_command("listreminders", listreminders))
+    app.add_handler(_command("deletereminder", deletereminder))
+    app.add_handler(_command("timezone", timezone_cmd))
+    app.add_handler(_command("digest", digest_cmd))
+    app.add_handler(_command("export", export_cmd))
+    app.add_handler(_command("import", import_cmd))
+    # /import como comentario de un documento (CommandHandler solo mira el texto del mensaje)
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import(@\w+)?(\s|$)"),
+                                   metrics.instrument_handler("import", import_cmd)))
+
+    # menu & callback
+    app.add_handler(_command("menu", menu))
+    app.add_handler(CallbackQueryHandler(metrics.instrument_handler("callback", menu_handler)))
+
+    # message handler (for extension / interactive flows)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo_text))
+
 def main():
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s", level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
     token = os.getenv("TELEGRAM_TOKEN")
     if not token:
         print("ERROR: Set TELEGRAM_TOKEN env var")
@@ -252,37 +580,57 @@ def main():
         print("ERROR: TELEGRAM_TOKEN parece no tener el formato correcto. Comprueba tu token en BotFather.")
         return
 
+    # almacenamiento: STORAGE_BACKEND=sqlite (DB_PATH) o memory (sin disco)
+    try:
+        storage.configure(storage.from_env())
+    except ValueError as e:
+        print("ERROR:", e)
+        return
+
     # Build application (initialization may still fail if token is invalid/revoked)
-    app = ApplicationBuilder().token(token).build()
-
-    # commands
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("addtask", addtask))
-    app.add_handler(CommandHandler("listtasks", listtasks))
-    app.add_handler(CommandHandler("edittask", edittask))
-    app.add_handler(CommandHandler("deletetask", deletetask))
-    app.add_handler(CommandHandler("complete", complete))
-    app.add_handler(CommandHandler("pending", pending))
-
-    app.add_handler(CommandHandler("addreminder", addreminder))
-    app.add_handler(CommandHandler("listreminders", listreminders))
-    app.add_handler(CommandHandler("deletereminder", deletereminder))
+    builder = ApplicationBuilder().token(token).post_shutdown(on_shutdown)
+    # procesar varios updates a la vez (los handlers no bloquean el loop: la DB va en su executor)
+    concurrent_updates = int(os.getenv("CONCURRENT_UPDATES", "0"))
+    if concurrent_updates > 0:
+        builder = builder.concurrent_updates(concurrent_updates)
+    app = builder.build()
 
-    # menu & callback
-    app.add_handler(CommandHandler("menu", menu))
-    app.add_handler(CallbackQueryHandler(menu_handler))
+    # middleware antes de todos los handlers: límite por usuario y descarte de carga
+    throttle.install(app)
 
-    # message handler (for extension / interactive flows)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo_text))
+    register_handlers(app)
 
-    # schedule pending reminders (needs the app.job_queue available)
+    # arm the reminder dispatcher (needs the app.job_queue available)
     # IMPORTANT: schedule after building app but before run_polling
+    # (la ventana de pendientes se carga en segundo plano cuando el bot ya atiende updates)
     reminders.schedule_pending_reminders(app)
+    # resúmenes diarios de los usuarios en modo resumen (/digest)
+    digest.schedule_digests(app)
+
+    # endpoint /metrics y perfilado opcional (ver metrics.configure_from_env)
+    metrics.configure_from_env()
+
+    # modo webhook: WEBHOOK_URL (URL pública, registra el webhook) o WEBHOOK_MODE=1 (solo servidor local)
+    webhook_url = os.getenv("WEBHOOK_URL")
+    use_webhook = bool(webhook_url) or os.getenv("WEBHOOK_MODE", "") not in ("", "0")
+    webhook_secret = os.getenv("WEBHOOK_SECRET")
+    # sin secreto, el servidor local (WEBHOOK_MODE=1) solo escucha en loopback;
+    # con WEBHOOK_URL y sin secreto, webhook.serve genera uno
+    default_host = "0.0.0.0" if webhook_url or webhook_secret else "127.0.0.1"
 
     print("Bot iniciado...")
     try:
-        app.run_polling()
+        if use_webhook:
+            asyncio.run(webhook.serve(
+                app,
+                host=os.getenv("WEBHOOK_HOST", default_host),
+                port=int(os.getenv("PORT", "8080")),
+                path=os.getenv("WEBHOOK_PATH", "/telegram"),
+                webhook_url=webhook_url,
+                secret_token=webhook_secret,
+            ))
+        else:
+            app.run_polling()
     except InvalidToken:
         print("ERROR: El token fue rechazado por Telegram (InvalidToken). Genera uno nuevo con BotFather y actualiza la variable TELEGRAM_TOKEN.")
     except Exception as e:
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Caché LRU thread-safe con TTL y tope de memoria aproximado.
+
+    Para no guardar datos obsoletos cuando una escritura ocurre mientras otro
+    hilo está leyendo de la DB, el lector toma `stamp()` antes de consultar y
+    `put()` descarta el valor si la clave se invalidó después de ese stamp.
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 32 * 1024 * 1024,
+                 ttl: float = 300.0, sizeof: Callable[[Any], int] = lambda v: 1):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size, expires)
+        self._bytes = 0
+        # invalidaciones recientes (acotadas) para rechazar cargas concurrentes obsoletas
+        self._clock = 0
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stamp(self) -> int:
+        with self._lock:
+            return self._clock
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, stamp: int) -> bool:
+        size = self.sizeof(value)
+        with self._lock:
+            if stamp < self._floor or self._invalidated.get(key, 0) > stamp:
+                return False
+            if size > self.max_bytes:
+                return False
+            self._drop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._clock += 1
+            self.invalidations += 1
+            self._drop(key)
+            self._invalidated[key] = self._clock
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > self.max_entries:
+                _, oldest_stamp = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, oldest_stamp)
+
+    def clear(self):
+        with self._lock:
+            self._clock += 1
+            self._floor = self._clock
+            self._entries.clear()
+            self._invalidated.clear()
+            self._bytes = 0
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,39 +1,158 @@
 import sqlite3
+import itertools
+import json
 import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
+import metrics
+import models
+import timezones
 
-DB_PATH = os.path.join("data", "tasks.db")
-os.makedirs("data", exist_ok=True)
+# ruta del archivo SQLite (DB_PATH en el entorno; el directorio se crea al abrir)
+DB_PATH = os.getenv("DB_PATH", os.path.join("data", "tasks.db"))
 
-def _get_conn():
-    return sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+# conexiones de lectura simultáneas (WAL permite lectores en paralelo con el escritor)
+READ_POOL_SIZE = 4
 
-def init_db():
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """ 
-    CREATE TABLE IF NOT EXISTS tasks(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT NOT NULL,
-        text TEXT NOT NULL,
-        done INTEGER NOT NULL DEFAULT 0,
-        created_at TEXT NOT NULL
-    )
+# pragmas aplicados a cada conexión del pool
+_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",   # en WAL solo se hace fsync en checkpoints
+    "PRAGMA cache_size = -16000",    # ~16 MB de page cache por conexión
+    "PRAGMA mmap_size = 134217728",  # 128 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class ConnectionManager:
     """
-    )
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS reminders (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT NOT NULL,
-        task_id INTEGER,
-        remind_at TEXT NOT NULL,
-        sent INTEGER NOT NULL DEFAULT 0,
-        repeat TEXT DEFAULT NULL
-    )
+    Conexiones SQLite de larga vida: un único escritor protegido por lock
+    y un pequeño pool de lectores. Cada conexión mantiene su caché de
+    sentencias preparadas, así que las consultas repetidas no se recompilan.
     """
-    )
-    conn.commit()
+
+    def __init__(self, path: str, read_pool_size: int = READ_POOL_SIZE):
+        self.path = path
+        self.read_pool_size = read_pool_size
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened_readers = 0
+        self._closed = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened_readers < self.read_pool_size:
+                self._opened_readers += 1
+                return self._connect()
+        return self._readers.get()
+
+    def _release_reader(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+        else:
+            self._readers.put(conn)
+
+    @contextmanager
+    def read(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        self._closed = True
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_manager: Optional[ConnectionManager] = None
+_manager_lock = threading.Lock()
+
+def _get_manager() -> ConnectionManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager(DB_PATH)
+    return _manager
+
+def _read():
+    return _get_manager().read()
+
+def _fetch(conn: sqlite3.Connection, row_factory, sql: str, params=()) -> list:
+    # row_factory por cursor: las conexiones del pool se comparten entre consultas
+    cur = conn.cursor()
+    cur.row_factory = row_factory
+    return cur.execute(sql, params).fetchall()
+
+def _fetch_as(conn: sqlite3.Connection, row_type, sql: str, params=()) -> list:
+    # columnas en el orden de los campos de `row_type` y sin conversiones: las tuplas
+    # se crean desde C, sin una llamada Python por fila (lecturas de miles de filas)
+    return list(map(tuple.__new__, itertools.repeat(row_type), conn.execute(sql, params)))
+
+def _write():
+    return _get_manager().write()
+
+def close_db():
+    """Cierra las conexiones del pool (llamar al apagar el bot)."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+
+def set_db_path(path: str):
+    """Cambia el archivo de la DB; cierra el pool actual si estaba abierto."""
+    global DB_PATH
+    close_db()
+    DB_PATH = path
+
+def _add_column(cur, table: str, column: str, decl: str):
+    # ALTER TABLE ADD COLUMN no admite IF NOT EXISTS: se mira table_info antes
+    if column not in {r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _migrate_legacy_columns(cur):
     # basic migration: ensure expected columns exist
     cur.execute("PRAGMA table_info(reminders)")
     cols = [r[1] for r in cur.fetchall()]
@@ -41,121 +160,612 @@ def init_db():
     if "sent" not in cols:
         try:
             cur.execute("ALTER TABLE reminders ADD COLUMN sent INTEGER NOT NULL DEFAULT 0")
-            conn.commit()
         except Exception:
             pass
     # ensure 'repeat' column exists
-    cur.execute("PRAGMA table_info(reminders)")
-    cols = [r[1] for r in cur.fetchall()]
     if "repeat" not in cols:
         try:
             cur.execute("ALTER TABLE reminders ADD COLUMN repeat TEXT DEFAULT NULL")
-            conn.commit()
         except Exception:
             pass
-    conn.close()
 
+def _add_lookup_indexes(cur):
+    # list_task / list_reminders filtran por usuario; pending_reminders por sent = 0
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks(user_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user_remind_at ON reminders(user_id, remind_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders(remind_at) WHERE sent = 0")
+
+def _add_task_status_index(cur):
+    # páginas filtradas por estado (/listtasks pending|done) sin recorrer las demás filas
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_done ON tasks(user_id, done, id)")
+
+def _add_task_search(cur):
+    # índice FTS5 sobre tasks.text (contenido externo: no duplica el texto);
+    # user_id también se indexa para que el MATCH filtre por usuario dentro de FTS
+    cur.execute(
+        """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        text, user_id, content='tasks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """
+    )
+    cur.execute(
+        """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+    END
+    """
+    )
+    cur.execute(
+        """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+    END
+    """
+    )
+    cur.execute(
+        """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF text, user_id ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+        INSERT INTO tasks_fts(rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+    END
+    """
+    )
+    # backfill de las filas existentes
+    cur.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+def _add_reminder_claims(cur):
+    # lease de cada recordatorio: qué worker lo tomó y hasta cuándo (epoch)
+    _add_column(cur, "reminders", "claimed_by", "TEXT DEFAULT NULL")
+    _add_column(cur, "reminders", "claim_expires", "REAL DEFAULT NULL")
+
+def _add_timezones(cur):
+    # zona horaria por usuario (/timezone) y, por recordatorio, su zona y el instante UTC
+    # precalculado: el dispatcher y la consulta de vencidos ya no parsean remind_at
+    cur.execute(
+        """
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id TEXT PRIMARY KEY,
+        tz TEXT NOT NULL DEFAULT 'UTC'
+    )
+    """
+    )
+    _add_column(cur, "reminders", "remind_at_epoch", "INTEGER")
+    _add_column(cur, "reminders", "tz", "TEXT DEFAULT NULL")
+    # conversión única de las filas existentes (sin offset = UTC, como asumía el dispatcher)
+    rows = cur.execute("SELECT id, remind_at FROM reminders").fetchall()
+    converted, invalid = [], []
+    for rid, remind_at in rows:
+        try:
+            converted.append((timezones.to_epoch(remind_at, timezones.DEFAULT_TZ), rid))
+        except (TypeError, ValueError):
+            invalid.append(rid)
+    cur.executemany("UPDATE reminders SET remind_at_epoch = ?, tz = ? WHERE id = ?",
+                    [(epoch, timezones.DEFAULT_TZ, rid) for epoch, rid in converted])
+    # formato inválido -> enviado, para no bloquear (igual que hacía el dispatcher)
+    cur.executemany("UPDATE reminders SET remind_at_epoch = 0, tz = ?, sent = 1 WHERE id = ?",
+                    [(timezones.DEFAULT_TZ, rid) for rid in invalid])
+    cur.execute("DROP INDEX IF EXISTS idx_reminders_pending")
+    cur.execute("DROP INDEX IF EXISTS idx_reminders_user_remind_at")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(remind_at_epoch) WHERE sent = 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user_epoch ON reminders(user_id, remind_at_epoch)")
+
+def _add_digest_settings(cur):
+    # modo resumen: hora local del resumen diario y su próximo envío (epoch UTC)
+    _add_column(cur, "user_settings", "digest_at", "TEXT DEFAULT NULL")
+    _add_column(cur, "user_settings", "digest_next", "INTEGER DEFAULT NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_settings_digest ON user_settings(digest_next) "
+                "WHERE digest_at IS NOT NULL")
+
+def _bump_task_version(user: str, where: str = "") -> str:
+    return (f"INSERT INTO task_versions (user_id, version) SELECT {user}, 1 {where} "
+            "ON CONFLICT(user_id) DO UPDATE SET version = version + 1;")
+
+def _add_task_versions(cur):
+    # versión de las tareas de cada usuario, subida por triggers en cada escritura (también
+    # las de otros procesos sobre el mismo archivo): la caché de task_manager la compara
+    # en cada acierto, así un worker no sirve páginas que otro ya cambió
+    cur.execute("CREATE TABLE IF NOT EXISTS task_versions (user_id TEXT PRIMARY KEY, "
+                "version INTEGER NOT NULL) WITHOUT ROWID")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tasks_version_insert AFTER INSERT ON tasks BEGIN "
+                f"{_bump_task_version('new.user_id', 'WHERE true')} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tasks_version_delete AFTER DELETE ON tasks BEGIN "
+                f"{_bump_task_version('old.user_id', 'WHERE true')} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS tasks_version_update AFTER UPDATE ON tasks BEGIN "
+                f"{_bump_task_version('old.user_id', 'WHERE true')} "
+                f"{_bump_task_version('new.user_id', 'WHERE new.user_id IS NOT old.user_id')} END")
+
+# migraciones versionadas: la posición en la lista es la versión (PRAGMA user_version)
+MIGRATIONS = [
+    _migrate_legacy_columns,  # 1
+    _add_lookup_indexes,      # 2
+    _add_task_status_index,   # 3
+    _add_task_search,         # 4
+    _add_reminder_claims,     # 5
+    _add_timezones,           # 6
+    _add_digest_settings,     # 7
+    _add_task_versions,       # 8
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def init_db():
+    # camino rápido: con el esquema al día basta leer user_version (sin transacción de escritura)
+    with _read() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            return
+    with _write() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """ 
+        CREATE TABLE IF NOT EXISTS tasks(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """
+        )
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            task_id INTEGER,
+            remind_at TEXT NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0,
+            repeat TEXT DEFAULT NULL
+        )
+        """
+        )
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            # sqlite3 no abre transacción para DDL (los ALTER se confirmarían solos y un fallo
+            # dejaría columnas nuevas con la versión vieja): cada migración y su user_version
+            # van en una transacción explícita, que el rollback de _write() deshace entera
+            cur.execute("BEGIN IMMEDIATE")
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {target}")
+            cur.execute("COMMIT")
+
+@metrics.timed_query
 def add_task(user_id: str, text: str, created_at: str) -> int:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO tasks (user_id, text, done, created_at) VALUES (?, ?, 0, ?)",
-                (user_id, text, created_at))
-    task_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return task_id
-
-def list_task(user_id:str) -> List[Dict[str, Any]]:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, text, done, created_at FROM tasks WHERE user_id = ? ORDER BY id", (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return [{"id": r[0], "text": r[1], "done": bool(r[2]), "created_at": r[3]} for r in rows]
+    with _write() as conn:
+        cur = conn.execute("INSERT INTO tasks (user_id, text, done, created_at) VALUES (?, ?, 0, ?)",
+                           (user_id, text, created_at))
+        return cur.lastrowid
 
-def get_task(user_id: str, task_id: int) -> Optional[dict[str, Any]]:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, text, done, created_at FROM tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
-    r = cur.fetchone()
-    conn.close()
-    if not r:
+@metrics.timed_query
+def add_tasks(user_id: str, texts: List[str], created_at: str) -> List[int]:
+    """Inserta varias tareas en una sola transacción; devuelve sus ids."""
+    ids = []
+    with _write() as conn:
+        for text in texts:
+            cur = conn.execute("INSERT INTO tasks (user_id, text, done, created_at) VALUES (?, ?, 0, ?)",
+                               (user_id, text, created_at))
+            ids.append(cur.lastrowid)
+    return ids
+
+@metrics.timed_query
+def list_task(user_id:str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+              limit: Optional[int] = None, done: Optional[bool] = None) -> List[models.Task]:
+    """
+    Tareas del usuario ordenadas por id. Paginación por keyset: `after_id`
+    devuelve la página siguiente y `before_id` la anterior (ambas en orden ascendente).
+    """
+    sql = "SELECT id, text, done, created_at FROM tasks WHERE user_id = ?"
+    params: list = [user_id]
+    if done is not None:
+        sql += " AND done = ?"
+        params.append(1 if done else 0)
+    if before_id is not None:
+        sql += " AND id < ? ORDER BY id DESC"
+        params.append(before_id)
+    else:
+        if after_id is not None:
+            sql += " AND id > ?"
+            params.append(after_id)
+        sql += " ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with _read() as conn:
+        result = _fetch(conn, models.task_row, sql, params)
+    if before_id is not None:
+        result.reverse()
+    return result
+
+@metrics.timed_query
+def get_task(user_id: str, task_id: int) -> Optional[models.Task]:
+    with _read() as conn:
+        found = _fetch(conn, models.task_row,
+                       "SELECT id, text, done, created_at FROM tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
+    return found[0] if found else None
+
+def _fts_query(user_id: str, query: str) -> Optional[str]:
+    # cada palabra se busca como prefijo; se escapan comillas para no romper la sintaxis FTS5
+    terms = re.findall(r"\w+", query)
+    if not terms:
         return None
-    return{"id": r[0], "text": r[1], "done": bool(r[2]), "created_at": r[3]}
+    words = " ".join('"' + t.replace('"', '""') + '"*' for t in terms)
+    return 'user_id : "' + user_id.replace('"', '""') + '" AND text : (' + words + ')'
+
+@metrics.timed_query
+def search_tasks(user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Búsqueda full-text por prefijo en las tareas del usuario, ordenada por relevancia."""
+    match = _fts_query(user_id, query)
+    if match is None:
+        return []
+    with _read() as conn:
+        rows = conn.execute(
+            """
+            SELECT t.id, t.text, t.done, t.created_at, snippet(tasks_fts, 0, ?, ?, '…', 12)
+            FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH ?
+            ORDER BY bm25(tasks_fts, 1.0, 0.0)
+            LIMIT ?
+            """,
+            (models.SNIPPET_START, models.SNIPPET_END, match, limit),
+        ).fetchall()
+    return [{"id": r[0], "text": r[1], "done": bool(r[2]), "created_at": r[3], "snippet": r[4]} for r in rows]
+
+def _id_chunks(ids, size: int = 500):
+    # SQLite limita los parámetros por sentencia; los IN (...) se hacen por bloques
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+@metrics.timed_query
+def due_reminders(reminder_ids) -> Dict[int, models.DueReminder]:
+    """
+    Recordatorios pendientes de `reminder_ids` con el texto de su tarea, en una
+    consulta por bloque (id -> fila). Los enviados o borrados no aparecen.
+    """
+    result: Dict[int, models.DueReminder] = {}
+    with _read() as conn:
+        for chunk in _id_chunks(reminder_ids):
+            marks = ",".join("?" * len(chunk))
+            for r in _fetch_as(conn, models.DueReminder,
+                            "SELECT r.id, r.user_id, r.task_id, r.remind_at, r.repeat, r.remind_at_epoch, r.tz, t.text "
+                            "FROM reminders r LEFT JOIN tasks t ON t.id = r.task_id AND t.user_id = r.user_id "
+                            f"WHERE r.id IN ({marks}) AND r.sent = 0", chunk):
+                result[r.id] = r
+    return result
+
+@metrics.timed_query
+def count_tasks(user_id: str) -> int:
+    with _read() as conn:
+        return conn.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ?", (user_id,)).fetchone()[0]
 
+@metrics.timed_query
+def task_version(user_id: str) -> int:
+    """Contador que cambia con cada escritura en las tareas del usuario (0 si nunca tuvo)."""
+    with _read() as conn:
+        row = conn.execute("SELECT version FROM task_versions WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+@metrics.timed_query
 def edit_task(user_id: str, task_id: int, new_text: str) -> bool:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET text = ? WHERE user_id = ? AND id = ?", (new_text, user_id, task_id))
-    changed = cur.rowcount
-    conn.commit()
-    conn.close()
-    return changed > 0
+    with _write() as conn:
+        cur = conn.execute("UPDATE tasks SET text = ? WHERE user_id = ? AND id = ?", (new_text, user_id, task_id))
+        return cur.rowcount > 0
 
+@metrics.timed_query
 def delete_task(user_id: str, task_id: int) -> bool:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
-    changed = cur.rowcount
-    conn.commit()
-    conn.close()
-    return changed > 0
+    with _write() as conn:
+        cur = conn.execute("DELETE FROM tasks WHERE user_id = ? AND id = ?", (user_id, task_id))
+        return cur.rowcount > 0
 
+@metrics.timed_query
 def set_task_done(user_id: str, task_id: int, done: bool) -> bool:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET done = ? WHERE user_id = ? AND id = ?", (1 if done else 0, user_id, task_id))
-    changed = cur.rowcount
-    conn.commit()
-    conn.close()
-    return changed > 0
-
-def add_reminder(user_id: str, task_id: Optional[int], remind_at: str, repeat: Optional[str] = None) -> int:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO reminders (user_id, task_id, remind_at, sent, repeat) VALUES (?, ?, ?, 0, ?)",
-                (user_id, task_id, remind_at, repeat))
-    rid = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return rid
-
-def list_reminders(user_id: str) -> list[dict[str, Any]]:
-    conn= _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, task_id, remind_at, sent, repeat FROM reminders WHERE user_id = ? ORDER BY remind_at", (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return[{"id": r[0], "task_id": r[1], "remind_at": r[2], "sent": bool(r[3]), "repeat": r[4]} for r in rows]
+    with _write() as conn:
+        cur = conn.execute("UPDATE tasks SET done = ? WHERE user_id = ? AND id = ?",
+                           (1 if done else 0, user_id, task_id))
+        return cur.rowcount > 0
+
+@metrics.timed_query
+def set_tasks_done(user_id: str, task_ids: List[int], done: bool) -> int:
+    changed = 0
+    with _write() as conn:
+        for chunk in _id_chunks(task_ids):
+            marks = ",".join("?" * len(chunk))
+            cur = conn.execute(f"UPDATE tasks SET done = ? WHERE user_id = ? AND id IN ({marks})",
+                               [1 if done else 0, user_id, *chunk])
+            changed += cur.rowcount
+    return changed
+
+@metrics.timed_query
+def delete_tasks(user_id: str, task_ids: List[int]) -> int:
+    changed = 0
+    with _write() as conn:
+        for chunk in _id_chunks(task_ids):
+            marks = ",".join("?" * len(chunk))
+            cur = conn.execute(f"DELETE FROM tasks WHERE user_id = ? AND id IN ({marks})", [user_id, *chunk])
+            changed += cur.rowcount
+    return changed
 
+@metrics.timed_query
+def clear_completed(user_id: str) -> int:
+    with _write() as conn:
+        cur = conn.execute("DELETE FROM tasks WHERE user_id = ? AND done = 1", (user_id,))
+        return cur.rowcount
+
+@metrics.timed_query
+def add_reminder(user_id: str, task_id: Optional[int], remind_at: str, remind_at_epoch: int,
+                 repeat: Optional[str] = None, tz: str = timezones.DEFAULT_TZ) -> int:
+    """`remind_at` es la hora local en `tz` (como la escribió el usuario); `remind_at_epoch`, el instante UTC."""
+    with _write() as conn:
+        cur = conn.execute("INSERT INTO reminders (user_id, task_id, remind_at, sent, repeat, remind_at_epoch, tz) "
+                           "VALUES (?, ?, ?, 0, ?, ?, ?)",
+                           (user_id, task_id, remind_at, repeat, remind_at_epoch, tz))
+        return cur.lastrowid
+
+@metrics.timed_query
+def list_reminders(user_id: str) -> List[models.Reminder]:
+    with _read() as conn:
+        return _fetch(conn, models.reminder_row, "SELECT id, task_id, remind_at, sent, repeat, remind_at_epoch, tz "
+                      "FROM reminders WHERE user_id = ? ORDER BY remind_at_epoch", (user_id,))
+
+@metrics.timed_query
+def count_pending_reminders(user_id: str) -> int:
+    with _read() as conn:
+        return conn.execute("SELECT COUNT(*) FROM reminders WHERE user_id = ? AND sent = 0", (user_id,)).fetchone()[0]
+
+@metrics.timed_query
 def delete_reminder(reminder_id: int):
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
-    changed = cur.rowcount
-    conn.commit()
-    conn.close()
-    return changed > 0
+    with _write() as conn:
+        cur = conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+        return cur.rowcount > 0
 
+@metrics.timed_query
 def mark_reminder_sent(reminder_id: int):
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE reminders SET sent = 1 WHERE id = ?", (reminder_id,))
-    conn.commit()
-    conn.close()
+    with _write() as conn:
+        conn.execute("UPDATE reminders SET sent = 1 WHERE id = ?", (reminder_id,))
 
 
-def update_reminder_time(reminder_id: int, new_remind_at: str):
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE reminders SET remind_at = ?, sent = 0 WHERE id = ?", (new_remind_at, reminder_id))
-    conn.commit()
-    conn.close()
+@metrics.timed_query
+def update_reminder_time(reminder_id: int, new_remind_at: str, new_remind_at_epoch: int):
+    with _write() as conn:
+        conn.execute("UPDATE reminders SET remind_at = ?, remind_at_epoch = ?, sent = 0 WHERE id = ?",
+                     (new_remind_at, new_remind_at_epoch, reminder_id))
 
-def pending_reminders() -> list[Dict[str,Any]]:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, user_id, task_id, remind_at, repeat FROM reminders WHERE sent = 0")
-    rows = cur.fetchall()
-    conn.close()
-    return [{"id": r[0], "user_id": r[1], "task_id": r[2], "remind_at": r[3], "repeat": r[4]} for r in rows]
\ No newline at end of file
+@metrics.timed_query
+def apply_reminder_updates(sent_ids, reschedules):
+    """
+    Aplica en una única transacción un lote de cambios de estado:
+    `sent_ids` se marcan como enviados y `reschedules` son tuplas (remind_at, remind_at_epoch, id).
+    """
+    with _write() as conn:
+        if sent_ids:
+            conn.executemany("UPDATE reminders SET sent = 1, claimed_by = NULL, claim_expires = NULL WHERE id = ?",
+                             [(rid,) for rid in sent_ids])
+        if reschedules:
+            conn.executemany("UPDATE reminders SET remind_at = ?, remind_at_epoch = ?, sent = 0, "
+                             "claimed_by = NULL, claim_expires = NULL WHERE id = ?", reschedules)
+
+@metrics.timed_query
+def claim_reminders(worker_id: str, items, lease_seconds: float, now: float):
+    """
+    Reclama los recordatorios `items` [(id, remind_at_epoch)] para `worker_id`.
+    Devuelve (reclamados, tomados): los primeros estaban libres (o ya eran
+    de este worker); los segundos tenían un lease vencido de otro worker.
+    Exigir el mismo remind_at_epoch evita disparar una ocurrencia que otro worker ya avanzó.
+    """
+    claimed, taken_over = [], []
+    expires = now + lease_seconds
+    with _write() as conn:
+        for rid, remind_at_epoch in items:
+            cur = conn.execute(
+                "UPDATE reminders SET claimed_by = ?, claim_expires = ? "
+                "WHERE id = ? AND remind_at_epoch = ? AND sent = 0 AND (claimed_by IS NULL OR claimed_by = ?)",
+                (worker_id, expires, rid, remind_at_epoch, worker_id),
+            )
+            if cur.rowcount:
+                claimed.append(rid)
+                continue
+            cur = conn.execute(
+                "UPDATE reminders SET claimed_by = ?, claim_expires = ? "
+                "WHERE id = ? AND remind_at_epoch = ? AND sent = 0 AND claim_expires < ?",
+                (worker_id, expires, rid, remind_at_epoch, now),
+            )
+            if cur.rowcount:
+                taken_over.append(rid)
+    return claimed, taken_over
+
+@metrics.timed_query
+def release_claims(worker_id: str) -> int:
+    """Libera los leases de este worker que sigan pendientes (al apagar)."""
+    with _write() as conn:
+        cur = conn.execute("UPDATE reminders SET claimed_by = NULL, claim_expires = NULL "
+                           "WHERE claimed_by = ? AND sent = 0", (worker_id,))
+        return cur.rowcount
+
+@metrics.timed_query
+def pending_reminders(limit: Optional[int] = None, worker_id: Optional[str] = None,
+                      now: Optional[float] = None, after: Optional[tuple] = None) -> List[models.PendingReminder]:
+    """
+    Recordatorios no enviados ordenados por (remind_at_epoch, id), sin los de usuarios en
+    modo resumen (esos los envía el job de digest). Con `worker_id` se omiten los que
+    tienen un lease vigente de otro worker; `after` = (remind_at_epoch, id) de la
+    última fila leída devuelve el bloque siguiente (keyset).
+    """
+    sql = ("SELECT id, user_id, task_id, remind_at, repeat, remind_at_epoch, tz FROM reminders WHERE sent = 0 "
+           "AND user_id NOT IN (SELECT user_id FROM user_settings WHERE digest_at IS NOT NULL)")
+    params: list = []
+    if worker_id is not None:
+        sql += " AND (claimed_by IS NULL OR claimed_by = ? OR claim_expires < ?)"
+        params += [worker_id, now]
+    if after is not None:
+        sql += " AND (remind_at_epoch, id) > (?, ?)"
+        params += list(after)
+    sql += " ORDER BY remind_at_epoch, id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with _read() as conn:
+        return _fetch_as(conn, models.PendingReminder, sql, params)
+
+@metrics.timed_query
+def get_user_settings(user_id: str) -> Optional[Dict[str, Any]]:
+    with _read() as conn:
+        r = conn.execute("SELECT tz, digest_at, digest_next FROM user_settings WHERE user_id = ?",
+                         (user_id,)).fetchone()
+    return {"tz": r[0], "digest_at": r[1], "digest_next": r[2]} if r else None
+
+@metrics.timed_query
+def set_user_timezone(user_id: str, tz: str):
+    with _write() as conn:
+        conn.execute("INSERT INTO user_settings (user_id, tz) VALUES (?, ?) "
+                     "ON CONFLICT(user_id) DO UPDATE SET tz = excluded.tz", (user_id, tz))
+
+@metrics.timed_query
+def set_digest(user_id: str, digest_at: Optional[str], digest_next: Optional[int]):
+    """Activa (hora local 'HH:MM' y próximo envío) o desactiva (None) el modo resumen."""
+    with _write() as conn:
+        conn.execute("INSERT INTO user_settings (user_id, digest_at, digest_next) VALUES (?, ?, ?) "
+                     "ON CONFLICT(user_id) DO UPDATE SET digest_at = excluded.digest_at, "
+                     "digest_next = excluded.digest_next", (user_id, digest_at, digest_next))
+
+@metrics.timed_query
+def due_digests(now: float, limit: int) -> List[Dict[str, Any]]:
+    """Usuarios cuyo resumen vence antes de `now`, ordenados por vencimiento."""
+    with _read() as conn:
+        rows = conn.execute("SELECT user_id, tz, digest_at, digest_next FROM user_settings "
+                            "WHERE digest_at IS NOT NULL AND digest_next <= ? ORDER BY digest_next LIMIT ?",
+                            (now, limit)).fetchall()
+    return [{"user_id": r[0], "tz": r[1], "digest_at": r[2], "digest_next": r[3]} for r in rows]
+
+@metrics.timed_query
+def claim_digests(items) -> List[str]:
+    """
+    Avanza digest_next de cada (user_id, digest_next, siguiente) solo si no cambió:
+    el worker que lo consigue es el que envía ese resumen. Devuelve los user_id reclamados.
+    """
+    claimed = []
+    with _write() as conn:
+        for user_id, digest_next, new_next in items:
+            cur = conn.execute("UPDATE user_settings SET digest_next = ? "
+                               "WHERE user_id = ? AND digest_next = ? AND digest_at IS NOT NULL",
+                               (new_next, user_id, digest_next))
+            if cur.rowcount:
+                claimed.append(user_id)
+    return claimed
+
+@metrics.timed_query
+def digest_contents(items, task_limit: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Contenido de los resúmenes de varios usuarios en una sola consulta agregada.
+    `items` son pares (user_id, hasta): recordatorios pendientes con remind_at_epoch < hasta
+    (con el texto de su tarea), número de tareas pendientes y las primeras `task_limit`.
+    """
+    # json_extract en lugar de ->> (SQLite 3.38+): funciona con el SQLite de cualquier Python 3
+    due = json.dumps([[user_id, until] for user_id, until in items])
+    with _read() as conn:
+        rows = conn.execute(
+            """
+            SELECT json_extract(d.value, '$[0]') AS uid,
+                (SELECT json_group_array(json_array(r.id, r.task_id, r.remind_at, r.remind_at_epoch,
+                                                    r.repeat, r.tz, t.text))
+                 FROM (SELECT * FROM reminders
+                       WHERE user_id = json_extract(d.value, '$[0]') AND sent = 0
+                         AND remind_at_epoch < json_extract(d.value, '$[1]')
+                       ORDER BY remind_at_epoch, id) r
+                 LEFT JOIN tasks t ON t.id = r.task_id AND t.user_id = r.user_id),
+                (SELECT COUNT(*) FROM tasks WHERE user_id = json_extract(d.value, '$[0]') AND done = 0),
+                (SELECT json_group_array(json_array(p.id, p.text))
+                 FROM (SELECT id, text FROM tasks WHERE user_id = json_extract(d.value, '$[0]') AND done = 0
+                       ORDER BY id LIMIT ?) p)
+            FROM json_each(?) d
+            """,
+            (task_limit, due),
+        ).fetchall()
+    result = {}
+    for uid, rems, pending_count, pending in rows:
+        # json_group_array no garantiza el orden de entrada: se reordena aquí
+        rems = sorted(json.loads(rems), key=lambda r: (r[3], r[0]))
+        result[uid] = {
+            "reminders": [{"id": r[0], "user_id": uid, "task_id": r[1], "remind_at": r[2], "remind_at_epoch": r[3],
+                           "repeat": r[4], "tz": r[5], "task_text": r[6]} for r in rems],
+            "pending_count": pending_count,
+            "pending": [{"id": p[0], "text": p[1]} for p in sorted(json.loads(pending))],
+        }
+    return result
+
+# ---------- export / import / snapshot ----------
+def _stream(sql: str, params, chunk: int):
+    # cursor abierto durante toda la lectura (una sola transacción de lectura): fetchmany
+    # trae `chunk` filas cada vez y la memoria no depende del tamaño del resultado
+    with _read() as conn:
+        cur = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cur.close()
+
+def iter_tasks(user_id: Optional[str], chunk: int):
+    """Tareas de `user_id` (o de todos con None) en orden de id, como generador."""
+    sql = "SELECT id, user_id, text, done, created_at FROM tasks"
+    params: tuple = ()
+    if user_id is not None:
+        sql += " WHERE user_id = ?"
+        params = (user_id,)
+    for r in _stream(sql + " ORDER BY id", params, chunk):
+        yield {"id": r[0], "user_id": r[1], "text": r[2], "done": bool(r[3]), "created_at": r[4]}
+
+def iter_reminders(user_id: Optional[str], chunk: int):
+    """Recordatorios de `user_id` (o de todos con None) en orden de id, como generador."""
+    sql = "SELECT id, user_id, task_id, remind_at, remind_at_epoch, tz, repeat, sent FROM reminders"
+    params: tuple = ()
+    if user_id is not None:
+        sql += " WHERE user_id = ?"
+        params = (user_id,)
+    for r in _stream(sql + " ORDER BY id", params, chunk):
+        yield {"id": r[0], "user_id": r[1], "task_id": r[2], "remind_at": r[3], "remind_at_epoch": r[4],
+               "tz": r[5], "repeat": r[6], "sent": bool(r[7])}
+
+@metrics.timed_query
+def import_tasks(rows) -> List[int]:
+    """Inserta en una transacción un lote [(user_id, text, done, created_at)]; devuelve los ids nuevos."""
+    ids = []
+    with _write() as conn:
+        for user_id, text, done, created_at in rows:
+            cur = conn.execute("INSERT INTO tasks (user_id, text, done, created_at) VALUES (?, ?, ?, ?)",
+                               (user_id, text, 1 if done else 0, created_at))
+            ids.append(cur.lastrowid)
+    return ids
+
+@metrics.timed_query
+def import_reminders(rows) -> int:
+    """Inserta en una transacción un lote [(user_id, task_id, remind_at, remind_at_epoch, repeat, tz, sent)]."""
+    with _write() as conn:
+        conn.executemany("INSERT INTO reminders (user_id, task_id, remind_at, remind_at_epoch, repeat, tz, sent) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         [(u, t, at, epoch, rep, tz, 1 if sent else 0) for u, t, at, epoch, rep, tz, sent in rows])
+    return len(rows)
+
+def snapshot(dest: str, pages: int = -1, progress=None):
+    """
+    Copia consistente de toda la DB en `dest` con la API de backup de SQLite.
+    Usa una conexión propia (no ocupa el pool). Con pages=-1 copia en un solo paso
+    dentro de una transacción de lectura: en WAL los escritores no se bloquean.
+    Con pages>0 copia por tramos, pero cada escritura de otra conexión reinicia
+    la copia. Se escribe en `dest`.tmp y se renombra al terminar.
+    """
+    directory = os.path.dirname(dest)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = dest + ".tmp"
+    src = sqlite3.connect(DB_PATH)
+    try:
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(tmp, dest)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import metrics
+import recurrence
+import reminders
+import sender
+import task_manager
+import timezones
+
+# cada cuánto se buscan resúmenes vencidos
+DIGEST_INTERVAL = 60
+# usuarios por lote: una consulta agregada trae el contenido de todo el lote
+DIGEST_BATCH = 5000
+# tareas pendientes y recordatorios listados en cada resumen (el mensaje tiene un máximo de 4096 caracteres)
+DIGEST_TASKS = 10
+DIGEST_MAX_REMINDERS = 40
+MAX_DIGEST_TEXT = 80
+
+logger = logging.getLogger(__name__)
+_PASS = metrics.REGISTRY.histogram("digest_pass_seconds", metrics.LAG_BUCKETS)
+
+
+def _short(text: str) -> str:
+    return text if len(text) <= MAX_DIGEST_TEXT else text[:MAX_DIGEST_TEXT] + "…"
+
+
+def render_digest(content: Dict[str, Any], tz: str) -> Optional[str]:
+    """Texto del resumen de un usuario; None si no hay nada que contar."""
+    rems = content["reminders"]
+    if not rems and not content["pending_count"]:
+        return None
+    lines = ["📋 Resumen del día"]
+    if rems:
+        lines.append("\n⏰ Recordatorios:")
+        for rem in rems[:DIGEST_MAX_REMINDERS]:
+            if rem["task_text"] is not None:
+                what = _short(rem["task_text"])
+            else:
+                what = "Tarea (eliminada)" if rem["task_id"] else "Recordatorio"
+            repeat = f" ({rem['repeat']})" if rem["repeat"] else ""
+            lines.append(f"• {timezones.format_epoch(rem['remind_at_epoch'], tz)} — {what}{repeat}")
+        if len(rems) > DIGEST_MAX_REMINDERS:
+            lines.append(f"… y {len(rems) - DIGEST_MAX_REMINDERS} más")
+    if content["pending_count"]:
+        lines.append(f"\n📝 Tareas pendientes ({content['pending_count']}):")
+        for task in content["pending"]:
+            lines.append(f"{task['id']}. {_short(task['text'])}")
+        if content["pending_count"] > len(content["pending"]):
+            lines.append(f"… y {content['pending_count'] - len(content['pending'])} más (/listtasks pending)")
+    return "\n".join(lines)
+
+
+def _consume(rems: List[Dict[str, Any]], until: int, sent_ids: list, reschedules: list):
+    # los recordatorios incluidos en el resumen quedan enviados; los recurrentes
+    # avanzan a su primera ocurrencia posterior al siguiente resumen
+    until_dt = datetime.fromtimestamp(until, tz=timezone.utc)
+    for rem in rems:
+        if not rem["repeat"]:
+            sent_ids.append(rem["id"])
+            continue
+        try:
+            last = timezones.localize(rem["remind_at"], rem["tz"])
+            nxt = recurrence.next_occurrence(rem["repeat"], last, until_dt)
+        except Exception:
+            sent_ids.append(rem["id"])
+            continue
+        reschedules.append((timezones.wall_time(nxt), int(nxt.timestamp()), rem["id"]))
+
+
+def _sender(app) -> sender.OutboundSender:
+    # comparte el límite de envío con el dispatcher de recordatorios
+    dispatcher = app.bot_data.get(reminders.DISPATCHER_KEY)
+    if dispatcher is not None:
+        return dispatcher.sender
+    return app.bot_data.setdefault("digest_sender", sender.OutboundSender(app.bot))
+
+
+async def send_due_digests(app, now: Optional[float] = None, batch: int = DIGEST_BATCH) -> int:
+    """
+    Envía los resúmenes vencidos, `batch` usuarios por vuelta: se reclaman
+    (avanzando digest_next) y su contenido sale de una única consulta agregada.
+    Devuelve cuántos usuarios se procesaron.
+    """
+    now = time.time() if now is None else now
+    outbound = _sender(app)
+    start = time.perf_counter()
+    processed = 0
+    while True:
+        due = await task_manager.async_due_digests(now, batch)
+        if not due:
+            break
+        next_at = {d["user_id"]: timezones.next_daily(d["digest_at"], d["tz"], now) for d in due}
+        claimed = await task_manager.async_claim_digests(
+            [(d["user_id"], d["digest_next"], next_at[d["user_id"]]) for d in due]
+        )
+        if not claimed:
+            continue
+        tz = {d["user_id"]: d["tz"] for d in due}
+        contents = await task_manager.async_digest_contents([(uid, next_at[uid]) for uid in claimed], DIGEST_TASKS)
+        texts = {uid: render_digest(content, tz[uid]) for uid, content in contents.items()}
+        to_send = [uid for uid, text in texts.items() if text is not None]
+        results = await asyncio.gather(*(outbound.send(int(uid), texts[uid])
+                                         for uid in to_send), return_exceptions=True)
+        failed = set()
+        for uid, result in zip(to_send, results):
+            if isinstance(result, Exception) or result == sender.RETRY:
+                # sus recordatorios siguen pendientes y saldrán en el próximo resumen
+                failed.add(uid)
+                metrics.REGISTRY.inc("digest_errors_total")
+                if isinstance(result, Exception):
+                    logger.error("Error enviando el resumen de %s", uid, exc_info=result)
+        sent_ids, reschedules = [], []
+        for uid, content in contents.items():
+            if uid not in failed:
+                _consume(content["reminders"], next_at[uid], sent_ids, reschedules)
+        if sent_ids or reschedules:
+            await task_manager.async_apply_reminder_updates(sent_ids, reschedules)
+        metrics.REGISTRY.inc("digests_sent_total", len(to_send) - len(failed))
+        processed += len(claimed)
+    if processed:
+        _PASS.observe(time.perf_counter() - start)
+    return processed
+
+
+async def _digest_callback(context):
+    await send_due_digests(context.application)
+
+
+def schedule_digests(app):
+    """Job periódico que envía los resúmenes diarios vencidos."""
+    return app.job_queue.run_repeating(_digest_callback, interval=DIGEST_INTERVAL, first=DIGEST_INTERVAL,
+                                       name="digest")
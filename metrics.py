@@ -0,0 +1,220 @@
+import bisect
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 3600.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Registry:
+    """Histogramas, contadores y gauges (callables) con salida en formato Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], Callable[[], float]] = {}
+
+    def histogram(self, name: str, buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram(buckets))
+        return hist
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, fn: Callable[[], float], **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def totals(self, name: str) -> Tuple[int, float]:
+        """(observaciones, suma) de un histograma, sumando todas sus etiquetas."""
+        count, total = 0, 0.0
+        for (hname, _), hist in list(self._histograms.items()):
+            if hname == name:
+                with hist._lock:
+                    count += hist.count
+                    total += hist.sum
+        return count, total
+
+    def render(self) -> str:
+        out = []
+        typed = set()
+
+        def head(name, kind):
+            if name not in typed:
+                typed.add(name)
+                out.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), hist in sorted(self._histograms.items()):
+            head(name, "histogram")
+            with hist._lock:
+                counts, total, count = list(hist.counts), hist.sum, hist.count
+            cumulative = 0
+            for bound, n in zip(hist.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append(f"{name}_bucket{_fmt_labels(labels + (('le', le),))} {cumulative}")
+            out.append(f"{name}_sum{_fmt_labels(labels)} {total}")
+            out.append(f"{name}_count{_fmt_labels(labels)} {count}")
+        with self._lock:
+            counters = sorted(self._counters.items())
+        for (name, labels), value in counters:
+            head(name, "counter")
+            out.append(f"{name}{_fmt_labels(labels)} {value}")
+        for (name, labels), fn in sorted(self._gauges.items(), key=lambda kv: kv[0]):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            head(name, "gauge")
+            out.append(f"{name}{_fmt_labels(labels)} {value}")
+        return "\n".join(out) + "\n"
+
+
+def _fmt_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+REGISTRY = Registry()
+
+# perfilado por muestreo de handlers lentos (desactivado por defecto)
+PROFILE_HANDLERS: frozenset = frozenset()
+PROFILE_SAMPLE_RATE = 0.01
+SLOW_HANDLER_SECONDS = 1.0
+# un solo cProfile activo a la vez: con updates concurrentes, un segundo enable()
+# falla (ValueError en 3.12+) o mezcla los perfiles; mientras tanto no se muestrea
+_profiling = threading.Lock()
+
+
+def configure_from_env():
+    """
+    METRICS_PORT: puerto del endpoint /metrics (sin definir = desactivado).
+    PROFILE_HANDLERS: comandos a perfilar (separados por coma), con
+    PROFILE_SAMPLE_RATE (fracción de llamadas) y SLOW_HANDLER_SECONDS.
+    """
+    global PROFILE_HANDLERS, PROFILE_SAMPLE_RATE, SLOW_HANDLER_SECONDS
+    handlers = os.getenv("PROFILE_HANDLERS", "")
+    PROFILE_HANDLERS = frozenset(h.strip() for h in handlers.split(",") if h.strip())
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", PROFILE_SAMPLE_RATE))
+    SLOW_HANDLER_SECONDS = float(os.getenv("SLOW_HANDLER_SECONDS", SLOW_HANDLER_SECONDS))
+    port = os.getenv("METRICS_PORT")
+    if port:
+        return start_http_server(int(port), os.getenv("METRICS_HOST", "127.0.0.1"))
+    return None
+
+
+def timed_query(fn):
+    """Decorador para funciones de database: histograma de duración por función."""
+    hist = REGISTRY.histogram("db_query_seconds", function=fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            hist.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_handler(command: str, callback):
+    """Envuelve un handler async: latencia por comando, errores y perfilado opcional."""
+    hist = REGISTRY.histogram("handler_latency_seconds", command=command)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        profiler = None
+        if (command in PROFILE_HANDLERS and random.random() < PROFILE_SAMPLE_RATE
+                and _profiling.acquire(blocking=False)):
+            # cProfile ve todo lo que corre en el hilo del loop mientras espera (best effort)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # otro profiler ajeno al bot ya está activo
+                profiler = None
+                _profiling.release()
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            REGISTRY.inc("handler_errors_total", command=command)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            hist.observe(elapsed)
+            if profiler is not None:
+                profiler.disable()
+                _profiling.release()
+                if elapsed >= SLOW_HANDLER_SECONDS:
+                    _log_profile(command, elapsed, profiler)
+    return wrapper
+
+
+def _log_profile(command: str, elapsed: float, profiler: cProfile.Profile):
+    REGISTRY.inc("slow_handler_profiles_total", command=command)
+    buf = io.StringIO()
+    pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(20)
+    logger.warning("Handler lento /%s (%.3fs):\n%s", command, elapsed, buf.getvalue())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Métricas en http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,65 @@
+"""
+Tipos de fila que devuelven los backends (database.py y storage.py).
+
+Son NamedTuple: ocupan lo mismo que una tupla (sin un dict por fila), se leen
+por atributo (`row.text`) y SQLite los construye directamente con row_factory.
+Son inmutables, así que se pueden compartir con la caché de task_manager.
+"""
+from typing import NamedTuple, Optional
+
+
+class Task(NamedTuple):
+    id: int
+    text: str
+    done: bool
+    created_at: str
+
+
+class Reminder(NamedTuple):
+    """Recordatorio de un usuario, tal como lo lista /listreminders."""
+    id: int
+    task_id: Optional[int]
+    remind_at: str
+    sent: bool
+    repeat: Optional[str]
+    remind_at_epoch: int
+    tz: str
+
+
+class PendingReminder(NamedTuple):
+    """Recordatorio no enviado, para cargar la ventana del dispatcher."""
+    id: int
+    user_id: str
+    task_id: Optional[int]
+    remind_at: str
+    repeat: Optional[str]
+    remind_at_epoch: int
+    tz: str
+
+
+class DueReminder(NamedTuple):
+    """Recordatorio a punto de enviarse, con el texto de su tarea (None si no tiene o se borró)."""
+    id: int
+    user_id: str
+    task_id: Optional[int]
+    remind_at: str
+    repeat: Optional[str]
+    remind_at_epoch: int
+    tz: str
+    task_text: Optional[str]
+
+
+# marcas de las coincidencias en el snippet de search_tasks: caracteres de control que
+# no aparecen en el texto, así quien lo muestre escapa el texto antes de darles formato
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+
+# row_factory de sqlite3: (cursor, tupla) -> fila
+def task_row(_cursor, r) -> Task:
+    return Task(r[0], r[1], bool(r[2]), r[3])
+
+
+def reminder_row(_cursor, r) -> Reminder:
+    return Reminder(r[0], r[1], r[2], bool(r[3]), r[4], r[5], r[6])
+
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class TokenBucket:
+    """Token bucket clásico: `rate` tokens por segundo, ráfagas de hasta `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> float:
+        """Consume un token si hay; si no, devuelve los segundos a esperar (sin consumir)."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class BucketMap:
+    """Un TokenBucket por clave con tamaño acotado (se expulsa la clave menos usada)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        return self.get(key).take(now)
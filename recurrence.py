@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+import math
+import re
+from typing import Optional
+
+# reglas soportadas en la columna `repeat`:
+#   daily | weekly | weekdays (lun-vie) | <N>m | <N>h | <N>d  (cada N minutos/horas/días)
+_FIXED = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+}
+_EVERY_RE = re.compile(r"^(\d+)([mhd])$")
+_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_rule(token: str) -> Optional[str]:
+    """Normaliza un token de repetición; devuelve None si no es una regla válida."""
+    tok = token.strip().lower()
+    if tok in _FIXED or tok == "weekdays":
+        return tok
+    m = _EVERY_RE.match(tok)
+    if m and int(m.group(1)) > 0:
+        return f"{int(m.group(1))}{m.group(2)}"
+    return None
+
+
+def _interval(rule: str) -> Optional[timedelta]:
+    if rule in _FIXED:
+        return _FIXED[rule]
+    m = _EVERY_RE.match(rule)
+    if m:
+        return timedelta(**{_UNITS[m.group(2)]: int(m.group(1))})
+    return None
+
+
+def next_occurrence(rule: str, last: datetime, now: datetime) -> datetime:
+    """
+    Próxima ocurrencia estrictamente posterior a `now`, en O(1): si hubo
+    caída del proceso se salta directo a la siguiente, sin iterar por las perdidas.
+
+    `last` debe venir en la zona del recordatorio: las reglas por días
+    (daily, weekly, weekdays, <N>d) avanzan en hora local y conservan la hora
+    a través de los cambios de horario; <N>m y <N>h son intervalos absolutos.
+    """
+    interval = _interval(rule)
+    if interval is not None and interval < timedelta(days=1):
+        zone = last.tzinfo
+        last = last.astimezone(timezone.utc)
+        steps = max(1, math.floor((now - last) / interval) + 1)
+        return (last + steps * interval).astimezone(zone)
+    if interval is None and rule != "weekdays":
+        raise ValueError(f"regla de repetición desconocida: {rule}")
+    step = interval or timedelta(days=1)
+    # con la misma tzinfo la aritmética de datetime es de hora local (wall clock)
+    local_now = now.astimezone(last.tzinfo) if last.tzinfo is not None else now
+    steps = max(1, math.floor((local_now.replace(tzinfo=None) - last.replace(tzinfo=None)) / step) + 1)
+    nxt = last + steps * step
+    while nxt.timestamp() <= now.timestamp():
+        nxt += step
+    if rule == "weekdays" and nxt.weekday() >= 5:
+        # sábado -> lunes, domingo -> lunes
+        nxt += timedelta(days=7 - nxt.weekday())
+    return nxt
@@ -1,78 +1,370 @@
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import asyncio
-import database
+import heapq
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+import metrics
+import models
+import recurrence
+import sender
+import task_manager
+import timezones
 
-# job callback (async)
-async def _reminder_callback(context):
-    # context.job.data is the reminder dict passed when scheduled
-    job = context.job
-    rem = job.data  # dict with id, user_id, task_id, remind_at
-    chat_id = int(rem["user_id"])
-    reminder_id = rem["id"]
-
-    # build message
-    if rem.get("task_id"):
-        task = database.get_task(rem["user_id"], rem["task_id"])
-        task_text = task["text"] if task else "Tarea (eliminada)"
+# máximo de recordatorios próximos que se mantienen en memoria
+WINDOW_SIZE = 1000
+# al arrancar la ventana se carga por bloques, en segundo plano
+LOAD_CHUNK = 200
+# ventana de group commit para los cambios de estado de recordatorios
+BATCH_DELAY = 0.005
+BATCH_MAX_ITEMS = 200
+# espera antes de reintentar un recordatorio cuyo envío falló transitoriamente
+REDELIVERY_DELAY = 60
+# varios workers comparten la tabla: cada recordatorio se reclama con un lease
+LEASE_SECONDS = 300
+# cada cuánto se relee la ventana de la DB (recordatorios creados por otros workers)
+POLL_INTERVAL = 30
+DISPATCHER_KEY = "reminder_dispatcher"
+
+logger = logging.getLogger(__name__)
+# retraso real de envío respecto a remind_at
+_LAG = metrics.REGISTRY.histogram("reminder_lag_seconds", metrics.LAG_BUCKETS)
+
+
+async def _deliver(outbound: sender.OutboundSender, rem: models.DueReminder) -> str:
+    chat_id = int(rem.user_id)
+
+    # build message (el texto de la tarea llega en la misma consulta que el recordatorio)
+    if rem.task_id:
+        task_text = rem.task_text if rem.task_text is not None else "Tarea (eliminada)"
         text = f"⏰ Recordatorio: {task_text}"
     else:
         text = f"⏰ Recordatorio programado."
 
-    # send message
-    try:
-        await context.bot.send_message(chat_id=chat_id, text=text)
-    except Exception:
-        # si falla el envío, aún marcamos como enviado para no reintentar infinito
-        pass
-
-    # manejar repetición: si tiene 'repeat' no marcamos como enviado definitivamente,
-    # actualizamos la próxima fecha; si no tiene repeat, marcamos como enviado
-    repeat = rem.get("repeat")
-    if repeat in ("daily", "weekly"):
+    return await outbound.send(chat_id, text)
+
+
+class ReminderStateBatcher:
+    """
+    Group commit de los cambios de estado (enviado / próxima fecha): los
+    cambios que llegan dentro de `delay` segundos, o hasta `max_items`, se
+    escriben con executemany en una sola transacción. Cada llamada espera a
+    que su lote esté confirmado (COMMIT). Con WAL y synchronous=NORMAL (ver
+    database._PRAGMAS) el commit sobrevive a que el proceso muera, pero no a un
+    corte de luz o una caída del sistema operativo: el fsync solo se hace en
+    los checkpoints, así que se pueden perder las últimas transacciones.
+    En ambos casos (proceso muerto antes del commit, o commit perdido) el
+    recordatorio sigue pendiente y puede volver a enviarse una vez.
+    """
+
+    def __init__(self, delay: float = BATCH_DELAY, max_items: int = BATCH_MAX_ITEMS):
+        self.delay = delay
+        self.max_items = max_items
+        self._sent: List[int] = []
+        self._reschedules: List[Tuple[str, int, int]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._waiters)
+
+    async def mark_sent(self, reminder_id: int):
+        self._sent.append(reminder_id)
+        await self._enqueue()
+
+    async def reschedule(self, reminder_id: int, remind_at: str, remind_at_epoch: int):
+        self._reschedules.append((remind_at, remind_at_epoch, reminder_id))
+        await self._enqueue()
+
+    async def _enqueue(self):
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        if len(self._waiters) >= self.max_items:
+            loop.create_task(self.flush())
+        elif self._timer is None:
+            self._timer = loop.call_later(self.delay, lambda: loop.create_task(self.flush()))
+        await waiter
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        sent, reschedules, waiters = self._sent, self._reschedules, self._waiters
+        self._sent, self._reschedules, self._waiters = [], [], []
+        if not waiters:
+            return
+        async with self._lock:
+            try:
+                await task_manager.async_apply_reminder_updates(sent, reschedules)
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class ReminderDispatcher:
+    """
+    Un único job en job_queue que despierta en el próximo vencimiento.
+    Solo los `window` recordatorios más próximos viven en memoria (min-heap),
+    y de cada uno solo el id y el vencimiento: la fila completa se lee de la DB
+    al dispararlo. El resto se lee en orden de remind_at_epoch cuando hace falta.
+
+    Con varios workers sobre la misma DB, antes de enviar cada recordatorio
+    se reclama en la tabla (claimed_by / claim_expires); solo el worker que
+    lo reclama lo envía. Si un worker cae con un lease tomado, otro lo recupera
+    al vencer el lease pero no lo reenvía (no se sabe si llegó a enviarse):
+    lo cierra o avanza su repetición. Así cada ocurrencia se envía como mucho una vez.
+    """
+
+    def __init__(self, app, window: int = WINDOW_SIZE, worker_id: Optional[str] = None):
+        self.app = app
+        self.window = window
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # (vencimiento, id); las entradas borradas o reprogramadas se descartan al salir
+        self._heap: List[Tuple[float, int]] = []
+        # id -> remind_at_epoch (el que se exige al reclamar)
+        self._entries: Dict[int, int] = {}
+        # id -> instante del reintento, para los que fallaron transitoriamente
+        self._retry_at: Dict[int, float] = {}
+        self._inflight: set = set()
+        # último vencimiento cargado cuando la ventana está llena; None = todo está en memoria
+        self._horizon: Optional[float] = None
+        self._job = None
+        self._armed_at: Optional[float] = None
+        self.sender = sender.OutboundSender(app.bot)
+        self.batcher = ReminderStateBatcher()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, rows: List[models.PendingReminder]):
+        """Carga una ventana de filas pendientes (ordenadas por remind_at_epoch)."""
+        self._horizon = None
+        self._load_rows(rows)
+        if len(rows) >= self.window and rows:
+            self._horizon = rows[-1].remind_at_epoch
+        self._arm()
+
+    async def warm_up(self, chunk: int = LOAD_CHUNK):
+        """
+        Carga la ventana inicial por bloques de `chunk` filas sin bloquear el arranque:
+        cada bloque se lee en el executor y se arma el job en cuanto hay algo vencido.
+        """
+        self._horizon = None
+        after = None
+        loaded = 0
+        while loaded < self.window:
+            limit = min(chunk, self.window - loaded)
+            rows = await task_manager.async_get_pending_reminders(limit, self.worker_id, time.time(), after)
+            self._load_rows(rows)
+            self._arm()
+            loaded += len(rows)
+            if len(rows) < limit:
+                return
+            after = (rows[-1].remind_at_epoch, rows[-1].id)
+            await asyncio.sleep(0)
+        self._horizon = after[0]
+
+    def _load_rows(self, rows: List[models.PendingReminder]):
+        for rem in rows:
+            if rem.id in self._inflight or rem.id in self._entries:
+                continue
+            self._push(rem.id, rem.remind_at_epoch)
+
+    def add(self, reminder_id: int, remind_at_epoch: int) -> bool:
+        """Agrega (o reprograma) un recordatorio sin tocar los demás."""
+        if self._horizon is not None and remind_at_epoch > self._horizon:
+            # fuera de la ventana: se cargará desde la DB cuando toque
+            self.discard(reminder_id)
+            return False
+        self._push(reminder_id, remind_at_epoch)
+        self._arm()
+        return True
+
+    def discard(self, reminder_id: int):
+        # borrado perezoso: la entrada del heap se ignora al salir
+        self._entries.pop(reminder_id, None)
+        self._retry_at.pop(reminder_id, None)
+
+    def _push(self, reminder_id: int, remind_at_epoch: int, retry_at: Optional[float] = None):
+        self._entries[reminder_id] = remind_at_epoch
+        if retry_at is None:
+            self._retry_at.pop(reminder_id, None)
+            heapq.heappush(self._heap, (remind_at_epoch, reminder_id))
+        else:
+            self._retry_at[reminder_id] = retry_at
+            heapq.heappush(self._heap, (retry_at, reminder_id))
+
+    def _peek(self) -> Optional[float]:
+        # descarta entradas borradas o reprogramadas
+        while self._heap:
+            when, rid = self._heap[0]
+            epoch = self._entries.get(rid)
+            if epoch is not None and self._retry_at.get(rid, epoch) == when:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: float) -> List[Tuple[int, int]]:
+        """Saca los vencidos como (id, remind_at_epoch)."""
+        due = []
+        while True:
+            when = self._peek()
+            if when is None or when > now:
+                break
+            _, rid = heapq.heappop(self._heap)
+            self._retry_at.pop(rid, None)
+            due.append((rid, self._entries.pop(rid)))
+        return due
+
+    def _arm(self):
+        when = self._peek()
+        if when is None:
+            return
+        if self._job is not None:
+            if self._armed_at is not None and self._armed_at <= when:
+                return
+            self._job.schedule_removal()
+        delay = max(0.0, when - time.time())
+        self._armed_at = when
+        self._job = self.app.job_queue.run_once(
+            _reminder_callback, when=delay, data=self, name="reminder-dispatcher"
+        )
+
+    async def _fire(self, rem: models.DueReminder):
+        result = await _deliver(self.sender, rem)
+        if result == sender.RETRY:
+            # no se pudo entregar: sigue pendiente (y reclamado por este worker), se reintenta más tarde
+            self._push(rem.id, rem.remind_at_epoch, time.time() + REDELIVERY_DELAY)
+            self._arm()
+            return
+        if result == sender.SENT:
+            _LAG.observe(max(0.0, time.time() - rem.remind_at_epoch))
+        await self._finalize(rem)
+
+    async def _finalize(self, rem: models.DueReminder):
+        reminder_id = rem.id
+        # manejar repetición: si tiene 'repeat' no marcamos como enviado definitivamente,
+        # calculamos la próxima fecha y la reprogramamos en DB y en memoria
+        rule = rem.repeat
+        if not rule:
+            await self.batcher.mark_sent(reminder_id)
+            return
         try:
-            # calcular siguiente ocurrencia
-            s = rem["remind_at"].strip().replace(" ", "T")
-            dt = datetime.fromisoformat(s)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            if repeat == "daily":
-                next_dt = dt + timedelta(days=1)
-            else:
-                next_dt = dt + timedelta(weeks=1)
-            # guardar próxima fecha en DB (ISO format)
-            next_iso = next_dt.isoformat()
-            database.update_reminder_time(reminder_id, next_iso)
+            # la repetición se calcula en hora local de la zona del recordatorio (DST incluido)
+            last = timezones.localize(rem.remind_at, rem.tz)
+            next_dt = recurrence.next_occurrence(rule, last, datetime.now(timezone.utc))
         except Exception:
             # si hay error calculando, marcar como enviado para evitar bucle
-            database.mark_reminder_sent(reminder_id)
-    else:
-        # marcar como enviado
-        database.mark_reminder_sent(reminder_id)
+            await self.batcher.mark_sent(reminder_id)
+            return
+        next_iso = timezones.wall_time(next_dt)
+        next_epoch = int(next_dt.timestamp())
+        await self.batcher.reschedule(reminder_id, next_iso, next_epoch)
+        # solo tras persistir en DB se agenda la próxima ocurrencia
+        self.add(reminder_id, next_epoch)
+
+    async def dispatch_due(self):
+        self._job = None
+        self._armed_at = None
+        now = time.time()
+        due = self._pop_due(now)
+        ids = [rid for rid, _ in due]
+        self._inflight.update(ids)
+        try:
+            rems = await self._claim(due, now) if due else []
+            results = await asyncio.gather(*(self._fire(rem) for rem in rems), return_exceptions=True)
+            for rem, result in zip(rems, results):
+                if isinstance(result, Exception):
+                    metrics.REGISTRY.inc("reminder_errors_total")
+                    logger.error("Error enviando recordatorio %s", rem.id, exc_info=result)
+        finally:
+            self._inflight.difference_update(ids)
+        if self._horizon is not None and len(self._entries) < self.window // 2:
+            await self.refresh()
+        else:
+            self._arm()
+
+    async def _claim(self, due: List[Tuple[int, int]], now: float) -> List[models.DueReminder]:
+        """Reclama los vencidos [(id, remind_at_epoch)]; devuelve las filas que este worker debe enviar."""
+        claimed, taken_over = await task_manager.async_claim_reminders(self.worker_id, due, LEASE_SECONDS, now)
+        if not claimed and not taken_over:
+            return []
+        # la fila completa y el texto de la tarea se leen ahora, en una sola consulta
+        rems = await task_manager.async_due_reminders(claimed + taken_over)
+        for rid in taken_over:
+            # lease vencido de un worker caído: pudo haberse enviado, no se reenvía
+            metrics.REGISTRY.inc("reminder_takeovers_total")
+            logger.warning("Recordatorio %s recuperado de un worker caído; se omite el envío", rid)
+            if rid in rems:
+                await self._finalize(rems[rid])
+        return [rems[rid] for rid in claimed if rid in rems]
+
+    async def refresh(self):
+        """Relee la ventana de la DB (incluye lo creado por otros workers)."""
+        self.load(await task_manager.async_get_pending_reminders(self.window, self.worker_id, time.time()))
+
+    async def release(self):
+        await self.batcher.flush()
+        await task_manager.async_release_claims(self.worker_id)
+
+
+# job callback (async)
+async def _reminder_callback(context):
+    # context.job.data es el dispatcher que programó este despertar
+    await context.job.data.dispatch_due()
+
+
+async def _poll_callback(context):
+    await context.job.data.refresh()
+
+
+async def _warm_up_callback(context):
+    await context.job.data.warm_up()
 
 
 def schedule_pending_reminders(app):
     """
-    Lee recordatorios pendientes de DB y los programa en job_queue.
-    Debe llamarse después de crear app (para acceder a app.job_queue).
+    Crea el dispatcher y programa la carga de la ventana de recordatorios pendientes.
+    Debe llamarse después de crear app (para acceder a app.job_queue). La lectura
+    de la DB no ocurre aquí: corre como job al arrancar, junto con los primeros updates.
     """
-    pending = database.pending_reminders()
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    dispatcher = ReminderDispatcher(app)
+    app.bot_data[DISPATCHER_KEY] = dispatcher
+    metrics.REGISTRY.gauge("job_queue_jobs", lambda: len(app.job_queue.jobs()))
+    metrics.REGISTRY.gauge("reminders_in_memory", lambda: len(dispatcher))
+    metrics.REGISTRY.gauge("reminder_writes_pending", lambda: len(dispatcher.batcher))
+    app.job_queue.run_once(_warm_up_callback, when=0, data=dispatcher, name="reminder-warm-up")
+    app.job_queue.run_repeating(_poll_callback, interval=POLL_INTERVAL, first=POLL_INTERVAL,
+                                data=dispatcher, name="reminder-poll")
+    return dispatcher
+
+
+def schedule_reminder(app, reminder_id: int, remind_at_epoch: int):
+    """Programa un recordatorio recién creado en el dispatcher existente."""
+    dispatcher = app.bot_data.get(DISPATCHER_KEY)
+    if dispatcher is None:
+        dispatcher = schedule_pending_reminders(app)
+    dispatcher.add(reminder_id, remind_at_epoch)
+
+
+def unschedule_reminder(app, reminder_id: int):
+    dispatcher = app.bot_data.get(DISPATCHER_KEY)
+    if dispatcher is not None:
+        dispatcher.discard(reminder_id)
 
-    for rem in pending:
-        try:
-            # Parse remind_at (we expect ISO-like string, aceptamos espacio o 'T')
-            s = rem["remind_at"].strip().replace(" ", "T")
-            dt = datetime.fromisoformat(s)
-            # Si no tiene tzinfo, asumimos UTC
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            delay = (dt - now).total_seconds()
-            if delay < 0:
-                delay = 1  # ejecutar pronto si ya pasó
-        except Exception:
-            # formato inválido -> marcar como enviado para no bloquear
-            database.mark_reminder_sent(rem["id"])
-            continue
 
-        # programar job
-        app.job_queue.run_once(_reminder_callback, when=delay, data=rem)
\ No newline at end of file
+async def flush_pending_writes(app):
+    """Al apagar: confirma los cambios del batcher y libera los leases de este worker."""
+    dispatcher = app.bot_data.get(DISPATCHER_KEY)
+    if dispatcher is not None:
+        await dispatcher.release()
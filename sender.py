@@ -0,0 +1,81 @@
+import asyncio
+import os
+from datetime import timedelta
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+import metrics
+from ratelimit import BucketMap, TokenBucket
+
+# límites de Telegram: ~30 mensajes/s en total y ~1 mensaje/s por chat
+# (SEND_RATE: con varios workers, repartir el total entre ellos)
+GLOBAL_RATE = float(os.getenv("SEND_RATE", "30"))
+PER_CHAT_RATE = 1
+MAX_CONCURRENT_SENDS = 8
+MAX_RETRIES = 4
+BASE_BACKOFF = 0.5
+
+# resultados de OutboundSender.send
+SENT = "sent"
+RETRY = "retry"      # error transitorio tras agotar reintentos: volver a intentar más tarde
+DROPPED = "dropped"  # error permanente (chat bloqueado, inexistente...): no reintentar
+
+
+def _seconds(value) -> float:
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class OutboundSender:
+    """
+    Cola de salida hacia Telegram: limita la tasa global y por chat, acota
+    los envíos simultáneos y reintenta con backoff ante RetryAfter/errores de red.
+    """
+
+    def __init__(self, bot, global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE,
+                 max_concurrent: int = MAX_CONCURRENT_SENDS, max_retries: int = MAX_RETRIES,
+                 base_backoff: float = BASE_BACKOFF):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._global = TokenBucket(global_rate)
+        self._per_chat = BucketMap(per_chat_rate, capacity=1)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.stats = {SENT: 0, RETRY: 0, DROPPED: 0, "retries": 0}
+
+    @staticmethod
+    async def _take(take, *args):
+        while True:
+            wait = take(*args)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> str:
+        result = await self._send(chat_id, text, **kwargs)
+        self.stats[result] += 1
+        metrics.REGISTRY.inc("outbound_messages_total", result=result)
+        return result
+
+    async def _send(self, chat_id: int, text: str, **kwargs) -> str:
+        for attempt in range(self.max_retries + 1):
+            # el token del chat se espera fuera del semáforo: un chat con muchos
+            # mensajes no ocupa huecos de envío mientras espera su turno
+            await self._take(self._per_chat.take, chat_id)
+            async with self._slots:
+                await self._take(self._global.take)
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    return SENT
+                except RetryAfter as e:
+                    delay = _seconds(e.retry_after)
+                except (Forbidden, BadRequest):
+                    return DROPPED
+                except NetworkError:
+                    delay = self.base_backoff * (2 ** attempt)
+                except TelegramError:
+                    return DROPPED
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                metrics.REGISTRY.inc("outbound_retries_total")
+                await asyncio.sleep(delay)
+        return RETRY
@@ -0,0 +1,632 @@
+"""
+Backends de almacenamiento para tareas y recordatorios.
+
+`Storage` describe las operaciones que usan task_manager y el dispatcher.
+`SQLiteStorage` es la implementación de siempre (database.py) y
+`MemoryStorage` guarda todo en dicts e índices ordenados, sin disco: sirve
+para pruebas y benchmarks. El backend se elige con `STORAGE_BACKEND`
+(sqlite | memory) al construir la Application (ver bot.main).
+"""
+import bisect
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Tuple
+
+import database
+import metrics
+import models
+import timezones
+
+
+class Storage(Protocol):
+    def init(self) -> None: ...
+    def close(self) -> None: ...
+
+    # tareas
+    def add_task(self, user_id: str, text: str, created_at: str) -> int: ...
+    def add_tasks(self, user_id: str, texts: List[str], created_at: str) -> List[int]: ...
+    def list_task(self, user_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                  limit: Optional[int] = None, done: Optional[bool] = None) -> List[models.Task]: ...
+    def get_task(self, user_id: str, task_id: int) -> Optional[models.Task]: ...
+    def search_tasks(self, user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]: ...
+    def count_tasks(self, user_id: str) -> int: ...
+    def task_version(self, user_id: str) -> int: ...
+    def edit_task(self, user_id: str, task_id: int, new_text: str) -> bool: ...
+    def delete_task(self, user_id: str, task_id: int) -> bool: ...
+    def set_task_done(self, user_id: str, task_id: int, done: bool) -> bool: ...
+    def set_tasks_done(self, user_id: str, task_ids: List[int], done: bool) -> int: ...
+    def delete_tasks(self, user_id: str, task_ids: List[int]) -> int: ...
+    def clear_completed(self, user_id: str) -> int: ...
+
+    # recordatorios
+    def add_reminder(self, user_id: str, task_id: Optional[int], remind_at: str, remind_at_epoch: int,
+                     repeat: Optional[str] = None, tz: str = timezones.DEFAULT_TZ) -> int: ...
+    def list_reminders(self, user_id: str) -> List[models.Reminder]: ...
+    def count_pending_reminders(self, user_id: str) -> int: ...
+    def delete_reminder(self, reminder_id: int) -> bool: ...
+    def mark_reminder_sent(self, reminder_id: int) -> None: ...
+    def update_reminder_time(self, reminder_id: int, new_remind_at: str, new_remind_at_epoch: int) -> None: ...
+    def apply_reminder_updates(self, sent_ids, reschedules) -> None: ...
+    def claim_reminders(self, worker_id: str, items, lease_seconds: float,
+                        now: float) -> Tuple[List[int], List[int]]: ...
+    def release_claims(self, worker_id: str) -> int: ...
+    def pending_reminders(self, limit: Optional[int] = None, worker_id: Optional[str] = None,
+                          now: Optional[float] = None,
+                          after: Optional[Tuple[int, int]] = None) -> List[models.PendingReminder]: ...
+    def due_reminders(self, reminder_ids) -> Dict[int, models.DueReminder]: ...
+
+    # ajustes por usuario
+    def get_user_settings(self, user_id: str) -> Optional[Dict[str, Any]]: ...
+    def set_user_timezone(self, user_id: str, tz: str) -> None: ...
+
+    # modo resumen
+    def set_digest(self, user_id: str, digest_at: Optional[str], digest_next: Optional[int]) -> None: ...
+    def due_digests(self, now: float, limit: int) -> List[Dict[str, Any]]: ...
+    def claim_digests(self, items) -> List[str]: ...
+    def digest_contents(self, items, task_limit: int) -> Dict[str, Dict[str, Any]]: ...
+
+    # export / import (generadores en orden de id; lotes en una transacción)
+    def iter_tasks(self, user_id: Optional[str], chunk: int) -> Iterator[Dict[str, Any]]: ...
+    def iter_reminders(self, user_id: Optional[str], chunk: int) -> Iterator[Dict[str, Any]]: ...
+    def import_tasks(self, rows) -> List[int]: ...
+    def import_reminders(self, rows) -> int: ...
+
+
+class SQLiteStorage:
+    """Backend SQLite: delega en las funciones de database.py."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or database.DB_PATH
+
+    def init(self):
+        database.set_db_path(self.path)
+        database.init_db()
+
+    def close(self):
+        database.close_db()
+
+    add_task = staticmethod(database.add_task)
+    add_tasks = staticmethod(database.add_tasks)
+    list_task = staticmethod(database.list_task)
+    get_task = staticmethod(database.get_task)
+    search_tasks = staticmethod(database.search_tasks)
+    count_tasks = staticmethod(database.count_tasks)
+    task_version = staticmethod(database.task_version)
+    edit_task = staticmethod(database.edit_task)
+    delete_task = staticmethod(database.delete_task)
+    set_task_done = staticmethod(database.set_task_done)
+    set_tasks_done = staticmethod(database.set_tasks_done)
+    delete_tasks = staticmethod(database.delete_tasks)
+    clear_completed = staticmethod(database.clear_completed)
+
+    add_reminder = staticmethod(database.add_reminder)
+    list_reminders = staticmethod(database.list_reminders)
+    count_pending_reminders = staticmethod(database.count_pending_reminders)
+    delete_reminder = staticmethod(database.delete_reminder)
+    mark_reminder_sent = staticmethod(database.mark_reminder_sent)
+    update_reminder_time = staticmethod(database.update_reminder_time)
+    apply_reminder_updates = staticmethod(database.apply_reminder_updates)
+    claim_reminders = staticmethod(database.claim_reminders)
+    release_claims = staticmethod(database.release_claims)
+    pending_reminders = staticmethod(database.pending_reminders)
+    due_reminders = staticmethod(database.due_reminders)
+
+    get_user_settings = staticmethod(database.get_user_settings)
+    set_user_timezone = staticmethod(database.set_user_timezone)
+
+    set_digest = staticmethod(database.set_digest)
+    due_digests = staticmethod(database.due_digests)
+    claim_digests = staticmethod(database.claim_digests)
+    digest_contents = staticmethod(database.digest_contents)
+
+    iter_tasks = staticmethod(database.iter_tasks)
+    iter_reminders = staticmethod(database.iter_reminders)
+    import_tasks = staticmethod(database.import_tasks)
+    import_reminders = staticmethod(database.import_reminders)
+
+
+def _fold(text: str) -> str:
+    # equivalente al tokenizer unicode61 remove_diacritics de FTS5: sin tildes y en minúsculas
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)).lower()
+
+
+# palabras como las separa unicode61: letras y dígitos ("_" es separador)
+_WORD = re.compile(r"[^\W_]+")
+
+
+def _snippet(text: str, terms: List[str], tokens: int = 12) -> Tuple[int, str]:
+    # marca las palabras que empiezan por algún término (como snippet() de FTS5)
+    words = list(_WORD.finditer(text))
+    hits = [i for i, m in enumerate(words) if any(_fold(m.group()).startswith(t) for t in terms)]
+    if not hits:
+        return 0, text
+    first = max(0, min(hits[0], len(words) - tokens))
+    window = words[first:first + tokens]
+    out = []
+    pos = window[0].start() if first else 0
+    for i, m in enumerate(window, start=first):
+        out.append(text[pos:m.start()])
+        out.append(models.SNIPPET_START + m.group() + models.SNIPPET_END if i in hits else m.group())
+        pos = m.end()
+    end = window[-1].end()
+    snippet = ("…" if first else "") + "".join(out) + (text[end:] if first + tokens >= len(words) else "…")
+    return len(hits), snippet
+
+
+class MemoryStorage:
+    """
+    Backend en memoria (sin persistencia). Mismas semánticas que SQLiteStorage:
+    ids autoincrementales, páginas por keyset sobre una lista ordenada de ids
+    por usuario y un índice ordenado (remind_at_epoch, id) de recordatorios pendientes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[int, Dict[str, Any]] = {}
+        self._user_tasks: Dict[str, List[int]] = {}
+        self._task_versions: Dict[str, int] = {}
+        self._reminders: Dict[int, Dict[str, Any]] = {}
+        self._user_reminders: Dict[str, set] = {}
+        self._pending: List[Tuple[int, int]] = []
+        self._settings: Dict[str, Dict[str, Any]] = {}
+        self._digest_users: set = set()
+        self._next_task_id = 1
+        self._next_reminder_id = 1
+
+    def init(self):
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _task_row(t: Dict[str, Any]) -> models.Task:
+        return models.Task(t["id"], t["text"], t["done"], t["created_at"])
+
+    # ---------- tareas ----------
+    def _touch(self, user_id: str):
+        self._task_versions[user_id] = self._task_versions.get(user_id, 0) + 1
+
+    def _insert_task(self, user_id: str, text: str, created_at: str) -> int:
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        self._tasks[task_id] = {"id": task_id, "user_id": user_id, "text": text, "done": False,
+                                "created_at": created_at}
+        # los ids crecen siempre: append mantiene la lista ordenada
+        self._user_tasks.setdefault(user_id, []).append(task_id)
+        self._touch(user_id)
+        return task_id
+
+    def _remove_task(self, task_id: int):
+        t = self._tasks.pop(task_id)
+        ids = self._user_tasks[t["user_id"]]
+        del ids[bisect.bisect_left(ids, task_id)]
+        self._touch(t["user_id"])
+
+    def _owned(self, user_id: str, task_id: int) -> Optional[Dict[str, Any]]:
+        t = self._tasks.get(task_id)
+        return t if t is not None and t["user_id"] == user_id else None
+
+    @metrics.timed_query
+    def add_task(self, user_id: str, text: str, created_at: str) -> int:
+        with self._lock:
+            return self._insert_task(user_id, text, created_at)
+
+    @metrics.timed_query
+    def add_tasks(self, user_id: str, texts: List[str], created_at: str) -> List[int]:
+        with self._lock:
+            return [self._insert_task(user_id, text, created_at) for text in texts]
+
+    @metrics.timed_query
+    def list_task(self, user_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                  limit: Optional[int] = None, done: Optional[bool] = None) -> List[models.Task]:
+        rows = []
+        with self._lock:
+            ids = self._user_tasks.get(user_id, [])
+            if before_id is not None:
+                candidates = reversed(ids[:bisect.bisect_left(ids, before_id)])
+            else:
+                start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+                candidates = ids[start:]
+            for task_id in candidates:
+                t = self._tasks[task_id]
+                if done is not None and t["done"] != done:
+                    continue
+                rows.append(self._task_row(t))
+                if limit is not None and len(rows) >= limit:
+                    break
+        if before_id is not None:
+            rows.reverse()
+        return rows
+
+    @metrics.timed_query
+    def get_task(self, user_id: str, task_id: int) -> Optional[models.Task]:
+        with self._lock:
+            t = self._owned(user_id, task_id)
+            return self._task_row(t) if t is not None else None
+
+    @metrics.timed_query
+    def search_tasks(self, user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        terms = [_fold(t) for t in _WORD.findall(query)]
+        if not terms:
+            return []
+        with self._lock:
+            tasks = [self._tasks[i] for i in self._user_tasks.get(user_id, [])]
+        scored = []
+        for t in tasks:
+            words = [_fold(w) for w in _WORD.findall(t["text"])]
+            # todos los términos deben aparecer como prefijo de alguna palabra
+            if not all(any(w.startswith(term) for w in words) for term in terms):
+                continue
+            hits, snippet = _snippet(t["text"], terms)
+            scored.append((-hits / len(words), t["id"], {"id": t["id"], "text": t["text"], "done": t["done"],
+                                                         "created_at": t["created_at"], "snippet": snippet}))
+        scored.sort(key=lambda s: s[:2])
+        return [row for _, _, row in scored[:limit]]
+
+    @metrics.timed_query
+    def count_tasks(self, user_id: str) -> int:
+        with self._lock:
+            return len(self._user_tasks.get(user_id, ()))
+
+    @metrics.timed_query
+    def task_version(self, user_id: str) -> int:
+        with self._lock:
+            return self._task_versions.get(user_id, 0)
+
+    @metrics.timed_query
+    def edit_task(self, user_id: str, task_id: int, new_text: str) -> bool:
+        with self._lock:
+            t = self._owned(user_id, task_id)
+            if t is None:
+                return False
+            t["text"] = new_text
+            self._touch(user_id)
+            return True
+
+    @metrics.timed_query
+    def delete_task(self, user_id: str, task_id: int) -> bool:
+        with self._lock:
+            if self._owned(user_id, task_id) is None:
+                return False
+            self._remove_task(task_id)
+            return True
+
+    @metrics.timed_query
+    def set_task_done(self, user_id: str, task_id: int, done: bool) -> bool:
+        with self._lock:
+            t = self._owned(user_id, task_id)
+            if t is None:
+                return False
+            t["done"] = bool(done)
+            self._touch(user_id)
+            return True
+
+    @metrics.timed_query
+    def set_tasks_done(self, user_id: str, task_ids: List[int], done: bool) -> int:
+        changed = 0
+        with self._lock:
+            for task_id in dict.fromkeys(task_ids):
+                t = self._owned(user_id, task_id)
+                if t is not None:
+                    t["done"] = bool(done)
+                    changed += 1
+            if changed:
+                self._touch(user_id)
+        return changed
+
+    @metrics.timed_query
+    def delete_tasks(self, user_id: str, task_ids: List[int]) -> int:
+        changed = 0
+        with self._lock:
+            for task_id in dict.fromkeys(task_ids):
+                if self._owned(user_id, task_id) is not None:
+                    self._remove_task(task_id)
+                    changed += 1
+        return changed
+
+    @metrics.timed_query
+    def clear_completed(self, user_id: str) -> int:
+        with self._lock:
+            done = [i for i in self._user_tasks.get(user_id, []) if self._tasks[i]["done"]]
+            for task_id in done:
+                self._remove_task(task_id)
+        return len(done)
+
+    # ---------- recordatorios ----------
+    def _unindex(self, r: Dict[str, Any]):
+        if not r["sent"]:
+            key = (r["remind_at_epoch"], r["id"])
+            i = bisect.bisect_left(self._pending, key)
+            if i < len(self._pending) and self._pending[i] == key:
+                del self._pending[i]
+
+    def _index(self, r: Dict[str, Any]):
+        if not r["sent"]:
+            bisect.insort(self._pending, (r["remind_at_epoch"], r["id"]))
+
+    def _update_reminder(self, reminder_id: int, **changes):
+        r = self._reminders.get(reminder_id)
+        if r is None:
+            return
+        self._unindex(r)
+        r.update(changes)
+        self._index(r)
+
+    def _insert_reminder(self, user_id: str, task_id: Optional[int], remind_at: str, remind_at_epoch: int,
+                         repeat: Optional[str], tz: str, sent: bool) -> int:
+        reminder_id = self._next_reminder_id
+        self._next_reminder_id += 1
+        r = {"id": reminder_id, "user_id": user_id, "task_id": task_id, "remind_at": remind_at,
+             "remind_at_epoch": remind_at_epoch, "tz": tz, "sent": sent, "repeat": repeat,
+             "claimed_by": None, "claim_expires": None}
+        self._reminders[reminder_id] = r
+        self._user_reminders.setdefault(user_id, set()).add(reminder_id)
+        self._index(r)
+        return reminder_id
+
+    @metrics.timed_query
+    def add_reminder(self, user_id: str, task_id: Optional[int], remind_at: str, remind_at_epoch: int,
+                     repeat: Optional[str] = None, tz: str = timezones.DEFAULT_TZ) -> int:
+        with self._lock:
+            return self._insert_reminder(user_id, task_id, remind_at, remind_at_epoch, repeat, tz, False)
+
+    @metrics.timed_query
+    def list_reminders(self, user_id: str) -> List[models.Reminder]:
+        with self._lock:
+            rows = [models.Reminder(r["id"], r["task_id"], r["remind_at"], r["sent"], r["repeat"],
+                                    r["remind_at_epoch"], r["tz"])
+                    for r in (self._reminders[i] for i in self._user_reminders.get(user_id, ()))]
+        rows.sort(key=lambda r: (r.remind_at_epoch, r.id))
+        return rows
+
+    @metrics.timed_query
+    def count_pending_reminders(self, user_id: str) -> int:
+        with self._lock:
+            return sum(not self._reminders[i]["sent"] for i in self._user_reminders.get(user_id, ()))
+
+    @metrics.timed_query
+    def delete_reminder(self, reminder_id: int) -> bool:
+        with self._lock:
+            r = self._reminders.pop(reminder_id, None)
+            if r is None:
+                return False
+            self._user_reminders[r["user_id"]].discard(reminder_id)
+            self._unindex(r)
+            return True
+
+    @metrics.timed_query
+    def mark_reminder_sent(self, reminder_id: int):
+        with self._lock:
+            self._update_reminder(reminder_id, sent=True)
+
+    @metrics.timed_query
+    def update_reminder_time(self, reminder_id: int, new_remind_at: str, new_remind_at_epoch: int):
+        with self._lock:
+            self._update_reminder(reminder_id, remind_at=new_remind_at, remind_at_epoch=new_remind_at_epoch,
+                                  sent=False)
+
+    @metrics.timed_query
+    def apply_reminder_updates(self, sent_ids, reschedules):
+        with self._lock:
+            for reminder_id in sent_ids:
+                self._update_reminder(reminder_id, sent=True, claimed_by=None, claim_expires=None)
+            for remind_at, remind_at_epoch, reminder_id in reschedules:
+                self._update_reminder(reminder_id, remind_at=remind_at, remind_at_epoch=remind_at_epoch,
+                                      sent=False, claimed_by=None, claim_expires=None)
+
+    @metrics.timed_query
+    def claim_reminders(self, worker_id: str, items, lease_seconds: float, now: float):
+        claimed, taken_over = [], []
+        expires = now + lease_seconds
+        with self._lock:
+            for rid, remind_at_epoch in items:
+                r = self._reminders.get(rid)
+                if r is None or r["sent"] or r["remind_at_epoch"] != remind_at_epoch:
+                    continue
+                if r["claimed_by"] is None or r["claimed_by"] == worker_id:
+                    claimed.append(rid)
+                elif r["claim_expires"] is not None and r["claim_expires"] < now:
+                    taken_over.append(rid)
+                else:
+                    continue
+                r["claimed_by"], r["claim_expires"] = worker_id, expires
+        return claimed, taken_over
+
+    @metrics.timed_query
+    def release_claims(self, worker_id: str) -> int:
+        released = 0
+        with self._lock:
+            for r in self._reminders.values():
+                if r["claimed_by"] == worker_id and not r["sent"]:
+                    r["claimed_by"] = r["claim_expires"] = None
+                    released += 1
+        return released
+
+    @metrics.timed_query
+    def pending_reminders(self, limit: Optional[int] = None, worker_id: Optional[str] = None,
+                          now: Optional[float] = None,
+                          after: Optional[Tuple[int, int]] = None) -> List[models.PendingReminder]:
+        rows = []
+        with self._lock:
+            start = bisect.bisect_right(self._pending, tuple(after)) if after is not None else 0
+            for _, rid in self._pending[start:]:
+                r = self._reminders[rid]
+                if r["user_id"] in self._digest_users:
+                    continue
+                if worker_id is not None and r["claimed_by"] not in (None, worker_id) \
+                        and not (r["claim_expires"] is not None and r["claim_expires"] < now):
+                    continue
+                rows.append(models.PendingReminder(rid, r["user_id"], r["task_id"], r["remind_at"], r["repeat"],
+                                                   r["remind_at_epoch"], r["tz"]))
+                if limit is not None and len(rows) >= limit:
+                    break
+        return rows
+
+    @metrics.timed_query
+    def due_reminders(self, reminder_ids) -> Dict[int, models.DueReminder]:
+        result = {}
+        with self._lock:
+            for rid in reminder_ids:
+                r = self._reminders.get(rid)
+                if r is None or r["sent"]:
+                    continue
+                task = self._owned(r["user_id"], r["task_id"]) if r["task_id"] is not None else None
+                result[rid] = models.DueReminder(rid, r["user_id"], r["task_id"], r["remind_at"], r["repeat"],
+                                                 r["remind_at_epoch"], r["tz"],
+                                                 task["text"] if task is not None else None)
+        return result
+
+    # ---------- ajustes por usuario ----------
+    def _user_settings(self, user_id: str) -> Dict[str, Any]:
+        return self._settings.setdefault(user_id, {"tz": timezones.DEFAULT_TZ, "digest_at": None,
+                                                   "digest_next": None})
+
+    @metrics.timed_query
+    def get_user_settings(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            settings = self._settings.get(user_id)
+            return dict(settings) if settings is not None else None
+
+    @metrics.timed_query
+    def set_user_timezone(self, user_id: str, tz: str):
+        with self._lock:
+            self._user_settings(user_id)["tz"] = tz
+
+    # ---------- modo resumen ----------
+    @metrics.timed_query
+    def set_digest(self, user_id: str, digest_at: Optional[str], digest_next: Optional[int]):
+        with self._lock:
+            self._user_settings(user_id).update(digest_at=digest_at, digest_next=digest_next)
+            if digest_at is None:
+                self._digest_users.discard(user_id)
+            else:
+                self._digest_users.add(user_id)
+
+    @metrics.timed_query
+    def due_digests(self, now: float, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            due = [{"user_id": u, **self._settings[u]} for u in self._digest_users
+                   if self._settings[u]["digest_next"] <= now]
+        due.sort(key=lambda d: d["digest_next"])
+        return due[:limit]
+
+    @metrics.timed_query
+    def claim_digests(self, items) -> List[str]:
+        claimed = []
+        with self._lock:
+            for user_id, digest_next, new_next in items:
+                settings = self._settings.get(user_id)
+                if user_id in self._digest_users and settings["digest_next"] == digest_next:
+                    settings["digest_next"] = new_next
+                    claimed.append(user_id)
+        return claimed
+
+    @metrics.timed_query
+    def digest_contents(self, items, task_limit: int) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        with self._lock:
+            for user_id, until in items:
+                rems = [self._reminders[i] for i in self._user_reminders.get(user_id, ())]
+                rems = sorted((r for r in rems if not r["sent"] and r["remind_at_epoch"] < until),
+                              key=lambda r: (r["remind_at_epoch"], r["id"]))
+                pending = [self._tasks[i] for i in self._user_tasks.get(user_id, ()) if not self._tasks[i]["done"]]
+                result[user_id] = {
+                    "reminders": [{"id": r["id"], "user_id": user_id, "task_id": r["task_id"],
+                                   "remind_at": r["remind_at"], "remind_at_epoch": r["remind_at_epoch"],
+                                   "repeat": r["repeat"], "tz": r["tz"],
+                                   "task_text": (self._owned(user_id, r["task_id"]) or {}).get("text")}
+                                  for r in rems],
+                    "pending_count": len(pending),
+                    "pending": [{"id": t["id"], "text": t["text"]} for t in pending[:task_limit]],
+                }
+        return result
+
+    # ---------- export / import ----------
+    def _stream(self, table: Dict[int, Dict[str, Any]], ids: List[int], chunk: int, row):
+        # los ids se copian al empezar; las filas se leen por tramos de `chunk` bajo el lock
+        for start in range(0, len(ids), chunk):
+            with self._lock:
+                rows = [row(table[i]) for i in ids[start:start + chunk] if i in table]
+            yield from rows
+
+    def iter_tasks(self, user_id: Optional[str], chunk: int) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            ids = list(self._tasks) if user_id is None else list(self._user_tasks.get(user_id, ()))
+        return self._stream(self._tasks, ids, chunk, lambda t: {
+            "id": t["id"], "user_id": t["user_id"], "text": t["text"], "done": t["done"],
+            "created_at": t["created_at"]})
+
+    def iter_reminders(self, user_id: Optional[str], chunk: int) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            ids = list(self._reminders) if user_id is None else sorted(self._user_reminders.get(user_id, ()))
+        return self._stream(self._reminders, ids, chunk, lambda r: {
+            "id": r["id"], "user_id": r["user_id"], "task_id": r["task_id"], "remind_at": r["remind_at"],
+            "remind_at_epoch": r["remind_at_epoch"], "tz": r["tz"], "repeat": r["repeat"], "sent": r["sent"]})
+
+    @metrics.timed_query
+    def import_tasks(self, rows) -> List[int]:
+        ids = []
+        with self._lock:
+            for user_id, text, done, created_at in rows:
+                task_id = self._insert_task(user_id, text, created_at)
+                self._tasks[task_id]["done"] = bool(done)
+                ids.append(task_id)
+        return ids
+
+    @metrics.timed_query
+    def import_reminders(self, rows) -> int:
+        with self._lock:
+            for user_id, task_id, remind_at, remind_at_epoch, repeat, tz, sent in rows:
+                self._insert_reminder(user_id, task_id, remind_at, remind_at_epoch, repeat, tz, bool(sent))
+        return len(rows)
+
+
+BACKENDS = {
+    "sqlite": SQLiteStorage,
+    "memory": MemoryStorage,
+}
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+
+def from_env() -> Storage:
+    """Crea el backend indicado por STORAGE_BACKEND (por defecto sqlite en DB_PATH)."""
+    name = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND desconocido: {name!r} (opciones: {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+def configure(backend: Storage) -> Storage:
+    """Instala `backend` como almacenamiento activo (cierra el anterior) y lo inicializa."""
+    global _storage
+    with _storage_lock:
+        if _storage is not None and _storage is not backend:
+            _storage.close()
+        backend.init()
+        _storage = backend
+    return backend
+
+
+def get() -> Storage:
+    """Backend activo; si nadie lo configuró, se crea desde el entorno."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                backend = from_env()
+                backend.init()
+                _storage = backend
+    return _storage
+
+
+def close():
+    global _storage
+    with _storage_lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
@@ -1,45 +1,336 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-import database
+from typing import BinaryIO, List, Optional, Dict, Any
+import cache
+import metrics
+import models
+import storage
+import timezones
+import transfer
+
+# hilos dedicados a la DB: los handlers async delegan aquí para no bloquear el event loop
+DB_WORKERS = 4
+_executor: Optional[ThreadPoolExecutor] = None
+
+# caché de listas de tareas por usuario (se invalida en cada escritura)
+TASK_CACHE_MAX_USERS = 10_000
+TASK_CACHE_MAX_BYTES = 32 * 1024 * 1024
+TASK_CACHE_TTL = 300
+
+# tareas por página en /listtasks
+PAGE_SIZE = 15
+
+# máximos por usuario: un solo chat no puede llenar la DB
+MAX_TASKS_PER_USER = 5000
+MAX_REMINDERS_PER_USER = 200
+
+
+class LimitExceeded(Exception):
+    """El usuario ya tiene el máximo de tareas o de recordatorios pendientes."""
+
+    def __init__(self, kind: str, limit: int):
+        super().__init__(f"{kind}: máximo {limit}")
+        self.kind = kind
+        self.limit = limit
+
+def _check_task_limit(user_id: str, adding: int):
+    # comprobación previa a la inserción (best effort: el throttle limita la concurrencia por usuario)
+    if storage.get().count_tasks(user_id) + adding > MAX_TASKS_PER_USER:
+        raise LimitExceeded("tasks", MAX_TASKS_PER_USER)
+
+def _task_rows_size(entry) -> int:
+    # estimación: overhead fijo por fila (tupla, id, created_at) + el texto
+    size = 64
+    for result in entry[1].values():
+        rows = result[0] if isinstance(result, tuple) else result
+        size += sum(200 + len(r.text) for r in rows)
+    return size
+
+_task_cache = cache.LRUCache(TASK_CACHE_MAX_USERS, TASK_CACHE_MAX_BYTES, TASK_CACHE_TTL, _task_rows_size)
+for _stat in ("entries", "bytes", "hit_ratio", "evictions"):
+    metrics.REGISTRY.gauge(f"task_cache_{_stat}", lambda _stat=_stat: _task_cache.stats()[_stat])
 
 def now_iso():
     return datetime.utcnow().isoformat(timespec='minutes')
 
 def add_task_for_user(user_id: str, text: str) -> int:
+    _check_task_limit(user_id, 1)
     created_at = now_iso()
-    return database.add_task(user_id, text, created_at)
+    try:
+        return storage.get().add_task(user_id, text, created_at)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def _cached_tasks(user_id: str, key, loader):
+    # la caché guarda, por usuario, (versión, {clave de página: resultado});
+    # lo devuelto es compartido con la caché: no modificarlo. El stamp se toma antes
+    # del get: si una escritura invalida entre medias, el put descarta las páginas viejas
+    stamp = _task_cache.stamp()
+    # la versión sale de la DB y cambia también con escrituras de otros procesos
+    # (varios workers): con otra versión las páginas guardadas no sirven
+    version = storage.get().task_version(user_id)
+    cached = _task_cache.get(user_id)
+    pages = cached[1] if cached is not None and cached[0] == version else {}
+    if key in pages:
+        return pages[key]
+    result = loader()
+    _task_cache.put(user_id, (version, {**pages, key: result}), stamp)
+    return result
+
+def list_task_for_user(user_id: str) -> List[models.Task]:
+    return _cached_tasks(user_id, "all", lambda: storage.get().list_task(user_id))
 
-def list_task_for_user(user_id: str) -> List[Dict[str, Any]]:
-    return database.list_task(user_id)
+def list_tasks_page(user_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                    done: Optional[bool] = None, limit: int = PAGE_SIZE):
+    """Devuelve (filas, hay_anterior, hay_siguiente) para una página de tareas."""
+    def load():
+        rows = storage.get().list_task(user_id, after_id=after_id, before_id=before_id, limit=limit + 1, done=done)
+        more = len(rows) > limit
+        if before_id is not None:
+            rows = rows[-limit:] if more else rows
+            return rows, more, True
+        return rows[:limit], after_id is not None, more
+    return _cached_tasks(user_id, ("page", after_id, before_id, done, limit), load)
 
 # backward-compatible aliases expected by bot.py
-def list_tasks_for_user(user_id: str) -> List[Dict[str, Any]]:
+def list_tasks_for_user(user_id: str) -> List[models.Task]:
     return list_task_for_user(user_id)
 
 def edit_task_for_user(user_id: str, task_id: int, new_task: str) -> bool:
-    return database.edit_task(user_id, task_id, new_task)
+    try:
+        return storage.get().edit_task(user_id, task_id, new_task)
+    finally:
+        _task_cache.invalidate(user_id)
 
 def delete_task_for_user(user_id: str, task_id: int) -> bool:
-    return database.delete_task(user_id, task_id)
+    try:
+        return storage.get().delete_task(user_id, task_id)
+    finally:
+        _task_cache.invalidate(user_id)
 
 def complete_task_for_user(user_id: str, task_id: int) -> bool:
-    return database.set_task_done(user_id, task_id, True)
+    try:
+        return storage.get().set_task_done(user_id, task_id, True)
+    finally:
+        _task_cache.invalidate(user_id)
 
 def pending_task_for_user(user_id: str, task_id: int) -> bool:
-    return database.set_task_done(user_id, task_id, False)
+    try:
+        return storage.get().set_task_done(user_id, task_id, False)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def add_tasks_for_user(user_id: str, texts: List[str]) -> List[int]:
+    _check_task_limit(user_id, len(texts))
+    try:
+        return storage.get().add_tasks(user_id, texts, now_iso())
+    finally:
+        _task_cache.invalidate(user_id)
+
+def complete_tasks_for_user(user_id: str, task_ids: List[int]) -> int:
+    try:
+        return storage.get().set_tasks_done(user_id, task_ids, True)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def pending_tasks_for_user(user_id: str, task_ids: List[int]) -> int:
+    try:
+        return storage.get().set_tasks_done(user_id, task_ids, False)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def delete_tasks_for_user(user_id: str, task_ids: List[int]) -> int:
+    try:
+        return storage.get().delete_tasks(user_id, task_ids)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def clear_completed_for_user(user_id: str) -> int:
+    try:
+        return storage.get().clear_completed(user_id)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def search_tasks_for_user(user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    return storage.get().search_tasks(user_id, query, limit)
+
+def task_cache_stats() -> Dict[str, Any]:
+    return _task_cache.stats()
+
+def clear_task_cache():
+    _task_cache.clear()
 
 #Reminders
-def add_reminder_for_user(user_id: str, remind_at_iso: str, task_id: Optional[int] = None, repeat: Optional[str] = None) -> int:
-    return database.add_reminder(user_id, task_id, remind_at_iso, repeat)
+def add_reminder_for_user(user_id: str, remind_at_iso: str, task_id: Optional[int] = None, repeat: Optional[str] = None,
+                          tz: str = timezones.DEFAULT_TZ) -> int:
+    if storage.get().count_pending_reminders(user_id) >= MAX_REMINDERS_PER_USER:
+        raise LimitExceeded("reminders", MAX_REMINDERS_PER_USER)
+    # remind_at_iso es hora local en `tz`; se guarda también el instante UTC
+    return storage.get().add_reminder(user_id, task_id, remind_at_iso, timezones.to_epoch(remind_at_iso, tz),
+                                      repeat, tz)
 
 def list_reminder_for_user(user_id: str):
-    return database.list_reminders(user_id)
+    return storage.get().list_reminders(user_id)
 
 def list_reminders_for_user(user_id: str):
     return list_reminder_for_user(user_id)
 
 def delete_reminder_by_id(reminder_id: int) -> bool:
-    return database.delete_reminder(reminder_id)
+    return storage.get().delete_reminder(reminder_id)
+
+def get_user_settings(user_id: str) -> Dict[str, Any]:
+    return storage.get().get_user_settings(user_id) or {"tz": timezones.DEFAULT_TZ, "digest_at": None,
+                                                        "digest_next": None}
+
+def get_user_timezone(user_id: str) -> str:
+    return get_user_settings(user_id)["tz"]
+
+def set_user_timezone(user_id: str, tz: str):
+    storage.get().set_user_timezone(user_id, tz)
+    # el resumen diario es a una hora local: se recalcula su próximo envío
+    digest_at = get_user_settings(user_id)["digest_at"]
+    if digest_at:
+        storage.get().set_digest(user_id, digest_at, timezones.next_daily(digest_at, tz, time.time()))
+
+def set_digest_for_user(user_id: str, digest_at: Optional[str]) -> Optional[int]:
+    """Activa el resumen diario a las `digest_at` (hora local) o lo desactiva con None; devuelve el próximo envío."""
+    digest_next = None
+    if digest_at:
+        digest_next = timezones.next_daily(digest_at, get_user_timezone(user_id), time.time())
+    storage.get().set_digest(user_id, digest_at, digest_next)
+    return digest_next
+
+# Export / import
+def export_for_user(user_id: str, out: BinaryIO, fmt: str) -> int:
+    """Escribe las tareas y recordatorios del usuario en `out` (JSONL o CSV); devuelve cuántos registros."""
+    return transfer.export(storage.get(), out, fmt, user_id)
+
+def import_for_user(user_id: str, inp: BinaryIO, fmt: str) -> Dict[str, int]:
+    """
+    Importa un archivo de /export al usuario. Se valida entero antes de escribir
+    (ValueError si hay una línea inválida) y se respetan los máximos por usuario.
+    """
+    counts = transfer.check(inp, fmt)
+    if storage.get().count_tasks(user_id) + counts["tasks"] > MAX_TASKS_PER_USER:
+        raise LimitExceeded("tasks", MAX_TASKS_PER_USER)
+    if storage.get().count_pending_reminders(user_id) + counts["pending_reminders"] > MAX_REMINDERS_PER_USER:
+        raise LimitExceeded("reminders", MAX_REMINDERS_PER_USER)
+    inp.seek(0)
+    try:
+        return transfer.load(storage.get(), inp, fmt, user_id)
+    finally:
+        _task_cache.invalidate(user_id)
+
+def get_pending_reminders(limit: Optional[int] = None, worker_id: Optional[str] = None, now: Optional[float] = None,
+                          after=None):
+    return storage.get().pending_reminders(limit, worker_id, now, after)
+
+# Async API (executor acotado)
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+    return _executor
+
+async def _run(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), fn, *args)
+
+def shutdown_executor():
+    """Espera a que terminen las consultas en curso y libera los hilos."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def async_add_task_for_user(user_id: str, text: str) -> int:
+    return await _run(add_task_for_user, user_id, text)
+
+async def async_list_tasks_page(user_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                                done: Optional[bool] = None, limit: int = PAGE_SIZE):
+    return await _run(list_tasks_page, user_id, after_id, before_id, done, limit)
+
+async def async_search_tasks_for_user(user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    return await _run(search_tasks_for_user, user_id, query, limit)
+
+async def async_due_reminders(reminder_ids) -> Dict[int, models.DueReminder]:
+    return await _run(storage.get().due_reminders, reminder_ids)
+
+async def async_edit_task_for_user(user_id: str, task_id: int, new_task: str) -> bool:
+    return await _run(edit_task_for_user, user_id, task_id, new_task)
+
+async def async_delete_task_for_user(user_id: str, task_id: int) -> bool:
+    return await _run(delete_task_for_user, user_id, task_id)
+
+async def async_complete_task_for_user(user_id: str, task_id: int) -> bool:
+    return await _run(complete_task_for_user, user_id, task_id)
+
+async def async_pending_task_for_user(user_id: str, task_id: int) -> bool:
+    return await _run(pending_task_for_user, user_id, task_id)
+
+async def async_add_tasks_for_user(user_id: str, texts: List[str]) -> List[int]:
+    return await _run(add_tasks_for_user, user_id, texts)
+
+async def async_complete_tasks_for_user(user_id: str, task_ids: List[int]) -> int:
+    return await _run(complete_tasks_for_user, user_id, task_ids)
+
+async def async_pending_tasks_for_user(user_id: str, task_ids: List[int]) -> int:
+    return await _run(pending_tasks_for_user, user_id, task_ids)
+
+async def async_delete_tasks_for_user(user_id: str, task_ids: List[int]) -> int:
+    return await _run(delete_tasks_for_user, user_id, task_ids)
+
+async def async_clear_completed_for_user(user_id: str) -> int:
+    return await _run(clear_completed_for_user, user_id)
+
+async def async_add_reminder_for_user(user_id: str, remind_at_iso: str, task_id: Optional[int] = None, repeat: Optional[str] = None,
+                                      tz: str = timezones.DEFAULT_TZ) -> int:
+    return await _run(add_reminder_for_user, user_id, remind_at_iso, task_id, repeat, tz)
+
+async def async_list_reminders_for_user(user_id: str):
+    return await _run(list_reminders_for_user, user_id)
+
+async def async_delete_reminder_by_id(reminder_id: int) -> bool:
+    return await _run(delete_reminder_by_id, reminder_id)
+
+async def async_get_user_settings(user_id: str) -> Dict[str, Any]:
+    return await _run(get_user_settings, user_id)
+
+async def async_get_user_timezone(user_id: str) -> str:
+    return await _run(get_user_timezone, user_id)
+
+async def async_set_digest_for_user(user_id: str, digest_at: Optional[str]) -> Optional[int]:
+    return await _run(set_digest_for_user, user_id, digest_at)
+
+async def async_due_digests(now: float, limit: int):
+    return await _run(storage.get().due_digests, now, limit)
+
+async def async_claim_digests(items):
+    return await _run(storage.get().claim_digests, items)
+
+async def async_digest_contents(items, task_limit: int):
+    return await _run(storage.get().digest_contents, items, task_limit)
+
+async def async_set_user_timezone(user_id: str, tz: str):
+    return await _run(set_user_timezone, user_id, tz)
+
+async def async_export_for_user(user_id: str, out: BinaryIO, fmt: str) -> int:
+    return await _run(export_for_user, user_id, out, fmt)
+
+async def async_import_for_user(user_id: str, inp: BinaryIO, fmt: str) -> Dict[str, int]:
+    return await _run(import_for_user, user_id, inp, fmt)
+
+async def async_get_pending_reminders(limit: Optional[int] = None, worker_id: Optional[str] = None,
+                                      now: Optional[float] = None, after=None):
+    return await _run(get_pending_reminders, limit, worker_id, now, after)
+
+async def async_claim_reminders(worker_id: str, items, lease_seconds: float, now: float):
+    return await _run(storage.get().claim_reminders, worker_id, items, lease_seconds, now)
+
+async def async_release_claims(worker_id: str) -> int:
+    return await _run(storage.get().release_claims, worker_id)
 
-def get_pending_reminders():
-    return database.pending_reminders()
\ No newline at end of file
+async def async_apply_reminder_updates(sent_ids, reschedules):
+    return await _run(storage.get().apply_reminder_updates, sent_ids, reschedules)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# los módulos del bot están en la raíz del repo (sin paquete)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import storage  # noqa: E402
+import task_manager  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """DB SQLite nueva en un directorio temporal (sin inicializar)."""
+    path = str(tmp_path / "tasks.db")
+    database.set_db_path(path)
+    yield path
+    storage.close()
+    database.close_db()
+    task_manager.clear_task_cache()
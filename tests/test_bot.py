@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+from telegram.error import BadRequest
+
+import bench
+import bot
+import storage
+
+
+@pytest.fixture
+def sqlite_storage(db_path):
+    storage.configure(storage.SQLiteStorage())
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def any_storage(request, db_path):
+    storage.configure(storage.BACKENDS[request.param]())
+
+
+def _record_texts(harness):
+    texts = []
+    real = harness.request.do_request
+
+    async def do_request(url, method, request_data=None, **kwargs):
+        if url.endswith("/sendMessage"):
+            texts.append(request_data.parameters["text"])
+        return await real(url, method, request_data, **kwargs)
+
+    harness.request.do_request = do_request
+    return texts
+
+
+def _fail_edits(harness, description):
+    real = harness.request.do_request
+
+    async def do_request(url, method, request_data=None, **kwargs):
+        if url.endswith("/editMessageText"):
+            return 400, json.dumps({"ok": False, "error_code": 400, "description": description}).encode()
+        return await real(url, method, request_data, **kwargs)
+
+    harness.request.do_request = do_request
+
+
+def test_tasks_page_ignores_message_not_modified(sqlite_storage):
+    async def run():
+        async with bench.Harness() as h:
+            _fail_edits(h, "Bad Request: message is not modified: specified new message content and "
+                           "reply markup are exactly the same")
+            await bot.tasks_page(h.update(1, data="tasks:all:a:0"), None)
+
+            _fail_edits(h, "Bad Request: message to edit not found")
+            with pytest.raises(BadRequest):
+                await bot.tasks_page(h.update(1, data="tasks:all:a:0"), None)
+
+    asyncio.run(run())
+
+
+def test_search_escapes_markdown_in_snippets(any_storage):
+    async def run():
+        async with bench.Harness() as h:
+            await h.process(h.update(1, "/addtask *config*_prod.yaml [v2]"))
+            texts = _record_texts(h)
+            await h.process(h.update(1, "/search config"))
+            return texts
+
+    texts = asyncio.run(run())
+    assert texts[-1].splitlines()[-1] == "1. ⏳ \\**config*\\*\\_prod.yaml \\[v2]"
+
+
+def test_task_list_escapes_markdown_and_clips_escaped_text(sqlite_storage):
+    long_text = "_" * (bot.MAX_LISTED_TEXT + 10)
+
+    async def run():
+        async with bench.Harness() as h:
+            await h.process(h.update(1, "/addtask a_b *c [d `e`"))
+            await h.process(h.update(1, "/addtask " + long_text))
+            texts = _record_texts(h)
+            await h.process(h.update(1, "/listtasks"))
+            return texts
+
+    lines = asyncio.run(run())[-1].splitlines()
+    assert lines[-2] == "1. ⏳ a\\_b \\*c \\[d \\`e\\`"
+    # recortado a MAX_LISTED_TEXT caracteres ya escapados, sin un "\" suelto al final
+    assert lines[-1] == "2. ⏳ " + "\\_" * (bot.MAX_LISTED_TEXT // 2) + "…"
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+
+import metrics
+
+
+def test_overlapping_sampled_handlers_profile_one_at_a_time(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "PROFILE_HANDLERS", frozenset({"lento"}))
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(metrics, "SLOW_HANDLER_SECONDS", 0.0)
+
+    async def handler(update, context):
+        await asyncio.sleep(0.01)
+        return update
+
+    wrapped = metrics.instrument_handler("lento", handler)
+
+    async def run():
+        # el segundo empieza mientras el primero tiene su profiler activo
+        return await asyncio.gather(wrapped(1, None), wrapped(2, None))
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        assert asyncio.run(run()) == [1, 2]
+    assert sum("Handler lento /lento" in r.getMessage() for r in caplog.records) == 1
+
+    # terminado el primero, el siguiente vuelve a perfilarse
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        assert asyncio.run(wrapped(3, None)) == 3
+    assert sum("Handler lento /lento" in r.getMessage() for r in caplog.records) == 1
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+import database
+
+
+def _columns(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    finally:
+        conn.close()
+
+
+def _user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _init_up_to(version):
+    saved = database.MIGRATIONS[:]
+    database.MIGRATIONS[:] = saved[:version]
+    try:
+        database.SCHEMA_VERSION = version
+        database.init_db()
+    finally:
+        database.MIGRATIONS[:] = saved
+        database.SCHEMA_VERSION = len(saved)
+
+
+def test_fresh_db_reaches_current_version(db_path):
+    database.init_db()
+    assert _user_version(db_path) == database.SCHEMA_VERSION
+    assert {"claimed_by", "claim_expires", "remind_at_epoch", "tz"} <= _columns(db_path, "reminders")
+    assert {"digest_at", "digest_next"} <= _columns(db_path, "user_settings")
+
+
+@pytest.mark.parametrize("failing", [5, 6, 7])
+def test_failed_migration_rolls_back_its_ddl(db_path, failing):
+    _init_up_to(failing - 1)
+    before = {t: _columns(db_path, t) for t in ("reminders", "user_settings")}
+    original = database.MIGRATIONS[failing - 1]
+
+    def broken(cur):
+        original(cur)
+        raise RuntimeError("fallo después de los ALTER")
+
+    database.MIGRATIONS[failing - 1] = broken
+    try:
+        with pytest.raises(RuntimeError):
+            database.init_db()
+    finally:
+        database.MIGRATIONS[failing - 1] = original
+    assert _user_version(db_path) == failing - 1
+    assert {t: _columns(db_path, t) for t in before} == before
+
+    # con la migración arreglada, el siguiente arranque termina el esquema
+    database.init_db()
+    assert _user_version(db_path) == database.SCHEMA_VERSION
+
+
+def test_migration_skips_columns_that_already_exist(db_path):
+    # esquema a medias de una versión anterior: columnas ya creadas pero user_version viejo
+    _init_up_to(4)
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE reminders ADD COLUMN claimed_by TEXT DEFAULT NULL")
+    conn.commit()
+    conn.close()
+    database.close_db()
+    database.init_db()
+    assert _user_version(db_path) == database.SCHEMA_VERSION
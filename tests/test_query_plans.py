@@ -0,0 +1,80 @@
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def traced(db_path, monkeypatch):
+    """Inicializa la DB y devuelve la lista de SQL (ya con parámetros) que ejecutan las lecturas."""
+    database.init_db()
+    with database._write() as conn:
+        conn.executemany("INSERT INTO tasks (user_id, text, done, created_at) VALUES (?, ?, ?, '2025-01-01')",
+                         [(str(u), f"tarea {i}", i % 2) for u in range(20) for i in range(50)])
+        conn.executemany("INSERT INTO reminders (user_id, task_id, remind_at, sent, repeat, remind_at_epoch, tz) "
+                         "VALUES (?, NULL, '2025-01-01 10:00', ?, NULL, ?, 'UTC')",
+                         [(str(u), i % 3 == 0, 1_700_000_000 + u * 100 + i) for u in range(20) for i in range(30)])
+    statements = []
+    real_read = database._read
+
+    @contextmanager
+    def read():
+        with real_read() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+    monkeypatch.setattr(database, "_read", read)
+    return statements
+
+
+def _plan(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+    finally:
+        conn.close()
+
+
+def _only_plan(db_path, statements):
+    assert len(statements) == 1, statements
+    return _plan(db_path, statements.pop())
+
+
+def test_pending_reminders_uses_due_index(db_path, traced):
+    database.pending_reminders(limit=100)
+    assert "idx_reminders_due" in _only_plan(db_path, traced)
+
+    database.pending_reminders(limit=100, worker_id="w1", now=1_700_000_500.0, after=(1_700_000_050, 3))
+    assert "idx_reminders_due" in _only_plan(db_path, traced)
+
+
+def test_user_reminder_queries_use_user_epoch_index(db_path, traced):
+    database.list_reminders("3")
+    plan = _only_plan(db_path, traced)
+    assert "idx_reminders_user_epoch" in plan
+    assert "TEMP B-TREE" not in plan
+
+    database.count_pending_reminders("3")
+    assert "idx_reminders_user_epoch" in _only_plan(db_path, traced)
+
+
+@pytest.mark.parametrize("kwargs", [{"done": False, "limit": 10},
+                                    {"done": True, "after_id": 5, "limit": 10},
+                                    {"done": False, "before_id": 900, "limit": 10}])
+def test_filtered_task_pages_use_user_done_index(db_path, traced, kwargs):
+    database.list_task("4", **kwargs)
+    plan = _only_plan(db_path, traced)
+    assert "idx_tasks_user_done" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_plain_task_list_uses_user_id_index(db_path, traced):
+    database.list_task("4")
+    plan = _only_plan(db_path, traced)
+    assert "idx_tasks_user_id" in plan
+    assert "TEMP B-TREE" not in plan
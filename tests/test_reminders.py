@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+import time
+
+import bench
+import reminders
+import sender
+import storage
+
+
+def test_reminder_is_requeued_after_transient_failures(db_path, monkeypatch):
+    st = storage.configure(storage.SQLiteStorage())
+    epoch = int(time.time()) - 60
+    rid = st.add_reminder("42", None, "2025-01-01 10:00", epoch)
+    # reintento inmediato en vez de REDELIVERY_DELAY, para no esperar un minuto
+    monkeypatch.setattr(reminders, "REDELIVERY_DELAY", 0)
+
+    def state():
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("SELECT sent, claimed_by FROM reminders WHERE id = ?", (rid,)).fetchone()
+        finally:
+            conn.close()
+
+    async def run():
+        request = bench.LimitedFakeRequest(1000, 1000, network_errors=1.0)
+        async with bench.Harness(request=request) as h:
+            dispatcher = reminders.ReminderDispatcher(h.app, worker_id="w1")
+            dispatcher.sender = sender.OutboundSender(h.app.bot, global_rate=1000, per_chat_rate=1000,
+                                                      max_retries=2, base_backoff=0.001)
+            await dispatcher.refresh()
+
+            # todos los intentos fallan: sigue pendiente, reclamado por este worker y en la cola
+            await dispatcher.dispatch_due()
+            assert request.rejected["network"] == 3 and h.sent == 0
+            assert dispatcher.sender.stats[sender.RETRY] == 1
+            assert len(dispatcher) == 1 and rid in dispatcher._retry_at
+            assert state() == (0, "w1")
+
+            # la red vuelve: el reintento lo entrega y lo cierra
+            request.network_errors = 0.0
+            await dispatcher.dispatch_due()
+            await dispatcher.batcher.flush()
+            assert h.sent == 1 and len(dispatcher) == 0
+        assert state()[0] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+import sender
+
+
+class FakeBot:
+    def __init__(self, errors=()):
+        # errores a lanzar, en orden, antes de empezar a aceptar mensajes
+        self.errors = list(errors)
+        self.calls = 0
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def test_chat_waiting_for_its_token_does_not_hold_a_slot():
+    bot = FakeBot()
+    outbound = sender.OutboundSender(bot, global_rate=1000, per_chat_rate=5, max_concurrent=1)
+
+    async def run():
+        # el segundo mensaje del chat 1 espera ~0.2 s su token; el chat 2 no debe esperarlo
+        return await asyncio.gather(outbound.send(1, "a"), outbound.send(1, "b"), outbound.send(2, "c"))
+
+    assert asyncio.run(run()) == [sender.SENT] * 3
+    assert bot.sent == [(1, "a"), (2, "c"), (1, "b")]
+
+
+def test_retry_after_waits_the_requested_time():
+    bot = FakeBot([RetryAfter(timedelta(seconds=0.2))])
+    outbound = sender.OutboundSender(bot, global_rate=1000, per_chat_rate=1000)
+
+    start = time.monotonic()
+    assert asyncio.run(outbound.send(1, "a")) == sender.SENT
+    assert time.monotonic() - start >= 0.2
+    assert bot.calls == 2
+    assert outbound.stats == {sender.SENT: 1, sender.RETRY: 0, sender.DROPPED: 0, "retries": 1}
+
+
+def test_transient_errors_until_retries_run_out_return_retry():
+    bot = FakeBot([NetworkError("caída"), RetryAfter(timedelta(seconds=0.01)), NetworkError("caída"), NetworkError("caída")])
+    outbound = sender.OutboundSender(bot, global_rate=1000, per_chat_rate=1000, max_retries=3, base_backoff=0.01)
+
+    assert asyncio.run(outbound.send(1, "a")) == sender.RETRY
+    assert bot.calls == 4
+    assert outbound.stats == {sender.SENT: 0, sender.RETRY: 1, sender.DROPPED: 0, "retries": 3}
+
+
+def test_permanent_errors_are_dropped_without_retrying():
+    bot = FakeBot([Forbidden("bot was blocked by the user")])
+    outbound = sender.OutboundSender(bot, global_rate=1000, per_chat_rate=1000)
+
+    assert asyncio.run(outbound.send(1, "a")) == sender.DROPPED
+    assert bot.calls == 1
+    assert outbound.stats["retries"] == 0
@@ -0,0 +1,263 @@
+"""Mismas pruebas contra cada backend de storage.BACKENDS: deben comportarse igual."""
+import pytest
+
+import models
+import storage
+
+CREATED = "2025-01-01T10:00"
+EPOCH = 1_750_000_000
+
+
+@pytest.fixture(params=sorted(storage.BACKENDS))
+def backend(request, db_path):
+    # db_path apunta la DB a un directorio temporal (solo lo usa SQLiteStorage)
+    backend = storage.BACKENDS[request.param]()
+    backend.init()
+    yield backend
+    backend.close()
+
+
+def _texts(rows):
+    return [r.text for r in rows]
+
+
+def _reminder(backend, user_id="u", epoch=EPOCH, task_id=None, repeat=None, tz="UTC"):
+    return backend.add_reminder(user_id, task_id, "2025-06-15 10:00", epoch, repeat, tz)
+
+
+# ---------- tareas ----------
+def test_task_crud_is_scoped_to_the_user(backend):
+    a = backend.add_task("u", "uno", CREATED)
+    b, c = backend.add_tasks("u", ["dos", "tres"], CREATED)
+    other = backend.add_task("v", "ajena", CREATED)
+    assert a < b < c < other
+
+    assert backend.list_task("u") == [models.Task(a, "uno", False, CREATED), models.Task(b, "dos", False, CREATED),
+                                      models.Task(c, "tres", False, CREATED)]
+    assert backend.get_task("u", b) == models.Task(b, "dos", False, CREATED)
+    assert backend.get_task("u", other) is None
+    assert backend.count_tasks("u") == 3
+
+    assert backend.edit_task("u", b, "dos bis")
+    assert not backend.edit_task("u", other, "robada")
+    assert backend.set_task_done("u", c, True)
+    assert not backend.set_task_done("u", other, True)
+    assert backend.delete_task("u", a)
+    assert not backend.delete_task("u", a)
+    assert not backend.delete_task("u", other)
+
+    assert backend.list_task("u") == [models.Task(b, "dos bis", False, CREATED), models.Task(c, "tres", True, CREATED)]
+    assert backend.list_task("v") == [models.Task(other, "ajena", False, CREATED)]
+
+
+def test_task_version_changes_on_every_write(backend):
+    assert backend.task_version("u") == 0
+    seen = [0]
+
+    def changed():
+        seen.append(backend.task_version("u"))
+        return seen[-1] != seen[-2]
+
+    a = backend.add_task("u", "uno", CREATED)
+    assert changed()
+    b, c = backend.add_tasks("u", ["dos", "tres"], CREATED)
+    assert changed()
+    backend.list_task("u")
+    backend.add_task("v", "ajena", CREATED)
+    assert not changed()
+    assert backend.edit_task("u", a, "uno bis") and changed()
+    assert backend.set_task_done("u", a, True) and changed()
+    assert backend.set_tasks_done("u", [b], True) and changed()
+    assert backend.delete_task("u", b) and changed()
+    assert backend.delete_tasks("u", [c]) and changed()
+    assert backend.clear_completed("u") and changed()
+    backend.import_tasks([("u", "importada", False, CREATED)])
+    assert changed()
+
+
+def test_task_pages_by_keyset(backend):
+    ids = backend.add_tasks("u", [f"t{i}" for i in range(10)], CREATED)
+    backend.set_tasks_done("u", ids[::2], True)
+
+    assert _texts(backend.list_task("u", limit=3)) == ["t0", "t1", "t2"]
+    assert _texts(backend.list_task("u", after_id=ids[2], limit=3)) == ["t3", "t4", "t5"]
+    assert _texts(backend.list_task("u", before_id=ids[5], limit=3)) == ["t2", "t3", "t4"]
+    assert _texts(backend.list_task("u", before_id=ids[1], limit=3)) == ["t0"]
+    assert _texts(backend.list_task("u", done=False, limit=2)) == ["t1", "t3"]
+    assert _texts(backend.list_task("u", done=True, after_id=ids[4])) == ["t6", "t8"]
+    assert _texts(backend.list_task("u", done=False, before_id=ids[9], limit=2)) == ["t5", "t7"]
+
+
+def test_bulk_task_updates(backend):
+    ids = backend.add_tasks("u", ["a", "b", "c", "d"], CREATED)
+    other = backend.add_task("v", "ajena", CREATED)
+
+    assert backend.set_tasks_done("u", ids[:3] + [other, 999], True) == 3
+    assert backend.set_tasks_done("u", [ids[0]], False) == 1
+    assert backend.delete_tasks("u", [ids[1], other]) == 1
+    assert backend.clear_completed("u") == 1
+    assert _texts(backend.list_task("u")) == ["a", "d"]
+    assert _texts(backend.list_task("v")) == ["ajena"]
+
+
+def test_search_by_prefix_without_accents(backend):
+    backend.add_tasks("u", ["Llamar al Médico", "comprar pan", "config_prod.yaml", "médico y pan"], CREATED)
+    backend.add_task("v", "medico ajeno", CREATED)
+
+    assert {r["text"] for r in backend.search_tasks("u", "medi")} == {"Llamar al Médico", "médico y pan"}
+    assert [r["text"] for r in backend.search_tasks("u", "pan medico")] == ["médico y pan"]
+    assert [r["text"] for r in backend.search_tasks("u", "prod")] == ["config_prod.yaml"]
+    assert backend.search_tasks("u", "nada") == []
+    assert backend.search_tasks("u", "  ") == []
+    assert len(backend.search_tasks("u", "p", limit=1)) == 1
+
+    row = backend.search_tasks("u", "comp")[0]
+    assert row["snippet"] == f"{models.SNIPPET_START}comprar{models.SNIPPET_END} pan"
+    assert (row["done"], row["created_at"]) == (False, CREATED)
+
+
+# ---------- recordatorios ----------
+def test_reminder_lifecycle(backend):
+    late = _reminder(backend, epoch=EPOCH + 60, repeat="daily", tz="Europe/Madrid")
+    early = _reminder(backend, epoch=EPOCH)
+    _reminder(backend, user_id="v")
+
+    assert [r.id for r in backend.list_reminders("u")] == [early, late]
+    assert backend.list_reminders("u")[1] == models.Reminder(late, None, "2025-06-15 10:00", False, "daily",
+                                                             EPOCH + 60, "Europe/Madrid")
+    assert backend.count_pending_reminders("u") == 2
+
+    backend.mark_reminder_sent(early)
+    backend.update_reminder_time(late, "2025-06-16 10:00", EPOCH + 86_400)
+    assert backend.count_pending_reminders("u") == 1
+    assert [(r.sent, r.remind_at, r.remind_at_epoch) for r in backend.list_reminders("u")] == [
+        (True, "2025-06-15 10:00", EPOCH), (False, "2025-06-16 10:00", EPOCH + 86_400)]
+
+    assert backend.delete_reminder(early)
+    assert not backend.delete_reminder(early)
+    assert [r.id for r in backend.list_reminders("u")] == [late]
+
+
+def test_apply_reminder_updates(backend):
+    once, daily = _reminder(backend), _reminder(backend, repeat="daily")
+    backend.claim_reminders("w", [(once, EPOCH), (daily, EPOCH)], 60, EPOCH)
+
+    backend.apply_reminder_updates([once], [("2025-06-16 10:00", EPOCH + 86_400, daily)])
+    assert backend.pending_reminders() == [
+        models.PendingReminder(daily, "u", None, "2025-06-16 10:00", "daily", EPOCH + 86_400, "UTC")]
+    # reprogramar suelta el lease: otro worker puede reclamar la próxima ocurrencia
+    assert backend.claim_reminders("otro", [(daily, EPOCH + 86_400)], 60, EPOCH) == ([daily], [])
+
+
+def test_pending_reminders_order_keyset_and_digest_users(backend):
+    ids = [_reminder(backend, user_id=f"u{i % 3}", epoch=EPOCH + (i // 2)) for i in range(8)]
+    backend.mark_reminder_sent(ids[0])
+    backend.set_digest("u2", "08:00", EPOCH)
+
+    rows = backend.pending_reminders()
+    # sin el enviado (0) ni los de u2, en modo resumen (2 y 5)
+    assert [r.id for r in rows] == [ids[i] for i in (1, 3, 4, 6, 7)]
+    assert backend.pending_reminders(limit=2) == rows[:2]
+    assert backend.pending_reminders(after=(rows[1].remind_at_epoch, rows[1].id)) == rows[2:]
+
+    backend.set_digest("u2", None, None)
+    assert len(backend.pending_reminders()) == 7
+
+
+def test_claims_leases_and_takeover(backend):
+    a, b, c = _reminder(backend), _reminder(backend), _reminder(backend)
+
+    assert backend.claim_reminders("w1", [(a, EPOCH), (b, EPOCH)], 60, EPOCH) == ([a, b], [])
+    # lease vigente de w1: w2 no puede reclamar ni los ve como pendientes
+    assert backend.claim_reminders("w2", [(a, EPOCH), (c, EPOCH)], 60, EPOCH + 10) == ([c], [])
+    assert [r.id for r in backend.pending_reminders(worker_id="w2", now=EPOCH + 10)] == [c]
+    assert [r.id for r in backend.pending_reminders(worker_id="w1", now=EPOCH + 10)] == [a, b]
+    # renovar el propio lease cuenta como reclamado, no como tomado
+    assert backend.claim_reminders("w1", [(a, EPOCH)], 60, EPOCH + 10) == ([a], [])
+    # con otro remind_at_epoch (ya avanzado) no se reclama
+    assert backend.claim_reminders("w2", [(c, EPOCH + 1)], 60, EPOCH + 10) == ([], [])
+
+    # vencido el lease de w1, w2 lo toma
+    assert backend.claim_reminders("w2", [(a, EPOCH), (b, EPOCH)], 60, EPOCH + 100) == ([], [a, b])
+    assert backend.release_claims("w2") == 3
+    assert backend.release_claims("w1") == 0
+    assert backend.claim_reminders("w3", [(a, EPOCH)], 60, EPOCH + 100) == ([a], [])
+
+
+def test_due_reminders_include_task_text(backend):
+    task = backend.add_task("u", "pagar factura", CREATED)
+    gone = backend.add_task("u", "se borra", CREATED)
+    with_task, deleted, plain = (_reminder(backend, task_id=task), _reminder(backend, task_id=gone),
+                                 _reminder(backend, repeat="3h"))
+    backend.delete_task("u", gone)
+
+    due = backend.due_reminders([with_task, deleted, plain, 999])
+    assert set(due) == {with_task, deleted, plain}
+    assert due[with_task] == models.DueReminder(with_task, "u", task, "2025-06-15 10:00", None, EPOCH, "UTC",
+                                                "pagar factura")
+    assert due[deleted].task_text is None
+    assert (due[plain].task_id, due[plain].repeat, due[plain].task_text) == (None, "3h", None)
+
+
+# ---------- ajustes y resúmenes ----------
+def test_user_settings_and_digests(backend):
+    assert backend.get_user_settings("u") is None
+    backend.set_user_timezone("u", "America/Bogota")
+    assert backend.get_user_settings("u") == {"tz": "America/Bogota", "digest_at": None, "digest_next": None}
+
+    backend.set_digest("u", "08:00", EPOCH)
+    backend.set_digest("v", "09:00", EPOCH - 10)
+    backend.set_digest("w", "10:00", EPOCH + 10)
+    assert backend.get_user_settings("u") == {"tz": "America/Bogota", "digest_at": "08:00", "digest_next": EPOCH}
+    assert backend.get_user_settings("v")["tz"] == "UTC"
+
+    assert [d["user_id"] for d in backend.due_digests(EPOCH, 10)] == ["v", "u"]
+    assert backend.due_digests(EPOCH, 1) == [{"user_id": "v", "tz": "UTC", "digest_at": "09:00",
+                                              "digest_next": EPOCH - 10}]
+    # solo un worker consigue avanzar cada resumen
+    assert backend.claim_digests([("u", EPOCH, EPOCH + 86_400), ("v", EPOCH - 10, EPOCH + 86_390)]) == ["u", "v"]
+    assert backend.claim_digests([("u", EPOCH, EPOCH + 86_400)]) == []
+    assert backend.due_digests(EPOCH, 10) == []
+
+    backend.set_digest("u", None, None)
+    assert backend.get_user_settings("u")["digest_at"] is None
+
+
+def test_digest_contents(backend):
+    task = backend.add_task("u", "informe", CREATED)
+    done = backend.add_task("u", "hecha", CREATED)
+    backend.set_task_done("u", done, True)
+    backend.add_tasks("u", ["a", "b", "c"], CREATED)
+    late = _reminder(backend, epoch=EPOCH + 50, task_id=task, repeat="daily")
+    early = _reminder(backend, epoch=EPOCH)
+    _reminder(backend, epoch=EPOCH + 500)
+    backend.mark_reminder_sent(_reminder(backend, epoch=EPOCH + 1))
+
+    contents = backend.digest_contents([("u", EPOCH + 100), ("nadie", EPOCH + 100)], 2)
+    assert contents["nadie"] == {"reminders": [], "pending_count": 0, "pending": []}
+    u = contents["u"]
+    assert [r["id"] for r in u["reminders"]] == [early, late]
+    assert u["reminders"][1] == {"id": late, "user_id": "u", "task_id": task, "remind_at": "2025-06-15 10:00",
+                                 "remind_at_epoch": EPOCH + 50, "repeat": "daily", "tz": "UTC",
+                                 "task_text": "informe"}
+    assert u["pending_count"] == 4
+    assert u["pending"] == [{"id": task, "text": "informe"}, {"id": task + 2, "text": "a"}]
+
+
+# ---------- export / import ----------
+def test_iter_and_import_round_trip(backend):
+    ids = backend.import_tasks([("u", "uno", False, CREATED), ("u", "dos", True, CREATED),
+                                ("v", "ajena", False, CREATED)])
+    assert backend.import_reminders([("u", ids[0], "2025-06-15 10:00", EPOCH, "daily", "UTC", False),
+                                     ("v", None, "2025-06-15 10:00", EPOCH, None, "UTC", True)]) == 2
+
+    assert list(backend.iter_tasks("u", 1)) == [
+        {"id": ids[0], "user_id": "u", "text": "uno", "done": False, "created_at": CREATED},
+        {"id": ids[1], "user_id": "u", "text": "dos", "done": True, "created_at": CREATED}]
+    assert [t["id"] for t in backend.iter_tasks(None, 2)] == ids
+    reminders = list(backend.iter_reminders(None, 1))
+    assert [(r["user_id"], r["task_id"], r["repeat"], r["sent"]) for r in reminders] == [
+        ("u", ids[0], "daily", False), ("v", None, None, True)]
+    assert [r["id"] for r in backend.iter_reminders("v", 10)] == [reminders[1]["id"]]
+    assert backend.count_pending_reminders("u") == 1
+    assert backend.search_tasks("u", "uno")[0]["id"] == ids[0]
@@ -0,0 +1,42 @@
+import sqlite3
+
+import storage
+import task_manager
+
+
+def test_write_between_cache_get_and_load_is_not_cached(db_path, monkeypatch):
+    storage.configure(storage.SQLiteStorage())
+    task_id = task_manager.add_task_for_user("1", "vieja")
+    assert [t.text for t in task_manager.list_tasks_page("1")[0]] == ["vieja"]
+
+    real_get = task_manager._task_cache.get
+
+    def get_then_concurrent_write(key):
+        pages = real_get(key)
+        # otra corrutina edita la tarea justo después de que leamos la caché
+        monkeypatch.setattr(task_manager._task_cache, "get", real_get)
+        task_manager.edit_task_for_user("1", task_id, "nueva")
+        return pages
+
+    monkeypatch.setattr(task_manager._task_cache, "get", get_then_concurrent_write)
+    assert [t.text for t in task_manager.list_task_for_user("1")] == ["nueva"]
+    # la página cacheada antes de la edición no debe volver a la caché
+    assert [t.text for t in task_manager.list_tasks_page("1")[0]] == ["nueva"]
+
+
+def test_write_from_another_process_is_not_served_from_cache(db_path):
+    storage.configure(storage.SQLiteStorage())
+    task_id = task_manager.add_task_for_user("1", "pendiente")
+    assert [t.done for t in task_manager.list_tasks_page("1")[0]] == [False]
+    assert [t.done for t in task_manager.list_tasks_page("1")[0]] == [False]
+    hits = task_manager.task_cache_stats()["hits"]
+
+    # otro worker completa la tarea sobre el mismo archivo: aquí no hay invalidación local
+    other = sqlite3.connect(db_path)
+    with other:
+        other.execute("UPDATE tasks SET done = 1 WHERE id = ?", (task_id,))
+    other.close()
+
+    assert [t.done for t in task_manager.list_tasks_page("1")[0]] == [True]
+    assert [t.done for t in task_manager.list_tasks_page("1")[0]] == [True]
+    assert task_manager.task_cache_stats()["hits"] == hits + 2
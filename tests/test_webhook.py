@@ -0,0 +1,55 @@
+import asyncio
+import json
+import socket
+
+import bench
+import webhook
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _post(port, body, headers=()):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = "".join(f"{k}: {v}\r\n" for k, v in headers)
+    writer.write(f"POST /telegram HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n{head}\r\n"
+                 .encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    return status
+
+
+def test_webhook_url_without_secret_rejects_unsigned_posts(db_path):
+    async def run():
+        h = bench.Harness()
+        registered = {}
+        real = h.request.do_request
+
+        async def do_request(url, method, request_data=None, **kwargs):
+            if url.endswith("/setWebhook"):
+                registered.update(request_data.parameters)
+            return await real(url, method, request_data, **kwargs)
+
+        h.request.do_request = do_request
+        port, stop = _free_port(), asyncio.Event()
+        serving = asyncio.create_task(webhook.serve(h.app, "127.0.0.1", port, webhook_url="https://bot.example",
+                                                    stop_event=stop))
+        while not h.app.running:
+            await asyncio.sleep(0.01)
+        body = json.dumps(h.update_json(1, "/start")).encode()
+        try:
+            secret = registered["secret_token"]
+            assert len(secret) >= 32
+            assert await _post(port, body) == 403
+            assert await _post(port, body, [("X-Telegram-Bot-Api-Secret-Token", "adivinado")]) == 403
+            assert await _post(port, body, [("X-Telegram-Bot-Api-Secret-Token", secret)]) == 200
+        finally:
+            stop.set()
+            server = await serving
+        assert server.received == 1
+
+    asyncio.run(run())
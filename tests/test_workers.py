@@ -0,0 +1,102 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import bench
+import database
+import reminders
+import storage
+import timezones
+
+WORKERS = 4
+REMINDERS = 120
+# usuarios de los recordatorios con lease de un worker caído
+EXPIRED_ONCE, EXPIRED_DAILY, LIVE_LEASE = 1, 2, 3
+
+
+def _seed(path: str):
+    database.init_db()
+    due = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=5)
+    remind_at, epoch = timezones.wall_time(due), int(due.timestamp())
+    now = time.time()
+    rows = [(str(1000 + i), remind_at, None, epoch, None, None) for i in range(REMINDERS)]
+    rows += [
+        # el worker "muerto" los reclamó y su lease venció: se recuperan sin enviarse
+        (str(EXPIRED_ONCE), remind_at, None, epoch, "muerto", now - 1),
+        (str(EXPIRED_DAILY), remind_at, "daily", epoch, "muerto", now - 1),
+        # lease vigente: nadie más lo toca
+        (str(LIVE_LEASE), remind_at, None, epoch, "muerto", now + 3600),
+    ]
+    with database._write() as conn:
+        conn.executemany("INSERT INTO reminders (user_id, task_id, remind_at, sent, repeat, remind_at_epoch, tz, "
+                         "claimed_by, claim_expires) VALUES (?, NULL, ?, 0, ?, ?, 'UTC', ?, ?)", rows)
+    database.close_db()
+    return epoch
+
+
+async def _dispatch_all(worker_id: str):
+    async with bench.Harness() as h:
+        chats = []
+        real = h.request.do_request
+
+        async def do_request(url, method, request_data=None, **kwargs):
+            if url.endswith("/sendMessage"):
+                chats.append(int(request_data.parameters["chat_id"]))
+            return await real(url, method, request_data, **kwargs)
+
+        h.request.do_request = do_request
+        # ventana pequeña: cada worker relee la DB varias veces mientras los demás reclaman
+        dispatcher = reminders.ReminderDispatcher(h.app, window=20, worker_id=worker_id)
+        dispatcher.sender = bench.fast_sender(h.app)
+        for _ in range(100):
+            await dispatcher.refresh()
+            when = dispatcher._peek()
+            if when is None or when > time.time():
+                break
+            await dispatcher.dispatch_due()
+        await dispatcher.release()
+    return chats
+
+
+def _worker(path: str, worker_id: str, barrier, results):
+    database.set_db_path(path)
+    storage.configure(storage.SQLiteStorage())
+    barrier.wait()
+    try:
+        results.put((worker_id, asyncio.run(_dispatch_all(worker_id))))
+    finally:
+        storage.close()
+
+
+def test_workers_share_one_db_and_send_each_reminder_at_most_once(db_path):
+    epoch = _seed(db_path)
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(WORKERS)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(db_path, f"w{i}", barrier, results)) for i in range(WORKERS)]
+    for p in procs:
+        p.start()
+    sent = dict(results.get(timeout=120) for _ in procs)
+    for p in procs:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+
+    delivered = Counter(chat for chats in sent.values() for chat in chats)
+    assert set(delivered) == {1000 + i for i in range(REMINDERS)}
+    assert max(delivered.values()) == 1
+
+    conn = sqlite3.connect(db_path)
+    try:
+        state = {int(r[0]): r[1:] for r in conn.execute(
+            "SELECT user_id, sent, remind_at_epoch, claimed_by FROM reminders")}
+    finally:
+        conn.close()
+    assert all(state[1000 + i][0] == 1 for i in range(REMINDERS))
+    # recuperados tras vencer el lease: el único se cierra y el diario avanza, sin reenviarse
+    assert state[EXPIRED_ONCE][0] == 1
+    sent_flag, next_epoch, claimed_by = state[EXPIRED_DAILY]
+    assert sent_flag == 0 and next_epoch > epoch and claimed_by is None
+    assert state[LIVE_LEASE] == (0, epoch, "muerto")
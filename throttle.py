@@ -0,0 +1,83 @@
+import logging
+import os
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+
+import metrics
+from ratelimit import BucketMap
+
+logger = logging.getLogger(__name__)
+
+# updates por segundo que acepta cada usuario (ráfagas de hasta USER_BURST)
+USER_RATE = 1.0
+USER_BURST = 10
+# usuarios con bucket en memoria; al superarlo se expulsa el menos reciente
+MAX_TRACKED_USERS = 100_000
+# con más updates esperando en app.update_queue se descartan los nuevos
+SHED_QUEUE_DEPTH = 1000
+# como mucho un aviso cada NOTICE_INTERVAL segundos por usuario
+NOTICE_INTERVAL = 30.0
+
+THROTTLED_TEXT = "Vas demasiado rápido 🙂 Espera unos segundos antes de enviar más comandos."
+SHED_TEXT = "El bot está muy ocupado en este momento. Inténtalo de nuevo en unos segundos."
+
+
+class Throttle:
+    """
+    Middleware delante de todos los handlers (TypeHandler en el grupo -1):
+    token bucket por usuario y descarte de carga según la profundidad de
+    app.update_queue. Los updates rechazados cortan la cadena con
+    ApplicationHandlerStop; el usuario recibe como mucho un aviso cada
+    NOTICE_INTERVAL segundos. La memoria está acotada por `max_users`.
+    """
+
+    def __init__(self, rate: float = USER_RATE, burst: float = USER_BURST, max_users: int = MAX_TRACKED_USERS,
+                 shed_depth: int = SHED_QUEUE_DEPTH, notice_interval: float = NOTICE_INTERVAL):
+        self.shed_depth = shed_depth
+        self.buckets = BucketMap(rate, burst, max_users)
+        # solo guarda a quienes ya fueron frenados
+        self.notices = BucketMap(1.0 / notice_interval, 1, max_users)
+
+    async def __call__(self, update: Update, context):
+        user = update.effective_user
+        chat = update.effective_chat
+        key = user.id if user is not None else (chat.id if chat is not None else None)
+        if key is None:
+            return
+        if self.shed_depth and context.application.update_queue.qsize() > self.shed_depth:
+            metrics.REGISTRY.inc("throttled_updates_total", reason="shed")
+            await self._reject(update, key, SHED_TEXT)
+        if self.buckets.take(key) > 0:
+            metrics.REGISTRY.inc("throttled_updates_total", reason="rate")
+            await self._reject(update, key, THROTTLED_TEXT)
+
+    async def _reject(self, update: Update, key: int, text: str):
+        if self.notices.take(key) == 0:
+            try:
+                if update.callback_query is not None:
+                    await update.callback_query.answer(text)
+                elif update.effective_message is not None:
+                    await update.effective_message.reply_text(text)
+            except Exception:
+                logger.debug("No se pudo avisar al usuario %s", key, exc_info=True)
+        raise ApplicationHandlerStop
+
+
+def install(app, throttle: Optional[Throttle] = None) -> Throttle:
+    """
+    Registra el middleware. Sin `throttle` se configura desde el entorno:
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_MAX_USERS y SHED_QUEUE_DEPTH (0 = sin descarte).
+    """
+    if throttle is None:
+        throttle = Throttle(
+            rate=float(os.getenv("THROTTLE_RATE", USER_RATE)),
+            burst=float(os.getenv("THROTTLE_BURST", USER_BURST)),
+            max_users=int(os.getenv("THROTTLE_MAX_USERS", MAX_TRACKED_USERS)),
+            shed_depth=int(os.getenv("SHED_QUEUE_DEPTH", SHED_QUEUE_DEPTH)),
+        )
+    app.add_handler(TypeHandler(Update, throttle), group=-1)
+    metrics.REGISTRY.gauge("throttle_tracked_users", lambda: len(throttle.buckets))
+    metrics.REGISTRY.gauge("update_queue_depth", lambda: app.update_queue.qsize())
+    return throttle
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import re
+from functools import lru_cache
+from typing import Optional
+import zoneinfo
+
+# zona por defecto de los usuarios sin /timezone (y de los recordatorios antiguos)
+DEFAULT_TZ = "UTC"
+_CLOCK_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+@lru_cache(maxsize=None)
+def _zone_names():
+    return {name.lower(): name for name in zoneinfo.available_timezones()}
+
+
+@lru_cache(maxsize=512)
+def get_zone(name: Optional[str]) -> zoneinfo.ZoneInfo:
+    return zoneinfo.ZoneInfo(name or DEFAULT_TZ)
+
+
+def normalize_zone(name: str) -> Optional[str]:
+    """Nombre IANA canónico ('europe/madrid' -> 'Europe/Madrid'); None si no existe."""
+    name = name.strip()
+    if name.upper() in ("UTC", "Z"):
+        return "UTC"
+    canonical = _zone_names().get(name.lower())
+    if canonical is None:
+        return None
+    try:
+        get_zone(canonical)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+    return canonical
+
+
+def localize(value: str, tz: Optional[str] = None) -> datetime:
+    """
+    Interpreta una fecha ISO ('YYYY-MM-DD HH:MM' o con 'T') como hora local de `tz`.
+    Si trae offset explícito se respeta y solo se convierte a la zona.
+    """
+    dt = datetime.fromisoformat(value.strip().replace(" ", "T"))
+    zone = get_zone(tz)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=zone)
+    return dt.astimezone(zone)
+
+
+def to_epoch(value: str, tz: Optional[str] = None) -> int:
+    """Instante UTC (segundos) de una fecha local de `tz`."""
+    return int(localize(value, tz).timestamp())
+
+
+def wall_time(dt: datetime) -> str:
+    """Hora local sin offset, tal como se guarda en reminders.remind_at."""
+    return dt.replace(tzinfo=None).isoformat(timespec="minutes" if dt.second == 0 else "seconds")
+
+
+def format_epoch(epoch: float, tz: Optional[str] = None) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).astimezone(get_zone(tz)).strftime("%Y-%m-%d %H:%M")
+
+
+def parse_clock(token: str) -> Optional[str]:
+    """Normaliza una hora 'H:MM' a 'HH:MM'; None si no es válida."""
+    m = _CLOCK_RE.match(token.strip())
+    return f"{int(m.group(1)):02d}:{m.group(2)}" if m else None
+
+
+def next_daily(clock: str, tz: Optional[str], now: float) -> int:
+    """Próximo instante (epoch) posterior a `now` en que son las `clock` ('HH:MM') en `tz`."""
+    zone = get_zone(tz)
+    hour, minute = (int(x) for x in clock.split(":"))
+    local = datetime.fromtimestamp(now, tz=timezone.utc).astimezone(zone)
+    candidate = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate.timestamp() <= now:
+        # día siguiente en hora local (mantiene la hora aunque cambie el horario de verano)
+        candidate = (candidate.replace(tzinfo=None) + timedelta(days=1)).replace(tzinfo=zone)
+    return int(candidate.timestamp())
@@ -0,0 +1,258 @@
+"""
+Exportación e importación de tareas y recordatorios (JSONL o CSV).
+
+Todo va en streaming: la exportación recorre los generadores del backend
+(fetchmany en SQLite) y escribe registro a registro; la importación lee el
+archivo línea a línea y escribe en transacciones de IMPORT_CHUNK filas.
+Las tareas van antes que los recordatorios: al importar reciben ids nuevos
+y los task_id de los recordatorios se traducen. Lo usan /export, /import y admin.py.
+"""
+import bisect
+import csv
+import io
+import json
+from array import array
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, Optional, TextIO, Tuple
+
+import recurrence
+import timezones
+
+FORMATS = ("jsonl", "csv")
+# filas por fetchmany al exportar
+EXPORT_CHUNK = 1000
+# filas por transacción al importar: lotes grandes reducen commits y segmentos FTS,
+# pero cada lote retiene el lock de escritura (~0.2 s con 5000 tareas)
+IMPORT_CHUNK = 5000
+# mismo máximo que un mensaje de Telegram
+MAX_TEXT = 4096
+
+# columnas del CSV: una fila por registro, los campos que no aplican van vacíos
+CSV_FIELDS = ["type", "user_id", "id", "text", "done", "created_at", "task_id", "remind_at", "tz", "repeat", "sent"]
+
+
+def detect_format(filename: Optional[str]) -> str:
+    return "csv" if (filename or "").lower().endswith(".csv") else "jsonl"
+
+
+# ---------- exportación ----------
+def records(st, user_id: Optional[str] = None, chunk: int = EXPORT_CHUNK) -> Iterator[Dict[str, Any]]:
+    """Registros de `user_id` (o de todos con None): primero las tareas, luego los recordatorios."""
+    for t in st.iter_tasks(user_id, chunk):
+        yield {"type": "task", "user_id": t["user_id"], "id": t["id"], "text": t["text"], "done": t["done"],
+               "created_at": t["created_at"]}
+    for r in st.iter_reminders(user_id, chunk):
+        # remind_at_epoch no se exporta: se recalcula de remind_at y tz al importar
+        yield {"type": "reminder", "user_id": r["user_id"], "id": r["id"], "task_id": r["task_id"],
+               "remind_at": r["remind_at"], "tz": r["tz"], "repeat": r["repeat"], "sent": r["sent"]}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def dump(recs, fh: TextIO, fmt: str) -> int:
+    """Escribe los registros en `fh`; devuelve cuántos se escribieron."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(fh, CSV_FIELDS)
+        writer.writeheader()
+        for rec in recs:
+            writer.writerow({k: _csv_value(v) for k, v in rec.items()})
+            count += 1
+    else:
+        for rec in recs:
+            fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def export(st, out: BinaryIO, fmt: str, user_id: Optional[str] = None) -> int:
+    """Exporta a un archivo binario (UTF-8) sin cargar el resultado en memoria."""
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    try:
+        return dump(records(st, user_id), text, fmt)
+    finally:
+        text.flush()
+        text.detach()
+
+
+# ---------- importación ----------
+def _read_jsonl(fh: TextIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    for lineno, line in enumerate(fh, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            raise ValueError(f"línea {lineno}: JSON inválido") from None
+        if not isinstance(rec, dict):
+            raise ValueError(f"línea {lineno}: se esperaba un objeto")
+        yield lineno, rec
+
+
+def _read_csv(fh: TextIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    reader = csv.DictReader(fh)
+    for rec in reader:
+        # en CSV los vacíos son nulos
+        yield reader.line_num, {k: (v if v != "" else None) for k, v in rec.items() if k is not None}
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "si", "sí")
+    return bool(value)
+
+
+def _int(value) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError
+    return int(value)
+
+
+def _parse(lineno: int, rec: Dict[str, Any]):
+    """Valida un registro; devuelve (tipo, user_id, id original, fila para el backend sin user_id)."""
+    kind = rec.get("type")
+    user_id = rec.get("user_id")
+    try:
+        old_id = _int(rec.get("id"))
+        if kind == "task":
+            text = rec.get("text")
+            if not isinstance(text, str) or not text.strip() or len(text) > MAX_TEXT:
+                raise ValueError
+            created_at = rec.get("created_at") or datetime.utcnow().isoformat(timespec="minutes")
+            datetime.fromisoformat(created_at)
+            return kind, user_id, old_id, (text, _flag(rec.get("done")), created_at)
+        if kind == "reminder":
+            tz = timezones.normalize_zone(rec.get("tz") or timezones.DEFAULT_TZ)
+            repeat = rec.get("repeat")
+            if repeat is not None:
+                repeat = recurrence.parse_rule(repeat)
+            if tz is None or (rec.get("repeat") and repeat is None):
+                raise ValueError
+            remind_at = rec["remind_at"].strip()
+            epoch = timezones.to_epoch(remind_at, tz)
+            return kind, user_id, old_id, (_int(rec.get("task_id")), remind_at, epoch, repeat, tz,
+                                           _flag(rec.get("sent")))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ValueError(f"línea {lineno}: {kind or 'registro'} inválido") from None
+    raise ValueError(f"línea {lineno}: tipo desconocido {kind!r}")
+
+
+def _parsed(fh: TextIO, fmt: str):
+    reader = _read_csv if fmt == "csv" else _read_jsonl
+    try:
+        for lineno, rec in reader(fh):
+            yield (lineno, *_parse(lineno, rec))
+    except UnicodeDecodeError:
+        raise ValueError("el archivo no está en UTF-8") from None
+
+
+class _IdMap:
+    """
+    id original -> id nuevo de las tareas importadas. Las exportaciones vienen en
+    orden de id, así que se guardan en dos arrays ordenados (16 bytes por tarea);
+    los que llegan desordenados van a un dict aparte.
+    """
+
+    def __init__(self):
+        self._old = array("q")
+        self._new = array("q")
+        self._unordered: Dict[int, int] = {}
+
+    def add(self, old: Optional[int], new: int):
+        if old is None:
+            return
+        if not self._old or old > self._old[-1]:
+            self._old.append(old)
+            self._new.append(new)
+        else:
+            self._unordered[old] = new
+
+    def get(self, old: Optional[int]) -> Optional[int]:
+        if old is None:
+            return None
+        if old in self._unordered:
+            return self._unordered[old]
+        i = bisect.bisect_left(self._old, old)
+        return self._new[i] if i < len(self._old) and self._old[i] == old else None
+
+
+def _text(inp: BinaryIO) -> TextIO:
+    # utf-8-sig: acepta CSV guardados con BOM por hojas de cálculo
+    return io.TextIOWrapper(inp, encoding="utf-8-sig", newline="")
+
+
+def check(inp: BinaryIO, fmt: str) -> Dict[str, int]:
+    """
+    Primera pasada: valida todo el archivo sin escribir nada y cuenta tareas,
+    recordatorios y recordatorios pendientes. Lanza ValueError con la línea del error.
+    """
+    counts = {"tasks": 0, "reminders": 0, "pending_reminders": 0}
+    text = _text(inp)
+    try:
+        for _, kind, _, _, row in _parsed(text, fmt):
+            if kind == "task":
+                counts["tasks"] += 1
+            else:
+                counts["reminders"] += 1
+                counts["pending_reminders"] += not row[-1]
+    finally:
+        text.detach()
+    return counts
+
+
+def load(st, inp: BinaryIO, fmt: str, user_id: Optional[str] = None, chunk: int = IMPORT_CHUNK) -> Dict[str, int]:
+    """
+    Importa el archivo en transacciones de `chunk` filas. Con `user_id` todo se
+    asigna a ese usuario; si no, cada registro debe traer el suyo. Los lotes ya
+    escritos quedan aunque una línea posterior sea inválida (usar check() antes).
+    """
+    counts = {"tasks": 0, "reminders": 0}
+    ids = _IdMap()
+    tasks, task_ids, rems = [], [], []
+
+    def flush_tasks():
+        for old, new in zip(task_ids, st.import_tasks(tasks)):
+            ids.add(old, new)
+        counts["tasks"] += len(tasks)
+        tasks.clear()
+        task_ids.clear()
+
+    def flush_reminders():
+        counts["reminders"] += st.import_reminders(rems)
+        rems.clear()
+
+    text = _text(inp)
+    try:
+        for lineno, kind, owner, old_id, row in _parsed(text, fmt):
+            owner = user_id or owner
+            if owner is None:
+                raise ValueError(f"línea {lineno}: falta user_id")
+            owner = str(owner)
+            if kind == "task":
+                tasks.append((owner, *row))
+                task_ids.append(old_id)
+                if len(tasks) >= chunk:
+                    flush_tasks()
+            else:
+                if tasks:
+                    # los recordatorios necesitan los ids nuevos de sus tareas
+                    flush_tasks()
+                rems.append((owner, ids.get(row[0]), *row[1:]))
+                if len(rems) >= chunk:
+                    flush_reminders()
+        if tasks:
+            flush_tasks()
+        if rems:
+            flush_reminders()
+    finally:
+        text.detach()
+    return counts
@@ -0,0 +1,174 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from typing import Dict, Optional
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# límite del cuerpo de una petición (los updates de Telegram son pequeños)
+MAX_BODY_BYTES = 1024 * 1024
+# tiempo máximo esperando a que terminen las peticiones en curso al apagar
+DRAIN_TIMEOUT = 25
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class WebhookServer:
+    """
+    Servidor HTTP/1.1 mínimo sobre asyncio (sin dependencias extra):
+    POST <path> encola el update en app.update_queue, GET /healthz indica que
+    el proceso vive y GET /readyz que está aceptando updates.
+    """
+
+    def __init__(self, app, path: str = "/telegram", secret_token: Optional[str] = None):
+        self.app = app
+        self.path = path
+        self.secret_token = secret_token
+        self.ready = False
+        self.received = 0
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy: set = set()
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.ready = True
+        logger.info("Webhook escuchando en http://%s:%d%s", host, port, self.path)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self, timeout: float = DRAIN_TIMEOUT):
+        """Deja de aceptar conexiones y espera a las peticiones en curso."""
+        self.ready = False
+        if self._server is not None:
+            self._server.close()
+        # conexiones keep-alive ociosas se cortan (cerrar el socket en vez de cancelar
+        # la tarea evita el traceback de asyncio); las que procesan una petición terminan
+        for task, writer in list(self._connections.items()):
+            if task not in self._busy:
+                writer.close()
+        if self._busy:
+            await asyncio.wait(list(self._busy), timeout=timeout)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            keep_alive = True
+            while keep_alive and self.ready:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                self._busy.add(task)
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = int(headers.get("content-length", "0") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self._route(method, target.split("?")[0], headers, body)
+                await self._respond(writer, status, payload, keep_alive)
+                self._busy.discard(task)
+        except Exception:
+            logger.exception("Error atendiendo petición del webhook")
+        finally:
+            self._connections.pop(task, None)
+            self._busy.discard(task)
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes):
+        if path == "/healthz":
+            return 200, b"ok"
+        if path == "/readyz":
+            ok = self.ready and self.app.running
+            return (200, b"ready") if ok else (503, b"not ready")
+        if path != self.path:
+            return 404, b""
+        if method != "POST":
+            return 405, b""
+        if not self.ready:
+            return 503, b""
+        if self.secret_token is not None:
+            given = headers.get("x-telegram-bot-api-secret-token", "")
+            if not hmac.compare_digest(given, self.secret_token):
+                return 403, b""
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except Exception:
+            return 400, b""
+        await self.app.update_queue.put(update)
+        self.received += 1
+        return 200, b""
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: bytes = b"", keep_alive: bool = True):
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Content-Type: text/plain\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+
+async def serve(app, host: str, port: int, path: str = "/telegram", webhook_url: Optional[str] = None,
+                secret_token: Optional[str] = None, stop_event: Optional[asyncio.Event] = None):
+    """
+    Ciclo de vida completo en modo webhook (equivalente a app.run_polling):
+    initialize -> post_init -> servidor -> start ... SIGTERM ... drenar -> stop -> shutdown.
+    Con `webhook_url` y sin `secret_token` se genera un secreto aleatorio.
+    """
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    if webhook_url and secret_token is None:
+        # sin secreto cualquiera que alcance el puerto podría inyectar updates de cualquier usuario
+        secret_token = secrets.token_urlsafe(32)
+        logger.info("WEBHOOK_SECRET no definido: se usa un secreto aleatorio para este proceso")
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    if webhook_url:
+        await app.bot.set_webhook(url=webhook_url.rstrip("/") + path, secret_token=secret_token,
+                                  allowed_updates=Update.ALL_TYPES)
+    server = WebhookServer(app, path, secret_token)
+    await server.start(host, port)
+    await app.start()
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Apagando: drenando peticiones y updates en curso...")
+        # 1) no aceptar más updates, 2) procesar los ya encolados, 3) escrituras pendientes (post_shutdown)
+        await server.close()
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+    return server